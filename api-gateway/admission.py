@@ -0,0 +1,240 @@
+import asyncio
+import os
+import time
+from collections import OrderedDict, deque
+
+
+class RateLimited(Exception):
+    def __init__(self, route: str, retry_after: float):
+        super().__init__(f"Rate limit exceeded for '{route}'")
+        self.retry_after = retry_after
+
+
+class Overloaded(Exception):
+    def __init__(self, service_name: str, reason: str):
+        super().__init__(f"'{service_name}' is overloaded: {reason}")
+        self.service_name = service_name
+
+
+class TokenBucket:
+    __slots__ = ("tokens", "updated")
+
+    def __init__(self, burst: float):
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def take(self, rate: float, burst: float) -> float:
+        """Take one token; return 0 on success or the seconds until one is available."""
+        now = time.monotonic()
+        self.tokens = min(burst, self.tokens + (now - self.updated) * rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / rate
+
+
+class RateLimiter:
+    """Token buckets per client and route.
+
+    The rate (requests per second) and burst come from GATEWAY_RATE_LIMIT and
+    GATEWAY_RATE_BURST, with per-route overrides such as
+    GATEWAY_RATE_LIMIT_ADD_TASK. A rate of 0 disables limiting for the route.
+    Idle buckets are evicted least recently used past `max_clients`.
+    """
+
+    def __init__(self, max_clients: int | None = None):
+        self._max_clients = max_clients or int(os.getenv("GATEWAY_RATE_MAX_CLIENTS", 100000))
+        self._buckets: OrderedDict[tuple, TokenBucket] = OrderedDict()
+        self._routes: dict[str, tuple[float, float]] = {}
+        self.allowed = 0
+        self.limited = 0
+
+    def _limits(self, route: str) -> tuple[float, float]:
+        limits = self._routes.get(route)
+        if limits is None:
+            suffix = route.upper().replace("-", "_")
+            rate = float(os.getenv(f"GATEWAY_RATE_LIMIT_{suffix}", os.getenv("GATEWAY_RATE_LIMIT", 20)))
+            burst = float(os.getenv(f"GATEWAY_RATE_BURST_{suffix}", os.getenv("GATEWAY_RATE_BURST", rate * 2)))
+            limits = self._routes[route] = (rate, max(burst, 1.0))
+        return limits
+
+    def check(self, client: str, route: str):
+        rate, burst = self._limits(route)
+        if rate <= 0:
+            return
+        key = (client, route)
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = TokenBucket(burst)
+            if len(self._buckets) > self._max_clients:
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end(key)
+        wait = bucket.take(rate, burst)
+        if wait:
+            self.limited += 1
+            raise RateLimited(route, wait)
+        self.allowed += 1
+
+    def stats(self) -> dict:
+        return {"clients": len(self._buckets), "allowed": self.allowed, "limited": self.limited}
+
+
+class Permit:
+    __slots__ = ("_limit", "_started", "_observed", "_released")
+
+    def __init__(self, limit):
+        self._limit = limit
+        self._started = time.monotonic()
+        self._observed = False
+        self._released = False
+
+    def observe(self, failed: bool = False):
+        """Feed this request's latency (or failure) into the adaptive limit."""
+        if self._limit is not None and not self._observed:
+            self._observed = True
+            self._limit.observe(time.monotonic() - self._started, failed)
+
+    def release(self):
+        if self._limit is not None and not self._released:
+            self._released = True
+            self._limit.release()
+
+
+class AdaptiveLimit:
+    """AIMD concurrency limit with a bounded wait queue for one upstream.
+
+    The limit grows by one per window of successful responses and is cut
+    multiplicatively when a request fails or when short-term latency rises
+    above `tolerance` times the long-term average plus `slack`, which is
+    what queueing inside the upstream looks like. Requests over the
+    limit wait in a FIFO queue of at most `queue_size` for `queue_timeout`
+    seconds and are shed once the queue is full or the wait runs out.
+    """
+
+    def __init__(self, service_name: str, initial: int, minimum: int, maximum: int, queue_size: int,
+                 queue_timeout: float, tolerance: float, slack: float, backoff: float = 0.9):
+        self._service_name = service_name
+        self.limit = float(max(minimum, min(initial, maximum)))
+        self._minimum = minimum
+        self._maximum = maximum
+        self._queue_size = queue_size
+        self._queue_timeout = queue_timeout
+        self._tolerance = tolerance
+        self._slack = slack
+        self._backoff = backoff
+        self._recent = None
+        self._baseline = None
+        self._last_decrease = 0.0
+        self._waiters: deque[asyncio.Future] = deque()
+        self.in_flight = 0
+        self.admitted = 0
+        self.queued = 0
+        self.shed = 0
+        self.decreases = 0
+
+    async def acquire(self) -> Permit:
+        if not self._waiters and self.in_flight < int(self.limit):
+            self.in_flight += 1
+            self.admitted += 1
+            return Permit(self)
+        if len(self._waiters) >= self._queue_size:
+            self.shed += 1
+            raise Overloaded(self._service_name, "queue full")
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        self.queued += 1
+        try:
+            await asyncio.wait_for(waiter, self._queue_timeout)
+        except BaseException as e:
+            if waiter.done() and not waiter.cancelled():
+                # A slot was handed over just as we gave up; pass it on.
+                self.release()
+            elif waiter in self._waiters:
+                self._waiters.remove(waiter)
+            if isinstance(e, TimeoutError):
+                self.shed += 1
+                raise Overloaded(self._service_name, "queue timeout") from None
+            raise
+        self.admitted += 1
+        return Permit(self)
+
+    def release(self):
+        self.in_flight -= 1
+        self._wake()
+
+    def _wake(self):
+        while self._waiters and self.in_flight < int(self.limit):
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                self.in_flight += 1
+                waiter.set_result(None)
+
+    def observe(self, latency: float, failed: bool):
+        now = time.monotonic()
+        if not failed:
+            if self._baseline is None:
+                self._recent = self._baseline = latency
+            else:
+                self._recent += 0.2 * (latency - self._recent)
+                self._baseline += 0.01 * (latency - self._baseline)
+        threshold = (self._baseline or latency) * self._tolerance + self._slack
+        if failed or self._recent > threshold:
+            # At most one cut per round trip, so one slow burst does not collapse the limit.
+            if now - self._last_decrease >= threshold:
+                self.limit = max(self._minimum, self.limit * self._backoff)
+                self._last_decrease = now
+                self.decreases += 1
+            return
+        self.limit = min(self._maximum, self.limit + 1 / self.limit)
+        self._wake()
+
+    def stats(self) -> dict:
+        return {
+            "limit": round(self.limit, 2),
+            "in_flight": self.in_flight,
+            "waiting": len(self._waiters),
+            "admitted": self.admitted,
+            "queued": self.queued,
+            "shed": self.shed,
+            "decreases": self.decreases,
+            "latency_ms": round(self._recent * 1000, 1) if self._recent is not None else None,
+            "baseline_ms": round(self._baseline * 1000, 1) if self._baseline is not None else None,
+        }
+
+
+class Admission:
+    """Concurrency limits for each upstream, built from its resilience policy."""
+
+    def __init__(self, policies):
+        self._policies = policies
+        self._limits: dict[str, AdaptiveLimit | None] = {}
+
+    def _limit(self, service_name: str) -> AdaptiveLimit | None:
+        if service_name not in self._limits:
+            policy = self._policies.policy(service_name)
+            limit = None
+            if policy.concurrency_max > 0:
+                limit = AdaptiveLimit(
+                    service_name,
+                    initial=policy.concurrency_initial,
+                    minimum=policy.concurrency_min,
+                    maximum=policy.concurrency_max,
+                    queue_size=policy.queue_size,
+                    queue_timeout=policy.queue_timeout,
+                    tolerance=policy.latency_tolerance,
+                    slack=policy.latency_slack,
+                )
+            self._limits[service_name] = limit
+        return self._limits[service_name]
+
+    async def acquire(self, service_name: str) -> Permit:
+        limit = self._limit(service_name)
+        if limit is None:
+            return Permit(None)
+        return await limit.acquire()
+
+    def stats(self) -> dict:
+        return {name: limit.stats() for name, limit in self._limits.items() if limit is not None}
@@ -0,0 +1,150 @@
+import logging
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+
+
+class _InstanceState:
+    __slots__ = ("outstanding", "failures", "ejections", "ejected_until")
+
+    def __init__(self):
+        self.outstanding = 0
+        self.failures = 0
+        self.ejections = 0
+        self.ejected_until = 0.0
+
+
+def round_robin(balancer, service_name, candidates):
+    counter = balancer._rr_counters.get(service_name, 0)
+    balancer._rr_counters[service_name] = counter + 1
+    return candidates[counter % len(candidates)]
+
+
+def least_outstanding(balancer, service_name, candidates):
+    fewest = min(balancer._state(c).outstanding for c in candidates)
+    return random.choice([c for c in candidates if balancer._state(c).outstanding == fewest])
+
+
+def power_of_two(balancer, service_name, candidates):
+    if len(candidates) == 1:
+        return candidates[0]
+    first, second = random.sample(candidates, 2)
+    if balancer._state(second).outstanding < balancer._state(first).outstanding:
+        return second
+    return first
+
+
+STRATEGIES = {
+    "round_robin": round_robin,
+    "least_outstanding": least_outstanding,
+    "p2c": power_of_two,
+}
+
+
+class Lease:
+    def __init__(self, instance):
+        self.instance = instance
+        self.url = instance.url
+        self.failed = False
+
+    def record(self, status_code: int):
+        self.failed = status_code >= 500
+
+
+class LoadBalancer:
+    """Picks a healthy instance of a service from the registry and tracks passive health.
+
+    Instances that fail `consecutive_failures` times in a row (5xx responses or
+    transport errors) are ejected for `base_ejection_seconds` times the number of
+    ejections so far, never ejecting more than `max_ejection_percent` of a service.
+    """
+
+    def __init__(self, registry, strategy: str | None = None, consecutive_failures: int | None = None,
+                 base_ejection_seconds: float | None = None, max_ejection_percent: int | None = None,
+                 failure_exceptions=(OSError,)):
+        strategy = strategy or os.getenv("LB_STRATEGY", "round_robin")
+        if strategy not in STRATEGIES:
+            raise ValueError(f"Unknown load balancing strategy '{strategy}'")
+        self.strategy = strategy
+        self._choose = STRATEGIES[strategy]
+        self._registry = registry
+        self._consecutive_failures = consecutive_failures or int(os.getenv("LB_CONSECUTIVE_FAILURES", 5))
+        self._base_ejection = base_ejection_seconds or float(os.getenv("LB_BASE_EJECTION_SECONDS", 30))
+        self._max_ejection_percent = max_ejection_percent or int(os.getenv("LB_MAX_EJECTION_PERCENT", 50))
+        self._failure_exceptions = failure_exceptions
+        self._states: dict[str, _InstanceState] = {}
+        self._rr_counters: dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def _state(self, instance) -> _InstanceState:
+        state = self._states.get(instance.url)
+        if state is None:
+            state = self._states[instance.url] = _InstanceState()
+        return state
+
+    def acquire(self, service_name: str):
+        instances = self._registry.instances(service_name)
+        if not instances:
+            return None
+        now = time.monotonic()
+        with self._lock:
+            candidates = [i for i in instances if self._state(i).ejected_until <= now]
+            if not candidates:
+                candidates = list(instances)
+            instance = self._choose(self, service_name, candidates)
+            self._state(instance).outstanding += 1
+        return instance
+
+    def release(self, service_name: str, instance, failed: bool = False):
+        with self._lock:
+            state = self._state(instance)
+            state.outstanding -= 1
+            if not failed:
+                state.failures = 0
+                if state.ejections and state.ejected_until <= time.monotonic():
+                    state.ejections -= 1
+                return
+            state.failures += 1
+            if state.failures < self._consecutive_failures:
+                return
+            state.failures = 0
+            instances = self._registry.instances(service_name)
+            now = time.monotonic()
+            ejected = len([i for i in instances if self._state(i).ejected_until > now])
+            if ejected and (ejected + 1) * 100 > self._max_ejection_percent * len(instances):
+                return
+            state.ejections += 1
+            state.ejected_until = now + self._base_ejection * state.ejections
+        logging.warning(f"Ejected {instance.url} from '{service_name}' for {self._base_ejection * state.ejections:.0f}s")
+
+    @contextmanager
+    def lease(self, service_name: str):
+        instance = self.acquire(service_name)
+        if instance is None:
+            yield None
+            return
+        lease = Lease(instance)
+        try:
+            yield lease
+        except self._failure_exceptions:
+            lease.failed = True
+            raise
+        finally:
+            self.release(service_name, instance, lease.failed)
+
+    def snapshot(self) -> dict:
+        now = time.monotonic()
+        with self._lock:
+            return {
+                "strategy": self.strategy,
+                "instances": {
+                    url: {
+                        "outstanding": state.outstanding,
+                        "ejections": state.ejections,
+                        "ejected_for": max(0.0, round(state.ejected_until - now, 1)),
+                    }
+                    for url, state in self._states.items()
+                },
+            }
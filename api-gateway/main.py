@@ -1,60 +1,350 @@
-from fastapi import FastAPI, Request, HTTPException, Form
+from fastapi import Depends, FastAPI, Request, HTTPException, Form, Query, WebSocket
+import asyncio
+import hashlib
+import heapq
 import httpx
+import math
 import os
-from fastapi.responses import HTMLResponse, RedirectResponse
+import uuid
+import websockets
+from fastapi.responses import HTMLResponse, RedirectResponse, Response, StreamingResponse
+from starlette.background import BackgroundTask
 from fastapi.templating import Jinja2Templates
 from consul import Consul
 import logging
-from typing import Optional
+from typing import Any, Dict, List, Optional
 from typing import Union
+from pydantic import BaseModel
+from discovery import ServiceRegistry
+from upstreams import UpstreamClients, release_on_close
+from resilience import IDEMPOTENT_METHODS, CircuitOpenError, Resilience
+from admission import Admission, Overloaded, Permit, RateLimited, RateLimiter
+from balancer import LoadBalancer
+from response_cache import CachedResponse, ResponseCache
+from markupsafe import Markup
+from rendering import RenderCache, RenderedPage, etag_matches
+from singleflight import SingleFlight
+from telemetry import Gauge, Telemetry, TelemetryMiddleware
+
+telemetry = Telemetry(os.getenv("SERVICE_NAME", "api-gateway"))
 
 app = FastAPI()
+app.add_middleware(TelemetryMiddleware, telemetry=telemetry)
 
 CONSUL_HOST = os.getenv("CONSUL_HOST", "localhost")
 consul_client = Consul(host=CONSUL_HOST)
 
 templates = Jinja2Templates(directory="templates")
-
-def discover_service(service_name: str) -> str | None:
+# Templates are compiled once; only check their files for changes when developing.
+templates.env.auto_reload = os.getenv("TEMPLATES_AUTO_RELOAD", "false").lower() == "true"
+
+SERVICE_LOOKUP = {
+    "tasks": "task-service",
+    "projects": "project-service",
+    "communication": "communication-service",
+    "reports": "report-service",
+    "schedule": "schedule-service",
+}
+UPSTREAM_SERVICES = list(SERVICE_LOOKUP.values())
+
+TRUST_FORWARDED = os.getenv("GATEWAY_TRUST_FORWARDED", "false").lower() == "true"
+
+DASHBOARD_PAGE_SIZE = int(os.getenv("DASHBOARD_PAGE_SIZE", 50))
+DASHBOARD_PROJECT_LIMIT = int(os.getenv("DASHBOARD_PROJECT_LIMIT", 100))
+DASHBOARD_DEADLINE = float(os.getenv("DASHBOARD_DEADLINE_SECONDS", 2.0))
+# Render from report-service's denormalized view, falling back to task and project services.
+DASHBOARD_READ_MODEL = os.getenv("DASHBOARD_READ_MODEL", "true").lower() == "true"
+# Rendered pages outlive a template change only within one process.
+DASHBOARD_EPOCH = uuid.uuid4().hex[:8]
+
+SEARCH_SERVICES = ("task-service", "project-service", "communication-service")
+SEARCH_DEADLINE = float(os.getenv("SEARCH_DEADLINE_SECONDS", 2.0))
+# Each service ranks at most this many hits, which bounds offset + limit.
+MAX_SEARCH_RESULTS = 100
+
+# Upstream paths that block until there is news (GET /tasks/changes?wait=30). They get one
+# attempt under this timeout, outside the service's retries, hedging, breaker and concurrency limit.
+LONG_POLL_PATHS = {"changes"}
+LONG_POLL_TIMEOUT = float(os.getenv("GATEWAY_LONG_POLL_TIMEOUT_SECONDS", 45.0))
+
+# Larger request bodies are streamed to the upstream once instead of being held for retries.
+MAX_REPLAY_BODY = int(os.getenv("GATEWAY_MAX_REPLAY_BODY_BYTES", 1024 * 1024))
+
+MAX_BATCH_REQUESTS = int(os.getenv("GATEWAY_MAX_BATCH_REQUESTS", 20))
+BATCH_METHODS = {"GET", "POST", "PUT", "PATCH", "DELETE"}
+BATCH_RESPONSE_HEADERS = {"content-type", "etag", "cache-control", "retry-after", "x-next-cursor"}
+
+HOP_BY_HOP_HEADERS = {
+    "connection",
+    "keep-alive",
+    "proxy-authenticate",
+    "proxy-authorization",
+    "proxy-connection",
+    "te",
+    "trailer",
+    "trailers",
+    "transfer-encoding",
+    "upgrade",
+}
+
+def filter_headers(headers):
+    headers = list(headers)
+    connection_tokens = {
+        token.strip().lower()
+        for k, v in headers if k.lower() == "connection"
+        for token in v.split(",")
+    }
+    return [
+        (k, v) for k, v in headers
+        if k.lower() not in HOP_BY_HOP_HEADERS and k.lower() not in connection_tokens
+    ]
+
+registry = ServiceRegistry(consul_client)
+resilience = Resilience(UPSTREAM_SERVICES)
+upstreams = UpstreamClients(UPSTREAM_SERVICES, resilience)
+admission = Admission(resilience)
+rate_limiter = RateLimiter()
+balancer = LoadBalancer(registry, failure_exceptions=(httpx.TransportError,))
+response_cache = ResponseCache()
+inflight = SingleFlight()
+page_cache = RenderCache(int(os.getenv("DASHBOARD_PAGE_CACHE_ENTRIES", 64)))
+fragment_cache = RenderCache(int(os.getenv("DASHBOARD_FRAGMENT_CACHE_ENTRIES", 256)))
+telemetry.add_metric(Gauge(
+    "discovery_instances",
+    "Healthy instances known for each upstream.",
+    ("service",),
+    collect=lambda: {(name,): len(urls) for name, urls in registry.snapshot().items()},
+))
+
+async def call_upstream(service_name: str, method: str, path: str, **kwargs) -> httpx.Response:
+    if method != "GET":
+        return await send_upstream(service_name, method, path, **kwargs)
+    # Identical GETs that are in flight at the same time share one upstream call.
+    headers = tuple(sorted((k.lower(), v) for k, v in (kwargs.get("headers") or {}).items()))
+    key = (service_name, httpx.URL(path, params=kwargs.get("params")).raw_path, headers)
+    return await inflight.do(key, lambda: send_upstream(service_name, method, path, **kwargs))
+
+async def send_upstream(service_name: str, method: str, path: str, **kwargs) -> httpx.Response:
+    client = upstreams.get(service_name)
+    cache_key = ("call", service_name, httpx.URL(path, params=kwargs.get("params")).raw_path)
+    cached = None
+    # Leave revalidation to the caller when it sends its own If-None-Match.
+    if method == "GET" and not any(k.lower() == "if-none-match" for k in kwargs.get("headers") or {}):
+        cached = response_cache.get(cache_key)
+
+    async def attempt():
+        permit = await admission.acquire(service_name)
+        try:
+            with balancer.lease(service_name) as lease:
+                if lease is None:
+                    raise Exception(f"Service '{service_name}' unavailable")
+                upstream_request = client.build_request(method, f"{lease.url}{path}", **kwargs)
+                if cached is not None:
+                    upstream_request.headers["If-None-Match"] = cached.etag
+                with telemetry.outbound(service_name, method) as call:
+                    upstream_request.headers.update(call.headers)
+                    response = await client.send(upstream_request)
+                    call.status = response.status_code
+                lease.record(response.status_code)
+        except httpx.TransportError:
+            permit.observe(failed=True)
+            raise
+        finally:
+            permit.release()
+        permit.observe(failed=response.status_code >= 500)
+        return response
+
+    response = await resilience.call(service_name, method, attempt)
+    if cached is not None and response.status_code == 304:
+        response_cache.hits += 1
+        return httpx.Response(cached.status_code, headers=cached.headers, content=cached.body, request=response.request)
+    if method == "GET":
+        response_cache.misses += 1
+        if response.status_code == 200 and "etag" in response.headers:
+            headers = [
+                (k, v) for k, v in response.headers.multi_items()
+                if k.lower() not in ("content-encoding", "content-length", "transfer-encoding")
+            ]
+            response_cache.put(cache_key, CachedResponse(response.headers["etag"], 200, headers, response.content))
+    return response
+
+@app.on_event("startup")
+def startup_event():
+    registry.start(UPSTREAM_SERVICES)
+    upstreams.start()
+    telemetry.start()
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    registry.stop()
+    await upstreams.close()
+    telemetry.stop()
+
+def client_key(request: Request) -> str:
+    if TRUST_FORWARDED:
+        forwarded = request.headers.get("x-forwarded-for")
+        if forwarded:
+            return forwarded.split(",")[0].strip()
+    return request.client.host if request.client else "unknown"
+
+def check_rate(request: Request, route: str):
+    try:
+        rate_limiter.check(client_key(request), route)
+    except RateLimited as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(math.ceil(e.retry_after))})
+
+def rate_limited(route: str):
+    def dependency(request: Request):
+        check_rate(request, route)
+    return Depends(dependency)
+
+async def fetch_concurrently(*calls, timeout: float = DASHBOARD_DEADLINE):
+    """Run upstream calls side by side under one deadline; cancel the rest if one fails."""
+    tasks = [asyncio.ensure_future(call) for call in calls]
+    try:
+        async with asyncio.timeout(timeout):
+            return await asyncio.gather(*tasks)
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+def render_fragment(key, template_name: str, **context) -> Markup:
+    html = fragment_cache.get(key) if key else None
+    if html is None:
+        with telemetry.timed(telemetry.renders, template_name):
+            html = Markup(templates.get_template(template_name).render(**context))
+        if key:
+            fragment_cache.put(key, html)
+    return html
+
+class DashboardSource:
+    """The data one dashboard render needs, identified by the upstream versions it came from.
+
+    `key` is the page cache key (None when an upstream sent no ETag) and
+    `load()` parses the responses into (tasks, projects, next_cursor) only
+    when the page actually has to be rendered.
+    """
+
+    def __init__(self, key, projects_key, tasks_key, load):
+        self.key = key
+        self.projects_key = projects_key
+        self.tasks_key = tasks_key
+        self.load = load
+
+async def dashboard_from_read_model(cursor) -> DashboardSource | None:
+    params = {"limit": DASHBOARD_PAGE_SIZE, "project_limit": DASHBOARD_PROJECT_LIMIT}
+    if cursor:
+        params["cursor"] = cursor
     try:
-        services = consul_client.agent.services()
-        for service in services.values():
-            if service["Service"] == service_name:
-                address = service["Address"]
-                port = service["Port"]
-                return f"http://{address}:{port}"
+        response, = await fetch_concurrently(call_upstream("report-service", "GET", "/report/dashboard", params=params))
     except Exception as e:
-        logging.error(f"Error discovering service '{service_name}': {e}")
-    return None
+        logging.warning(f"Dashboard read model unavailable, using task and project services: {e!r}")
+        return None
+    if response.status_code != 200:
+        return None
+
+    def load():
+        view = response.json()
+        return view["tasks"], view["projects"], view["next_cursor"]
+
+    etag = response.headers.get("etag")
+    if not etag:
+        return DashboardSource(None, None, None, load)
+    return DashboardSource(("read_model", etag, cursor), ("read_model", etag), ("read_model", etag, cursor), load)
+
+async def dashboard_from_services(cursor) -> DashboardSource:
+    task_params = {"limit": DASHBOARD_PAGE_SIZE}
+    if cursor:
+        task_params["cursor"] = cursor
+    task_response, project_response = await fetch_concurrently(
+        call_upstream("task-service", "GET", "/tasks", params=task_params),
+        call_upstream("project-service", "GET", "/projects", params={"limit": DASHBOARD_PROJECT_LIMIT}),
+    )
+
+    def load():
+        return task_response.json(), project_response.json(), task_response.headers.get("X-Next-Cursor")
+
+    task_etag = task_response.headers.get("etag")
+    project_etag = project_response.headers.get("etag")
+    if task_response.status_code != 200 or project_response.status_code != 200 or not (task_etag and project_etag):
+        return DashboardSource(None, None, None, load)
+    return DashboardSource(
+        (task_etag, project_etag, cursor),
+        ("projects", project_etag),
+        ("tasks", task_etag, project_etag, cursor),
+        load,
+    )
+
+def render_dashboard(source: DashboardSource, cursor) -> RenderedPage:
+    tasks, projects, next_cursor = source.load()
+    project_names = {project["id"]: project["name"] for project in projects}
+    # The read model names every task's project, including ones past the project limit.
+    project_names.update((t["project_id"], t["project_name"]) for t in tasks if t.get("project_name"))
+
+    projects_html = render_fragment(source.projects_key, "_projects.html", projects=projects)
+    tasks_html = render_fragment(
+        source.tasks_key,
+        "_tasks.html",
+        tasks=tasks,
+        projects=projects,
+        project_names=project_names,
+    )
+    with telemetry.timed(telemetry.renders, "index.html"):
+        html = templates.get_template("index.html").render(
+            projects_html=projects_html,
+            tasks_html=tasks_html,
+            projects=projects,
+            cursor=cursor,
+            next_cursor=next_cursor,
+        )
+    digest = hashlib.sha1(repr(source.key).encode()).hexdigest()[:16]
+    return RenderedPage(f'W/"dashboard.{DASHBOARD_EPOCH}.{digest}"', html)
 
 @app.get("/", response_class=HTMLResponse)
-async def homepage(request: Request):
+async def homepage(request: Request, cursor: Optional[str] = None):
     try:
-        async with httpx.AsyncClient() as client:
-            task_url = discover_service("task-service")
-            project_url = discover_service("project-service")
-            if not task_url or not project_url:
-                raise Exception("One or more services unavailable")
-
-            task_response = await client.get(f"{task_url}/tasks")
-            project_response = await client.get(f"{project_url}/projects")
-            tasks = task_response.json()
-            projects = project_response.json()
+        source = None
+        if DASHBOARD_READ_MODEL:
+            source = await dashboard_from_read_model(cursor)
+        if source is None:
+            source = await dashboard_from_services(cursor)
+    except TimeoutError:
+        error = f"Dashboard data did not arrive within {DASHBOARD_DEADLINE}s"
+        return templates.TemplateResponse("error.html", {"request": request, "error": error})
     except Exception as e:
         return templates.TemplateResponse("error.html", {"request": request, "error": str(e)})
 
-    return templates.TemplateResponse("index.html", {
-        "request": request,
-        "tasks": tasks,
-        "projects": projects
-    })
-
-@app.post("/add-task", response_class=RedirectResponse)
+    # Upstream ETags identify the data, so a page rendered from the same versions is reused as is.
+    page_key = source.key
+    page = page_cache.get(page_key) if page_key else None
+    if page is None:
+        try:
+            page = render_dashboard(source, cursor)
+        except Exception as e:
+            return templates.TemplateResponse("error.html", {"request": request, "error": str(e)})
+        if page_key:
+            page_cache.put(page_key, page)
+
+    headers = {"Vary": "Accept-Encoding", "Cache-Control": "no-cache"}
+    if page_key:
+        headers["ETag"] = page.etag
+        if etag_matches(request.headers.get("if-none-match"), page.etag):
+            return Response(status_code=304, headers=headers)
+    encoding, body = page.encode(request.headers.get("accept-encoding"))
+    if encoding:
+        headers["Content-Encoding"] = encoding
+    return HTMLResponse(body, headers=headers)
+
+def form_project_id(value) -> Optional[int]:
+    # The "Unassigned" option posts an empty value; never hand a blank string to int().
+    if value is None or (isinstance(value, str) and not value.strip()):
+        return None
+    return int(value)
+
+@app.post("/add-task", response_class=RedirectResponse, dependencies=[rate_limited("add-task")])
 async def add_task(title: str = Form(...), description: str = Form(""),project_id: Union[int, None, str] = Form(None)):
-    if project_id == "":
-        project_id = None
-    else:
-        project_id = int(project_id)
+    project_id = form_project_id(project_id)
 
     task_data = {
         "title": title,
@@ -63,61 +353,41 @@ async def add_task(title: str = Form(...), description: str = Form(""),project_i
         "is_done": False
     }
     try:
-        task_url = discover_service("task-service")
-        if not task_url:
-            raise Exception("Task service unavailable")
-
-        async with httpx.AsyncClient() as client:
-            await client.post(f"{task_url}/tasks", json=task_data)
+        await call_upstream("task-service", "POST", "/tasks", json=task_data)
     except Exception as e:
         print("Error:", e)
     return RedirectResponse("/", status_code=302)
 
-@app.post("/add-project", response_class=RedirectResponse)
+@app.post("/add-project", response_class=RedirectResponse, dependencies=[rate_limited("add-project")])
 async def add_project(name: str = Form(...), description: str = Form("")):
     project_data = {
         "name": name,
         "description": description,
     }
     try:
-        project_url = discover_service("project-service")
-        if not project_url:
-            raise Exception("Project service unavailable")
-
-        async with httpx.AsyncClient() as client:
-            await client.post(f"{project_url}/projects", json=project_data)
+        await call_upstream("project-service", "POST", "/projects", json=project_data)
     except Exception as e:
         print("Error:", e)
     return RedirectResponse("/", status_code=302)
 
-@app.post("/delete-task/{task_id}", response_class=RedirectResponse)
+@app.post("/delete-task/{task_id}", response_class=RedirectResponse, dependencies=[rate_limited("delete-task")])
 async def delete_task(task_id: int):
     try:
-        task_url = discover_service("task-service")
-        if not task_url:
-            raise Exception("Task service unavailable")
-
-        async with httpx.AsyncClient() as client:
-            await client.delete(f"{task_url}/tasks/{task_id}")
+        await call_upstream("task-service", "DELETE", f"/tasks/{task_id}")
     except Exception as e:
         print("Delete task error:", e)
     return RedirectResponse("/", status_code=302)
 
 
-@app.post("/delete-project/{project_id}", response_class=RedirectResponse)
+@app.post("/delete-project/{project_id}", response_class=RedirectResponse, dependencies=[rate_limited("delete-project")])
 async def delete_project(project_id: int, with_tasks: bool = Form(False)):
     try:
-        project_url = discover_service("project-service")
-        if not project_url:
-            raise Exception("Project service unavailable")
-
-        async with httpx.AsyncClient() as client:
-            endpoint = (
-                f"{project_url}/projects/{project_id}/with-tasks"
-                if with_tasks else
-                f"{project_url}/projects/{project_id}"
-            )
-            await client.delete(endpoint)
+        endpoint = (
+            f"/projects/{project_id}/with-tasks"
+            if with_tasks else
+            f"/projects/{project_id}"
+        )
+        await call_upstream("project-service", "DELETE", endpoint)
     except Exception as e:
         print(f"Delete project error: {e}")
         raise HTTPException(status_code=400, detail=str(e))
@@ -125,28 +395,21 @@ async def delete_project(project_id: int, with_tasks: bool = Form(False)):
 @app.get("/edit-task/{task_id}", response_class=HTMLResponse)
 async def edit_task_form(request: Request, task_id: int):
     try:
-        task_url = discover_service("task-service")
-        project_url = discover_service("project-service")
-        if not task_url or not project_url:
-            raise Exception("Required services unavailable")
-
-        async with httpx.AsyncClient() as client:
-            task_res = await client.get(f"{task_url}/tasks/{task_id}")
-            projects_res = await client.get(f"{project_url}/projects")
-            task = task_res.json()
-            projects = projects_res.json()
+        task_res, projects_res = await fetch_concurrently(
+            call_upstream("task-service", "GET", f"/tasks/{task_id}"),
+            call_upstream("project-service", "GET", "/projects"),
+        )
+        task = task_res.json()
+        projects = projects_res.json()
     except Exception as e:
         return templates.TemplateResponse("error.html", {"request": request, "error": str(e)})
 
     return templates.TemplateResponse("edit_task.html", {"request": request, "task": task, "projects": projects})
 
-@app.post("/edit-task/{task_id}", response_class=RedirectResponse)
+@app.post("/edit-task/{task_id}", response_class=RedirectResponse, dependencies=[rate_limited("edit-task")])
 async def edit_task(task_id: int, title: str = Form(...), description: str = Form(""),project_id: Union[int, None, str] = Form(None)
 , is_done: bool = Form(False)):
-    if project_id == "":
-        project_id = None
-    else:
-        project_id = int(project_id)
+    project_id = form_project_id(project_id)
 
     task_data = {
         "title": title,
@@ -155,12 +418,7 @@ async def edit_task(task_id: int, title: str = Form(...), description: str = For
         "is_done": is_done
     }
     try:
-        task_url = discover_service("task-service")
-        if not task_url:
-            raise Exception("Task service unavailable")
-
-        async with httpx.AsyncClient() as client:
-            await client.put(f"{task_url}/tasks/{task_id}", json=task_data)
+        await call_upstream("task-service", "PUT", f"/tasks/{task_id}", json=task_data)
     except Exception as e:
         print("Edit task error:", e)
     return RedirectResponse("/", status_code=302)
@@ -168,58 +426,341 @@ async def edit_task(task_id: int, title: str = Form(...), description: str = For
 @app.get("/edit-project/{project_id}", response_class=HTMLResponse)
 async def edit_project_form(request: Request, project_id: int):
     try:
-        project_url = discover_service("project-service")
-        if not project_url:
-            raise Exception("Project service unavailable")
-
-        async with httpx.AsyncClient() as client:
-            res = await client.get(f"{project_url}/projects/{project_id}")
-            project = res.json()
+        res = await call_upstream("project-service", "GET", f"/projects/{project_id}")
+        project = res.json()
     except Exception as e:
         return templates.TemplateResponse("error.html", {"request": request, "error": str(e)})
 
     return templates.TemplateResponse("edit_project.html", {"request": request, "project": project})
 
-@app.post("/edit-project/{project_id}", response_class=RedirectResponse)
+@app.post("/edit-project/{project_id}", response_class=RedirectResponse, dependencies=[rate_limited("edit-project")])
 async def edit_project(project_id: int, name: str = Form(...), description: str = Form("")):
     project_data = {
         "name": name,
         "description": description
     }
     try:
-        project_url = discover_service("project-service")
-        if not project_url:
-            raise Exception("Project service unavailable")
-
-        async with httpx.AsyncClient() as client:
-            await client.put(f"{project_url}/projects/{project_id}", json=project_data)
+        await call_upstream("project-service", "PUT", f"/projects/{project_id}", json=project_data)
     except Exception as e:
         print("Edit project error:", e)
     return RedirectResponse("/", status_code=302)
 
-@app.api_route("/{service}/{path:path}", methods=["GET", "POST", "PUT", "DELETE"])
-async def gateway(service: str, path: str, request: Request):
-    service_lookup = {
-        "tasks": "task-service",
-        "projects": "project-service"
+@app.get("/metrics/pools")
+def pool_metrics():
+    return upstreams.stats()
+
+@app.get("/metrics/balancer")
+def balancer_metrics():
+    return balancer.snapshot()
+
+@app.get("/metrics/resilience")
+def resilience_metrics():
+    return resilience.snapshot()
+
+@app.get("/metrics/admission")
+def admission_metrics():
+    return {"concurrency": admission.stats(), "rate_limit": rate_limiter.stats()}
+
+@app.get("/metrics/cache")
+def cache_metrics():
+    return {
+        **response_cache.stats(),
+        "dashboard_pages": page_cache.stats(),
+        "dashboard_fragments": fragment_cache.stats(),
+        "singleflight": inflight.stats(),
     }
 
-    if service not in service_lookup:
-        raise HTTPException(status_code=404, detail="Service not found")
+async def search_service(service_name: str, params: dict) -> dict:
+    response = await call_upstream(service_name, "GET", "/search", params=params)
+    response.raise_for_status()
+    return response.json()
 
-    service_url = discover_service(service_lookup[service])
-    if not service_url:
-        raise HTTPException(status_code=503, detail="Service unavailable")
+@app.get("/search", dependencies=[rate_limited("search")])
+async def search(
+    q: str = Query(..., min_length=1, max_length=200),
+    limit: int = Query(20, ge=1, le=MAX_SEARCH_RESULTS),
+    offset: int = Query(0, ge=0),
+):
+    if offset + limit > MAX_SEARCH_RESULTS:
+        raise HTTPException(status_code=400, detail=f"offset + limit must not exceed {MAX_SEARCH_RESULTS}")
+
+    # Every service returns its own top offset + limit; the merged page is a slice of their union.
+    params = {"q": q, "limit": offset + limit}
+    calls = {name: asyncio.ensure_future(search_service(name, params)) for name in SEARCH_SERVICES}
+    done, pending = await asyncio.wait(calls.values(), timeout=SEARCH_DEADLINE)
+    for call in pending:
+        call.cancel()
+
+    ranked = []
+    has_more = False
+    failed = {}
+    for name, call in calls.items():
+        if call in pending:
+            failed[name] = f"no answer within {SEARCH_DEADLINE}s"
+        elif call.exception() is not None:
+            failed[name] = str(call.exception()) or type(call.exception()).__name__
+        else:
+            ranked.append(call.result()["results"])
+            has_more = has_more or call.result()["has_more"]
+    for name, error in failed.items():
+        logging.warning(f"Search skipped {name}: {error}")
+
+    merged = list(heapq.merge(*ranked, key=lambda hit: -hit["score"]))
+    has_more = has_more or len(merged) > offset + limit
+    return {
+        "results": merged[offset:offset + limit],
+        "next_offset": offset + limit if has_more else None,
+        "failed": sorted(failed),
+    }
 
-    url = f"{service_url}/{path}"
-    method = request.method
-    headers = dict(request.headers)
-    body = await request.body()
+class SubRequest(BaseModel):
+    id: Optional[str] = None
+    method: str = "GET"
+    path: str
+    headers: Dict[str, str] = {}
+    body: Optional[Any] = None
+
+class BatchRequest(BaseModel):
+    requests: List[SubRequest]
+
+def batch_error(item: SubRequest, status_code: int, detail: str) -> dict:
+    return {"id": item.id, "status": status_code, "headers": {}, "body": {"detail": detail}}
+
+async def run_sub_request(request: Request, item: SubRequest) -> dict:
+    service, _, path = item.path.lstrip("/").partition("/")
+    method = item.method.upper()
+    if service not in SERVICE_LOOKUP:
+        return batch_error(item, 404, "Service not found")
+    if method not in BATCH_METHODS:
+        return batch_error(item, 405, "Method not allowed")
+    # A batch answers once every sub-request has, so a long poll would hold back the rest.
+    if method == "GET" and path.partition("?")[0] in LONG_POLL_PATHS:
+        return batch_error(item, 400, "Long polls cannot be batched")
+
+    kwargs = {}
+    headers = [(k, v) for k, v in filter_headers(item.headers.items()) if k.lower() not in ("host", "content-length")]
+    if headers:
+        kwargs["headers"] = dict(headers)
+    if item.body is not None:
+        kwargs["json"] = item.body
+    try:
+        rate_limiter.check(client_key(request), service)
+        response = await call_upstream(SERVICE_LOOKUP[service], method, f"/{path}", **kwargs)
+    except RateLimited as e:
+        return batch_error(item, 429, str(e))
+    except (CircuitOpenError, Overloaded) as e:
+        return batch_error(item, 503, str(e))
+    except TimeoutError:
+        return batch_error(item, 504, "Gateway timeout")
+    except httpx.RequestError as e:
+        logging.error(f"Batch request to '{service}' failed: {e}")
+        return batch_error(item, 502, "Bad gateway")
+    except Exception as e:
+        return batch_error(item, 502, str(e))
+
+    body = None
+    if response.content:
+        try:
+            body = response.json()
+        except ValueError:
+            body = response.text
+    return {
+        "id": item.id,
+        "status": response.status_code,
+        "headers": {k: v for k, v in response.headers.items() if k in BATCH_RESPONSE_HEADERS},
+        "body": body,
+    }
 
-    async with httpx.AsyncClient() as client:
-        response = await client.request(method, url, headers=headers, content=body)
+@app.post("/batch")
+async def batch(batch: BatchRequest, request: Request):
+    if len(batch.requests) > MAX_BATCH_REQUESTS:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_BATCH_REQUESTS} requests per batch")
+    responses = await asyncio.gather(*[run_sub_request(request, item) for item in batch.requests])
+    return {"responses": responses}
+
+@app.websocket("/communication/chat/ws")
+async def chat_socket_proxy(websocket: WebSocket):
+    instance = balancer.acquire("communication-service")
+    if instance is None:
+        await websocket.close(code=1013)
+        return
+
+    url = f"ws{instance.url[len('http'):]}/chat/ws"
+    if websocket.url.query:
+        url = f"{url}?{websocket.url.query}"
+    failed = False
+    accepted = False
+    try:
+        async with websockets.connect(url, open_timeout=5) as upstream:
+            await websocket.accept()
+            accepted = True
+
+            async def client_to_upstream():
+                while True:
+                    message = await websocket.receive()
+                    if message["type"] == "websocket.disconnect":
+                        return
+                    # An empty text frame is "", which is falsy but still the frame's payload.
+                    text = message.get("text")
+                    await upstream.send(text if text is not None else message.get("bytes"))
+
+            async def upstream_to_client():
+                try:
+                    async for data in upstream:
+                        if isinstance(data, str):
+                            await websocket.send_text(data)
+                        else:
+                            await websocket.send_bytes(data)
+                except websockets.ConnectionClosed:
+                    pass
+                await websocket.close(code=upstream.close_code or 1000)
+
+            tasks = [asyncio.create_task(client_to_upstream()), asyncio.create_task(upstream_to_client())]
+            await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+    except (OSError, asyncio.TimeoutError, websockets.InvalidHandshake) as e:
+        failed = True
+        logging.error(f"WebSocket proxy to communication-service failed: {e}")
+        if not accepted:
+            await websocket.close(code=1011)
+    finally:
+        balancer.release("communication-service", instance, failed=failed)
+
+@app.api_route("/{service}/{path:path}", methods=["GET", "POST", "PUT", "PATCH", "DELETE"])
+async def gateway(service: str, path: str, request: Request):
+    if service not in SERVICE_LOOKUP:
+        raise HTTPException(status_code=404, detail="Service not found")
 
-    return response.json()
+    check_rate(request, service)
+    service_name = SERVICE_LOOKUP[service]
+    headers = filter_headers(request.headers.items())
+    # The upstream call carries the gateway's own trace context instead of the client's.
+    headers = [(k, v) for k, v in headers if k.lower() not in ("host", "traceparent")]
+    has_body = "content-length" in request.headers or "transfer-encoding" in request.headers
+
+    # GETs are revalidated against the cached copy unless the client is revalidating its own.
+    cache_key = ("proxy", service_name, f"/{path}?{request.url.query}")
+    cached = None
+    if request.method == "GET" and "if-none-match" not in request.headers:
+        cached = response_cache.get(cache_key)
+        if cached is not None:
+            headers.append(("if-none-match", cached.etag))
+
+    # Idempotent requests may be retried or hedged, so a small body is buffered to replay it.
+    # Anything else, including bodies of unknown length, is streamed through in one attempt.
+    content = None
+    replayable = True
+    if has_body:
+        content_length = request.headers.get("content-length")
+        if (
+            request.method in IDEMPOTENT_METHODS
+            and content_length is not None
+            and content_length.isdigit()
+            and int(content_length) <= MAX_REPLAY_BODY
+        ):
+            content = await request.body()
+        else:
+            content = request.stream()
+            replayable = False
+
+    client = upstreams.get(service_name)
+    long_poll = request.method == "GET" and path in LONG_POLL_PATHS
+    timeout = LONG_POLL_TIMEOUT if long_poll else httpx.USE_CLIENT_DEFAULT
+
+    async def attempt():
+        # A parked long poll would read as a slow request and shrink the adaptive limit.
+        permit = Permit(None) if long_poll else await admission.acquire(service_name)
+        instance = balancer.acquire(service_name)
+        if instance is None:
+            permit.release()
+            raise HTTPException(status_code=503, detail="Service unavailable")
+        with telemetry.outbound(service_name, request.method) as call:
+            upstream_request = client.build_request(
+                request.method,
+                f"{instance.url}/{path}",
+                params=request.query_params.multi_items(),
+                headers=headers + list(call.headers.items()),
+                content=content,
+                timeout=timeout,
+            )
+            try:
+                response = await client.send(upstream_request, stream=True)
+            except BaseException as e:
+                failed = isinstance(e, httpx.TransportError)
+                if failed:
+                    permit.observe(failed=True)
+                permit.release()
+                balancer.release(service_name, instance, failed=failed)
+                raise
+            call.status = response.status_code
+        permit.observe(failed=response.status_code >= 500)
+
+        def release():
+            permit.release()
+            balancer.release(service_name, instance, failed=response.status_code >= 500)
+
+        release_on_close(response, release)
+        return response
+
+    async def discard(response: httpx.Response):
+        await response.aclose()
+
+    try:
+        if long_poll:
+            response = await resilience.call_unguarded(service_name, attempt, LONG_POLL_TIMEOUT)
+        else:
+            response = await resilience.call(service_name, request.method, attempt, discard, replayable=replayable)
+    except CircuitOpenError as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(math.ceil(e.retry_after))})
+    except Overloaded as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
+    except TimeoutError:
+        logging.error(f"Upstream request to '{service}' exceeded its deadline")
+        raise HTTPException(status_code=504, detail="Gateway timeout")
+    except httpx.RequestError as e:
+        logging.error(f"Upstream request to '{service}' failed: {e}")
+        raise HTTPException(status_code=502, detail="Bad gateway")
+
+    response_headers = filter_headers(response.headers.multi_items())
+    if cached is not None and response.status_code == 304:
+        await response.aclose()
+        response_cache.hits += 1
+        return cached_response(cached)
+    if request.method == "GET":
+        response_cache.misses += 1
+        content_length = response.headers.get("content-length")
+        if (
+            response.status_code == 200
+            and "etag" in response.headers
+            and content_length is not None
+            and int(content_length) <= response_cache.max_body
+        ):
+            try:
+                body = b"".join([chunk async for chunk in response.aiter_raw()])
+            finally:
+                await response.aclose()
+            entry = CachedResponse(response.headers["etag"], 200, response_headers, body)
+            response_cache.put(cache_key, entry)
+            return cached_response(entry)
+
+    proxied = StreamingResponse(
+        response.aiter_raw(),
+        status_code=response.status_code,
+        background=BackgroundTask(response.aclose),
+    )
+    proxied.raw_headers = [(k.encode("latin-1"), v.encode("latin-1")) for k, v in response_headers]
+    return proxied
+
+def cached_response(entry: CachedResponse) -> Response:
+    response = Response(content=entry.body, status_code=entry.status_code)
+    response.raw_headers = [(k.encode("latin-1"), v.encode("latin-1")) for k, v in entry.headers]
+    return response
+
+@app.get("/metrics", include_in_schema=False)
+def prometheus_metrics():
+    return Response(telemetry.render(), media_type="text/plain; version=0.0.4")
 
 @app.get("/health")
 def health_check():
@@ -0,0 +1,109 @@
+import gzip
+import os
+from collections import OrderedDict
+
+
+def _load_brotli():
+    try:
+        import brotli
+    except ImportError:
+        return None
+    return brotli
+
+
+brotli = _load_brotli()
+
+COMPRESS_MIN_BYTES = int(os.getenv("GATEWAY_COMPRESS_MIN_BYTES", 1024))
+GZIP_LEVEL = int(os.getenv("GATEWAY_GZIP_LEVEL", 6))
+BROTLI_QUALITY = int(os.getenv("GATEWAY_BROTLI_QUALITY", 5))
+
+
+def accepted_encodings(accept_encoding: str | None) -> dict[str, float]:
+    accepted = {}
+    for part in (accept_encoding or "").split(","):
+        coding, _, params = part.strip().partition(";")
+        if not coding:
+            continue
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        accepted[coding.strip().lower()] = quality
+    return accepted
+
+
+class RenderedPage:
+    """Rendered HTML shared by every request with the same upstream versions.
+
+    Compressed variants are built the first time a client asks for them and
+    kept with the page, so a cache hit costs no rendering and no compression.
+    """
+
+    __slots__ = ("etag", "body", "_encoded")
+
+    def __init__(self, etag: str, html: str):
+        self.etag = etag
+        self.body = html.encode()
+        self._encoded: dict[str, bytes] = {}
+
+    def encode(self, accept_encoding: str | None) -> tuple[str | None, bytes]:
+        if len(self.body) < COMPRESS_MIN_BYTES:
+            return None, self.body
+        accepted = accepted_encodings(accept_encoding)
+        for coding in ("br", "gzip"):
+            if coding == "br" and brotli is None:
+                continue
+            if accepted.get(coding, accepted.get("*", 0.0)) > 0:
+                return coding, self._compressed(coding)
+        return None, self.body
+
+    def _compressed(self, coding: str) -> bytes:
+        body = self._encoded.get(coding)
+        if body is None:
+            if coding == "br":
+                body = brotli.compress(self.body, quality=BROTLI_QUALITY)
+            else:
+                body = gzip.compress(self.body, compresslevel=GZIP_LEVEL, mtime=0)
+            self._encoded[coding] = body
+        return body
+
+
+class RenderCache:
+    """Small LRU of rendered pages and fragments keyed by upstream ETags."""
+
+    def __init__(self, max_entries: int):
+        self._max_entries = max_entries
+        self._entries: OrderedDict = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        value = self._entries.get(key)
+        if value is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def put(self, key, value):
+        self._entries[key] = value
+        self._entries.move_to_end(key)
+        while len(self._entries) > self._max_entries:
+            self._entries.popitem(last=False)
+
+    def stats(self) -> dict:
+        return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+
+def etag_matches(if_none_match: str | None, etag: str) -> bool:
+    """Weak comparison, as If-None-Match requires."""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    etag = etag.removeprefix("W/")
+    return etag in (tag.strip().removeprefix("W/") for tag in if_none_match.split(","))
@@ -0,0 +1,378 @@
+import asyncio
+import logging
+import random
+import time
+from collections import deque
+
+import httpx
+
+from upstreams import upstream_setting
+
+IDEMPOTENT_METHODS = {"GET", "HEAD", "OPTIONS", "PUT", "DELETE"}
+RETRYABLE_STATUSES = {502, 503, 504}
+RETRYABLE_EXCEPTIONS = (httpx.TransportError,)
+
+# Per-service defaults; any field can be overridden as UPSTREAM_<SERVICE>_<SETTING>,
+# e.g. UPSTREAM_TASK_SERVICE_RETRIES=3, or for every service as UPSTREAM_<SETTING>.
+DEFAULT_POLICIES = {
+    "task-service": {"hedge": True},
+    "project-service": {"hedge": True},
+    # Chat streams hold a request open for their whole lifetime, so they bypass the concurrency limit.
+    "communication-service": {"read_timeout": 60.0, "concurrency_max": 0},
+}
+
+
+class Policy:
+    FIELDS = {
+        "connect_timeout": 2.0,
+        "read_timeout": 10.0,
+        "write_timeout": 10.0,
+        "pool_timeout": 5.0,
+        "deadline": 15.0,
+        "retries": 2,
+        "backoff_base": 0.05,
+        "backoff_max": 1.0,
+        "breaker_failures": 5,
+        "breaker_open_seconds": 10.0,
+        "breaker_half_open_calls": 1,
+        "hedge": False,
+        "hedge_delay": 0.1,
+        "hedge_quantile": 0.95,
+        "concurrency_initial": 20,
+        "concurrency_min": 2,
+        "concurrency_max": 100,
+        "queue_size": 100,
+        "queue_timeout": 1.0,
+        "latency_tolerance": 2.0,
+        "latency_slack": 0.05,
+    }
+
+    def __init__(self, **settings):
+        for name, default in self.FIELDS.items():
+            setattr(self, name, settings.get(name, default))
+
+    @classmethod
+    def for_service(cls, service_name: str) -> "Policy":
+        defaults = {**cls.FIELDS, **DEFAULT_POLICIES.get(service_name, {})}
+        return cls(**{
+            name: upstream_setting(service_name, name.upper(), default)
+            for name, default in defaults.items()
+        })
+
+    @property
+    def timeout(self) -> httpx.Timeout:
+        return httpx.Timeout(
+            connect=self.connect_timeout,
+            read=self.read_timeout,
+            write=self.write_timeout,
+            pool=self.pool_timeout,
+        )
+
+    def backoff(self, attempt: int) -> float:
+        """Full jitter: a random delay up to the exponential bound."""
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+
+    def as_dict(self) -> dict:
+        return {name: getattr(self, name) for name in self.FIELDS}
+
+
+class CircuitOpenError(Exception):
+    def __init__(self, service_name: str, retry_after: float):
+        super().__init__(f"Circuit for '{service_name}' is open")
+        self.service_name = service_name
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """Closed, open and half-open breaker for one upstream service.
+
+    After `failures` consecutive failed attempts the breaker opens and calls
+    fail fast for `open_seconds`. It then lets `half_open_calls` trial calls
+    through: one success closes it, one failure opens it again.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, service_name: str, failures: int, open_seconds: float, half_open_calls: int):
+        self._service_name = service_name
+        self._threshold = failures
+        self._open_seconds = open_seconds
+        self._half_open_calls = half_open_calls
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.trials = 0
+        self.rejected = 0
+        self.opened = 0
+
+    def allow(self) -> bool:
+        if self.state == self.OPEN:
+            if time.monotonic() - self.opened_at < self._open_seconds:
+                self.rejected += 1
+                return False
+            self.state = self.HALF_OPEN
+            self.trials = 0
+        if self.state == self.HALF_OPEN:
+            if self.trials >= self._half_open_calls:
+                self.rejected += 1
+                return False
+            self.trials += 1
+        return True
+
+    def record(self, success: bool):
+        if self.state == self.HALF_OPEN:
+            self.trials = max(0, self.trials - 1)
+        if success:
+            self.failures = 0
+            if self.state != self.CLOSED:
+                logging.info(f"Circuit for '{self._service_name}' closed")
+            self.state = self.CLOSED
+            return
+        self.failures += 1
+        if self.state == self.HALF_OPEN or self.failures >= self._threshold:
+            self._open()
+
+    def abandon(self):
+        """The attempt ended without telling us anything about the upstream."""
+        if self.state == self.HALF_OPEN:
+            self.trials = max(0, self.trials - 1)
+
+    def _open(self):
+        if self.state != self.OPEN:
+            self.opened += 1
+            logging.warning(f"Circuit for '{self._service_name}' opened after {self.failures} failures")
+        self.state = self.OPEN
+        self.opened_at = time.monotonic()
+
+    def retry_after(self) -> float:
+        return max(0.0, self._open_seconds - (time.monotonic() - self.opened_at))
+
+    def snapshot(self) -> dict:
+        return {
+            "state": self.state,
+            "consecutive_failures": self.failures,
+            "open_for": round(self.retry_after(), 1) if self.state == self.OPEN else 0.0,
+            "opened": self.opened,
+            "rejected": self.rejected,
+        }
+
+
+class LatencyWindow:
+    """Recent successful attempt latencies; quantiles are recomputed every few samples."""
+
+    def __init__(self, size: int = 256, refresh_every: int = 16, min_samples: int = 20):
+        self._samples = deque(maxlen=size)
+        self._refresh_every = refresh_every
+        self._min_samples = min_samples
+        self._since_refresh = 0
+        self._sorted: list[float] = []
+
+    def add(self, seconds: float):
+        self._samples.append(seconds)
+        self._since_refresh += 1
+        if self._since_refresh >= self._refresh_every:
+            self._sorted = sorted(self._samples)
+            self._since_refresh = 0
+
+    def quantile(self, q: float) -> float | None:
+        if len(self._sorted) < self._min_samples:
+            return None
+        return self._sorted[min(len(self._sorted) - 1, int(q * len(self._sorted)))]
+
+
+class ServiceStats:
+    __slots__ = ("calls", "attempts", "retries", "hedges", "hedge_wins", "timeouts")
+
+    def __init__(self):
+        self.calls = 0
+        self.attempts = 0
+        self.retries = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+        self.timeouts = 0
+
+
+class Resilience:
+    """Applies each upstream's policy to calls made through the gateway.
+
+    `call` runs `attempt()` (one request to one instance, returning an
+    httpx.Response) under the service's deadline. Idempotent methods are
+    retried on transport errors and 502/503/504 with jittered backoff, GETs
+    can be hedged with a second attempt once the first has taken longer than
+    the recent p95, and every attempt feeds the service's circuit breaker.
+    A call whose request body can only be sent once (`replayable=False`)
+    gets a single attempt. Responses that lose a race or get retried are
+    handed to `discard`.
+    """
+
+    def __init__(self, service_names=()):
+        self._policies: dict[str, Policy] = {}
+        self._breakers: dict[str, CircuitBreaker] = {}
+        self._latencies: dict[str, LatencyWindow] = {}
+        self._stats: dict[str, ServiceStats] = {}
+        for name in service_names:
+            self.policy(name)
+
+    def policy(self, service_name: str) -> Policy:
+        policy = self._policies.get(service_name)
+        if policy is None:
+            policy = self._policies[service_name] = Policy.for_service(service_name)
+            self._breakers[service_name] = CircuitBreaker(
+                service_name,
+                policy.breaker_failures,
+                policy.breaker_open_seconds,
+                policy.breaker_half_open_calls,
+            )
+            self._latencies[service_name] = LatencyWindow()
+            self._stats[service_name] = ServiceStats()
+        return policy
+
+    def breaker(self, service_name: str) -> CircuitBreaker:
+        self.policy(service_name)
+        return self._breakers[service_name]
+
+    async def call(self, service_name: str, method: str, attempt, discard=None, replayable: bool = True):
+        policy = self.policy(service_name)
+        breaker = self._breakers[service_name]
+        stats = self._stats[service_name]
+        stats.calls += 1
+        retryable = replayable and method.upper() in IDEMPOTENT_METHODS
+        attempts = policy.retries + 1 if retryable else 1
+        hedge = replayable and policy.hedge and method.upper() == "GET"
+
+        try:
+            async with asyncio.timeout(policy.deadline):
+                for number in range(attempts):
+                    if number:
+                        stats.retries += 1
+                        await asyncio.sleep(policy.backoff(number))
+                    if not breaker.allow():
+                        raise CircuitOpenError(service_name, breaker.retry_after())
+                    last = number == attempts - 1
+                    try:
+                        if hedge:
+                            response = await self._hedged(service_name, attempt, discard)
+                        else:
+                            response = await self._attempt(service_name, attempt)
+                    except RETRYABLE_EXCEPTIONS:
+                        if last:
+                            raise
+                        continue
+                    if response.status_code in RETRYABLE_STATUSES and not last:
+                        await _discard(discard, response)
+                        continue
+                    return response
+        except TimeoutError:
+            # The attempt in flight was cancelled by the deadline; count it against the upstream.
+            stats.timeouts += 1
+            breaker.record(False)
+            raise
+
+    async def call_unguarded(self, service_name: str, attempt, deadline: float):
+        """One attempt under `deadline`, with no retries, hedging or breaker accounting.
+
+        For long polls, which are slow by design: held to the service's
+        deadline and hedge delay, an idle poll would time out, be hedged
+        and count as failures until the breaker opened.
+        """
+        self.policy(service_name)
+        stats = self._stats[service_name]
+        stats.calls += 1
+        stats.attempts += 1
+        async with asyncio.timeout(deadline):
+            return await attempt()
+
+    async def _attempt(self, service_name: str, attempt):
+        breaker = self._breakers[service_name]
+        self._stats[service_name].attempts += 1
+        started = time.monotonic()
+        try:
+            response = await attempt()
+        except RETRYABLE_EXCEPTIONS:
+            breaker.record(False)
+            raise
+        except BaseException:
+            breaker.abandon()
+            raise
+        success = response.status_code not in RETRYABLE_STATUSES
+        breaker.record(success)
+        if success:
+            self._latencies[service_name].add(time.monotonic() - started)
+        return response
+
+    async def _hedged(self, service_name: str, attempt, discard):
+        policy = self._policies[service_name]
+        delay = self._latencies[service_name].quantile(policy.hedge_quantile) or policy.hedge_delay
+        first = asyncio.ensure_future(self._attempt(service_name, attempt))
+        done, _ = await asyncio.wait({first}, timeout=delay)
+        if done or not self._breakers[service_name].allow():
+            return await first
+
+        # The half-open slot was taken by allow() above; _attempt records its outcome.
+        self._stats[service_name].hedges += 1
+        second = asyncio.ensure_future(self._attempt(service_name, attempt))
+        pending = {first, second}
+        winner = None
+        fallback = None
+        try:
+            while pending and winner is None:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if winner is None and not _failed(task):
+                        winner = task
+                        continue
+                    if fallback is not None:
+                        await _discard_task(discard, fallback)
+                    fallback = task
+        finally:
+            for task in pending:
+                task.cancel()
+            for task in pending:
+                try:
+                    await task
+                except BaseException:
+                    pass
+                await _discard_task(discard, task)
+        if winner is None:
+            return fallback.result()
+        if fallback is not None:
+            await _discard_task(discard, fallback)
+        if winner is second:
+            self._stats[service_name].hedge_wins += 1
+        return winner.result()
+
+    def snapshot(self) -> dict:
+        result = {}
+        for name, policy in self._policies.items():
+            stats = self._stats[name]
+            p95 = self._latencies[name].quantile(0.95)
+            result[name] = {
+                "breaker": self._breakers[name].snapshot(),
+                "calls": stats.calls,
+                "attempts": stats.attempts,
+                "retries": stats.retries,
+                "hedges": stats.hedges,
+                "hedge_wins": stats.hedge_wins,
+                "timeouts": stats.timeouts,
+                "p95_ms": round(p95 * 1000, 1) if p95 is not None else None,
+                "policy": policy.as_dict(),
+            }
+        return result
+
+
+def _failed(task: asyncio.Future) -> bool:
+    if task.cancelled() or task.exception() is not None:
+        return True
+    return task.result().status_code in RETRYABLE_STATUSES
+
+
+async def _discard(discard, response):
+    if discard is not None:
+        await discard(response)
+
+
+async def _discard_task(discard, task: asyncio.Future):
+    if not task.cancelled() and task.exception() is None:
+        await _discard(discard, task.result())
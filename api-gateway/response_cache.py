@@ -0,0 +1,60 @@
+import os
+from collections import OrderedDict
+
+
+class CachedResponse:
+    __slots__ = ("etag", "status_code", "headers", "body")
+
+    def __init__(self, etag: str, status_code: int, headers, body: bytes):
+        self.etag = etag
+        self.status_code = status_code
+        self.headers = headers
+        self.body = body
+
+
+class ResponseCache:
+    """Bounded LRU of upstream GET responses that carried an ETag.
+
+    Entries are keyed by upstream service and URL. The ETag encodes the
+    collection version, so the gateway never serves an entry blindly. It
+    revalidates with If-None-Match, and the upstream answers 304 from its
+    version counter without re-running the query or re-serializing the
+    body. Settings are GATEWAY_CACHE_ENTRIES and GATEWAY_CACHE_MAX_BODY.
+    """
+
+    def __init__(self, max_entries: int | None = None, max_body: int | None = None):
+        self._max_entries = max_entries or int(os.getenv("GATEWAY_CACHE_ENTRIES", 1024))
+        self.max_body = max_body or int(os.getenv("GATEWAY_CACHE_MAX_BODY", 1024 * 1024))
+        self._entries: OrderedDict[tuple, CachedResponse] = OrderedDict()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key) -> CachedResponse | None:
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._entries.move_to_end(key)
+        return entry
+
+    def put(self, key, entry: CachedResponse):
+        if len(entry.body) > self.max_body:
+            return
+        old = self._entries.pop(key, None)
+        if old is not None:
+            self._bytes -= len(old.body)
+        self._entries[key] = entry
+        self._bytes += len(entry.body)
+        while len(self._entries) > self._max_entries:
+            _, evicted = self._entries.popitem(last=False)
+            self._bytes -= len(evicted.body)
+            self.evictions += 1
+
+    def stats(self) -> dict:
+        return {
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
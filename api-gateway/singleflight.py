@@ -0,0 +1,35 @@
+import asyncio
+
+
+class SingleFlight:
+    """Shares one in-flight call among concurrent callers with the same key.
+
+    The call runs in its own task, so a caller that goes away (client
+    disconnect, deadline) does not cancel it for the others. Results and
+    exceptions are delivered to everyone who joined; nothing is kept once
+    the call finishes.
+    """
+
+    def __init__(self):
+        self._calls: dict = {}
+        self.calls = 0
+        self.shared = 0
+
+    async def do(self, key, fn):
+        task = self._calls.get(key)
+        if task is None:
+            self.calls += 1
+            task = self._calls[key] = asyncio.ensure_future(fn())
+            task.add_done_callback(lambda done: self._finish(key, done))
+        else:
+            self.shared += 1
+        return await asyncio.shield(task)
+
+    def _finish(self, key, task):
+        self._calls.pop(key, None)
+        if not task.cancelled():
+            # Mark the exception retrieved in case every caller has gone away.
+            task.exception()
+
+    def stats(self) -> dict:
+        return {"in_flight": len(self._calls), "calls": self.calls, "shared": self.shared}
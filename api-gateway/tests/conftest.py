@@ -0,0 +1,15 @@
+import os
+import sys
+
+import pytest
+
+SERVICE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+sys.path.insert(0, SERVICE_DIR)
+# benchmarks/ holds the fake Consul agent the discovery tests run against.
+sys.path.append(os.path.join(os.path.dirname(SERVICE_DIR), "benchmarks"))
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
@@ -0,0 +1,217 @@
+import asyncio
+
+import pytest
+
+import admission as admission_module
+from admission import AdaptiveLimit, Admission, Overloaded, Permit
+from resilience import Resilience
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(admission_module.time, "monotonic", clock)
+    return clock
+
+
+def limit(initial=2, minimum=1, maximum=10, queue_size=2, queue_timeout=1.0, tolerance=2.0, slack=0.05):
+    return AdaptiveLimit("svc", initial, minimum, maximum, queue_size, queue_timeout, tolerance, slack)
+
+
+async def settle():
+    for _ in range(3):
+        await asyncio.sleep(0)
+
+
+@pytest.mark.anyio
+async def test_requests_under_the_limit_are_admitted_at_once():
+    lim = limit(initial=2)
+
+    await lim.acquire()
+    await lim.acquire()
+
+    assert lim.stats()["in_flight"] == 2
+    assert lim.queued == 0
+
+
+@pytest.mark.anyio
+async def test_requests_over_the_limit_wait_and_are_admitted_in_order():
+    lim = limit(initial=1, queue_size=5)
+    held = await lim.acquire()
+    order = []
+
+    async def wait(name):
+        permit = await lim.acquire()
+        order.append(name)
+        return permit
+
+    waiters = [asyncio.create_task(wait(name)) for name in ("a", "b")]
+    await settle()
+    assert order == [] and lim.stats()["waiting"] == 2
+
+    held.release()
+    await settle()
+    assert order == ["a"]
+
+    (await waiters[0]).release()
+    await settle()
+    assert order == ["a", "b"]
+    (await waiters[1]).release()
+    assert lim.in_flight == 0
+
+
+@pytest.mark.anyio
+async def test_full_queue_sheds_new_requests():
+    lim = limit(initial=1, queue_size=1)
+    await lim.acquire()
+    queued = asyncio.create_task(lim.acquire())
+    await settle()
+
+    with pytest.raises(Overloaded, match="queue full"):
+        await lim.acquire()
+
+    assert lim.shed == 1
+    queued.cancel()
+    await asyncio.gather(queued, return_exceptions=True)
+
+
+@pytest.mark.anyio
+async def test_queued_request_is_shed_when_its_wait_runs_out():
+    lim = limit(initial=1, queue_size=5, queue_timeout=0.02)
+    await lim.acquire()
+
+    with pytest.raises(Overloaded, match="queue timeout"):
+        await lim.acquire()
+
+    assert lim.shed == 1
+    assert lim.stats()["waiting"] == 0
+
+
+@pytest.mark.anyio
+async def test_cancelled_waiter_leaves_the_queue_without_taking_a_slot():
+    lim = limit(initial=1, queue_size=5)
+    held = await lim.acquire()
+    cancelled = asyncio.create_task(lim.acquire())
+    behind = asyncio.create_task(lim.acquire())
+    await settle()
+
+    cancelled.cancel()
+    await asyncio.gather(cancelled, return_exceptions=True)
+    held.release()
+
+    permit = await asyncio.wait_for(behind, 1)
+    assert lim.in_flight == 1
+    permit.release()
+    assert lim.in_flight == 0
+
+
+@pytest.mark.anyio
+async def test_new_request_does_not_jump_the_queue():
+    lim = limit(initial=1, queue_size=5)
+    held = await lim.acquire()
+    first = asyncio.create_task(lim.acquire())
+    await settle()
+
+    held.release()
+    # The freed slot went to the waiter, so a newcomer queues behind it.
+    late = asyncio.create_task(lim.acquire())
+    await settle()
+
+    assert first.done() and not late.done()
+    (await first).release()
+    (await late).release()
+
+
+@pytest.mark.anyio
+async def test_permit_releases_only_once():
+    lim = limit(initial=2)
+    permit = await lim.acquire()
+
+    permit.release()
+    permit.release()
+
+    assert lim.in_flight == 0
+
+
+def test_successes_grow_the_limit_up_to_the_maximum(clock):
+    lim = limit(initial=2, maximum=3)
+
+    for _ in range(10):
+        lim.observe(0.01, failed=False)
+
+    assert lim.limit == 3
+
+
+def test_failure_cuts_the_limit_once_per_round_trip(clock):
+    lim = limit(initial=10, minimum=1)
+    lim.observe(0.01, failed=False)
+    before = lim.limit
+
+    lim.observe(0.01, failed=True)
+    lim.observe(0.01, failed=True)
+    assert lim.limit == pytest.approx(before * 0.9)
+    assert lim.decreases == 1
+
+    clock.now += 1
+    lim.observe(0.01, failed=True)
+    assert lim.decreases == 2
+
+
+def test_rising_latency_cuts_the_limit(clock):
+    lim = limit(initial=10, tolerance=2.0, slack=0.0)
+    for _ in range(20):
+        lim.observe(0.01, failed=False)
+        clock.now += 0.01
+    before = lim.limit
+
+    for _ in range(10):
+        clock.now += 1
+        lim.observe(0.2, failed=False)
+
+    assert lim.limit < before
+    assert lim.decreases > 0
+
+
+def test_limit_never_drops_below_the_minimum(clock):
+    lim = limit(initial=3, minimum=2)
+
+    for _ in range(20):
+        clock.now += 1
+        lim.observe(0.01, failed=True)
+
+    assert lim.limit == 2
+
+
+@pytest.mark.anyio
+async def test_growth_admits_queued_requests(clock):
+    lim = limit(initial=1, maximum=5, queue_size=5)
+    await lim.acquire()
+    waiter = asyncio.create_task(lim.acquire())
+    await settle()
+
+    lim.observe(0.01, failed=False)
+    await settle()
+
+    assert waiter.done()
+    assert lim.in_flight == 2
+
+
+@pytest.mark.anyio
+async def test_admission_skips_services_without_a_concurrency_limit(monkeypatch):
+    monkeypatch.setenv("UPSTREAM_SVC_CONCURRENCY_MAX", "0")
+    gate = Admission(Resilience())
+
+    permit = await gate.acquire("svc")
+
+    assert isinstance(permit, Permit)
+    permit.observe()
+    permit.release()
+    assert gate.stats() == {}
@@ -0,0 +1,174 @@
+import pytest
+
+import balancer as balancer_module
+from balancer import LoadBalancer
+from discovery import ServiceInstance
+
+
+class StaticRegistry:
+    def __init__(self, count):
+        self.list = tuple(ServiceInstance(id=f"i{n}", address="10.0.0.1", port=9000 + n) for n in range(count))
+
+    def instances(self, service_name):
+        return self.list
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(balancer_module.time, "monotonic", clock)
+    return clock
+
+
+def fail(lb, instance, times):
+    for _ in range(times):
+        lb._state(instance).outstanding += 1
+        lb.release("svc", instance, failed=True)
+
+
+def picks(lb, count):
+    chosen = []
+    for _ in range(count):
+        instance = lb.acquire("svc")
+        lb.release("svc", instance)
+        chosen.append(instance.id)
+    return chosen
+
+
+def test_unknown_strategy_is_rejected():
+    with pytest.raises(ValueError):
+        LoadBalancer(StaticRegistry(1), strategy="random")
+
+
+def test_no_instances_gives_none():
+    assert LoadBalancer(StaticRegistry(0)).acquire("svc") is None
+
+
+def test_round_robin_cycles_through_instances():
+    lb = LoadBalancer(StaticRegistry(3), strategy="round_robin")
+
+    assert picks(lb, 6) == ["i0", "i1", "i2", "i0", "i1", "i2"]
+
+
+def test_consecutive_failures_eject_an_instance(clock):
+    registry = StaticRegistry(3)
+    lb = LoadBalancer(registry, strategy="round_robin", consecutive_failures=3, base_ejection_seconds=10)
+
+    fail(lb, registry.list[0], 3)
+
+    assert "i0" not in picks(lb, 6)
+
+
+def test_a_success_resets_the_failure_count(clock):
+    registry = StaticRegistry(3)
+    lb = LoadBalancer(registry, strategy="round_robin", consecutive_failures=3, base_ejection_seconds=10)
+
+    fail(lb, registry.list[0], 2)
+    lb._state(registry.list[0]).outstanding += 1
+    lb.release("svc", registry.list[0], failed=False)
+    fail(lb, registry.list[0], 2)
+
+    assert "i0" in picks(lb, 3)
+
+
+def test_ejection_expires(clock):
+    registry = StaticRegistry(3)
+    lb = LoadBalancer(registry, strategy="round_robin", consecutive_failures=1, base_ejection_seconds=10)
+
+    fail(lb, registry.list[0], 1)
+    clock.now += 9.9
+    assert "i0" not in picks(lb, 3)
+    clock.now += 0.2
+    assert "i0" in picks(lb, 3)
+
+
+def test_repeated_ejections_last_longer_until_successes_decay_them(clock):
+    registry = StaticRegistry(3)
+    lb = LoadBalancer(registry, strategy="round_robin", consecutive_failures=1, base_ejection_seconds=10)
+    first = registry.list[0]
+
+    fail(lb, first, 1)
+    clock.now += 10.1
+    fail(lb, first, 1)
+    assert lb._state(first).ejected_until == pytest.approx(clock.now + 20)
+
+    clock.now += 20.1
+    picks(lb, 3)
+    assert lb._state(first).ejections == 1
+
+
+def test_ejections_are_capped_by_max_ejection_percent(clock):
+    registry = StaticRegistry(2)
+    lb = LoadBalancer(registry, strategy="round_robin", consecutive_failures=1, max_ejection_percent=50)
+
+    fail(lb, registry.list[0], 1)
+    fail(lb, registry.list[1], 1)
+
+    assert lb._state(registry.list[0]).ejected_until > clock.now
+    assert lb._state(registry.list[1]).ejected_until == 0.0
+    assert set(picks(lb, 4)) == {"i1"}
+
+
+def test_all_instances_ejected_falls_back_to_all(clock):
+    registry = StaticRegistry(2)
+    lb = LoadBalancer(registry, strategy="round_robin", consecutive_failures=1, max_ejection_percent=100)
+
+    fail(lb, registry.list[0], 1)
+    fail(lb, registry.list[1], 1)
+
+    assert set(picks(lb, 4)) == {"i0", "i1"}
+
+
+def test_power_of_two_never_picks_the_busiest_instance():
+    registry = StaticRegistry(3)
+    lb = LoadBalancer(registry, strategy="p2c")
+    lb._state(registry.list[0]).outstanding = 5
+
+    chosen = picks(lb, 300)
+
+    assert "i0" not in chosen
+    assert {"i1", "i2"} == set(chosen)
+
+
+def test_power_of_two_with_one_instance():
+    lb = LoadBalancer(StaticRegistry(1), strategy="p2c")
+
+    assert picks(lb, 3) == ["i0", "i0", "i0"]
+
+
+def test_least_outstanding_prefers_idle_instances():
+    registry = StaticRegistry(3)
+    lb = LoadBalancer(registry, strategy="least_outstanding")
+    held = [lb.acquire("svc"), lb.acquire("svc")]
+
+    assert lb.acquire("svc").id not in {i.id for i in held}
+
+
+def test_lease_records_transport_errors_as_failures(clock):
+    registry = StaticRegistry(2)
+    lb = LoadBalancer(registry, strategy="round_robin", consecutive_failures=1)
+
+    with pytest.raises(OSError):
+        with lb.lease("svc"):
+            raise OSError("connection refused")
+
+    assert lb._state(registry.list[0]).ejections == 1
+    assert lb._state(registry.list[0]).outstanding == 0
+
+
+def test_lease_records_5xx_responses(clock):
+    registry = StaticRegistry(2)
+    lb = LoadBalancer(registry, strategy="round_robin", consecutive_failures=1)
+
+    with lb.lease("svc") as lease:
+        lease.record(503)
+
+    assert lb._state(registry.list[0]).ejections == 1
@@ -0,0 +1,164 @@
+import threading
+import time
+
+import pytest
+from consul import Consul
+
+from discovery import ServiceRegistry
+from fake_consul import FakeConsul
+
+
+def wait_until(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.01)
+    return False
+
+
+def watcher_threads(service_name):
+    return [t for t in threading.enumerate() if t.name == f"consul-watch-{service_name}"]
+
+
+@pytest.fixture
+def consul():
+    agent = FakeConsul(port=0).start()
+    yield agent
+    agent.stop()
+
+
+@pytest.fixture
+def registry(consul):
+    registry = ServiceRegistry(Consul(host="127.0.0.1", port=consul.port), wait="1s", retry_delay=0.05)
+    yield registry
+    registry.stop()
+
+
+class ScriptedHealth:
+    """Stands in for `Consul().health`, answering from a list of (index, entries)."""
+
+    def __init__(self, answers):
+        self.answers = list(answers)
+        self.calls = []
+        self.done = threading.Event()
+
+    def service(self, service_name, index=None, wait=None, passing=None):
+        self.calls.append({"index": index, "wait": wait})
+        if len(self.answers) == 1:
+            self.done.set()
+            time.sleep(0.01)
+        return self.answers.pop(0) if len(self.answers) > 1 else self.answers[0]
+
+
+class ScriptedConsul:
+    def __init__(self, answers):
+        self.health = ScriptedHealth(answers)
+
+
+def entry(port):
+    return {"Node": {"Address": "127.0.0.1"}, "Service": {"ID": f"svc-{port}", "Address": "", "Port": port}}
+
+
+def test_start_loads_registered_instances(consul, registry):
+    consul.register("task-service", "task-1", "10.0.0.1", 8001)
+
+    registry.start(["task-service"])
+
+    assert registry.url("task-service") == "http://10.0.0.1:8001"
+
+
+def test_watch_follows_registrations_and_deregistrations(consul, registry):
+    consul.register("task-service", "task-1", "10.0.0.1", 8001)
+    registry.start(["task-service"])
+
+    consul.register("task-service", "task-2", "10.0.0.2", 8001)
+    assert wait_until(lambda: len(registry.instances("task-service")) == 2)
+
+    consul.deregister("task-1")
+    assert wait_until(lambda: [i.id for i in registry.instances("task-service")] == ["task-2"])
+
+
+def test_other_services_do_not_leak_into_the_table(consul, registry):
+    consul.register("project-service", "project-1", "10.0.0.3", 8002)
+    registry.start(["task-service", "project-service"])
+
+    assert registry.instances("task-service") == ()
+    assert [i.id for i in registry.instances("project-service")] == ["project-1"]
+
+
+def test_unknown_service_starts_a_watch_on_first_lookup(consul, registry):
+    consul.register("report-service", "report-1", "10.0.0.4", 8003)
+
+    assert registry.instances("report-service") == ()
+    assert wait_until(lambda: registry.url("report-service") == "http://10.0.0.4:8003")
+
+
+def test_blocking_queries_pass_the_last_index():
+    consul = ScriptedConsul([(10, [entry(1)]), (11, [entry(1), entry(2)]), (11, [entry(1), entry(2)])])
+    registry = ServiceRegistry(consul, wait="5s")
+    registry.start(["svc"])
+    assert consul.health.done.wait(5)
+    registry.stop()
+
+    calls = consul.health.calls
+    assert calls[0] == {"index": None, "wait": "5s"}
+    assert calls[1] == {"index": 10, "wait": "5s"}
+    assert calls[2] == {"index": 11, "wait": "5s"}
+    assert len(registry.instances("svc")) == 2
+
+
+def test_index_going_backwards_resets_the_watch():
+    # Consul can hand out a smaller index after a restart; keep blocking on it and nothing changes again.
+    consul = ScriptedConsul([(50, [entry(1)]), (3, [entry(2)]), (4, [entry(2)]), (4, [entry(2)])])
+    registry = ServiceRegistry(consul, wait="5s")
+    registry.start(["svc"])
+    assert consul.health.done.wait(5)
+    registry.stop()
+
+    assert [c["index"] for c in consul.health.calls[:4]] == [None, 50, None, 4]
+
+
+def test_agent_without_index_falls_back_to_ttl_polling():
+    consul = ScriptedConsul([(None, [entry(1)]), (None, [entry(1)]), (None, [entry(1)])])
+    registry = ServiceRegistry(consul, wait="5s", ttl=0.01)
+    registry.start(["svc"])
+    assert consul.health.done.wait(5)
+    registry.stop()
+
+    assert consul.health.calls[0] == {"index": None, "wait": "5s"}
+    assert all(call == {"index": None, "wait": None} for call in consul.health.calls[1:])
+
+
+def test_last_known_instances_survive_an_unreachable_agent(consul):
+    consul.register("task-service", "task-1", "10.0.0.1", 8001)
+    registry = ServiceRegistry(Consul(host="127.0.0.1", port=consul.port), wait="1s", retry_delay=0.05)
+    registry.start(["task-service"])
+
+    consul.stop()
+    consul.deregister("task-1")
+    time.sleep(0.2)
+
+    assert registry.url("task-service") == "http://10.0.0.1:8001"
+    registry.stop()
+
+
+def test_stop_ends_the_watch_threads(consul, registry):
+    registry.start(["task-service"])
+    assert watcher_threads("task-service")
+
+    registry.stop()
+
+    # A blocked query returns within the 1s wait, and the loop then sees the stop flag.
+    assert wait_until(lambda: not watcher_threads("task-service"), timeout=3)
+
+
+def test_stop_keeps_the_table(consul, registry):
+    consul.register("task-service", "task-1", "10.0.0.1", 8001)
+    registry.start(["task-service"])
+    registry.stop()
+
+    consul.deregister("task-1")
+    time.sleep(0.2)
+
+    assert registry.url("task-service") == "http://10.0.0.1:8001"
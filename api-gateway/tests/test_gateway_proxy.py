@@ -0,0 +1,142 @@
+import asyncio
+
+import httpx
+import pytest
+
+import main
+import resilience as resilience_module
+from admission import Admission
+from balancer import LoadBalancer
+from discovery import ServiceInstance
+from resilience import Resilience
+
+pytestmark = pytest.mark.anyio
+
+
+class StaticRegistry:
+    def instances(self, service_name):
+        return (ServiceInstance(id="tasks", address="10.0.0.1", port=8001),)
+
+
+class Upstream:
+    """Answers with the scripted statuses in turn and records each request body it received."""
+
+    def __init__(self, *statuses):
+        self.statuses = list(statuses)
+        self.bodies = []
+        self.timeouts = []
+        self.delay = 0
+
+    async def handle(self, request: httpx.Request) -> httpx.Response:
+        self.bodies.append(await request.aread())
+        self.timeouts.append(request.extensions["timeout"])
+        await asyncio.sleep(self.delay)
+        status = self.statuses.pop(0) if len(self.statuses) > 1 else self.statuses[0]
+        # An unread stream, as the gateway relays upstream bodies with aiter_raw().
+        return httpx.Response(status, stream=httpx.ByteStream(b""))
+
+
+@pytest.fixture
+def upstream(monkeypatch):
+    upstream = Upstream(503, 200)
+    monkeypatch.setattr(resilience_module.Policy, "backoff", lambda self, attempt: 0)
+    policies = Resilience(main.UPSTREAM_SERVICES)
+    monkeypatch.setattr(main, "resilience", policies)
+    monkeypatch.setattr(main, "admission", Admission(policies))
+    monkeypatch.setattr(main, "balancer", LoadBalancer(StaticRegistry()))
+    monkeypatch.setattr(main, "MAX_REPLAY_BODY", 16)
+    monkeypatch.setitem(
+        main.upstreams._clients, "task-service", httpx.AsyncClient(transport=httpx.MockTransport(upstream.handle)),
+    )
+    return upstream
+
+
+@pytest.fixture
+async def gateway():
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url="http://gateway") as client:
+        yield client
+
+
+async def test_small_idempotent_body_is_buffered_and_retried(upstream, gateway):
+    response = await gateway.put("/tasks/tasks/1", content=b"x" * 16)
+
+    assert response.status_code == 200
+    assert upstream.bodies == [b"x" * 16, b"x" * 16]
+
+
+async def test_large_idempotent_body_is_streamed_in_one_attempt(upstream, gateway):
+    response = await gateway.put("/tasks/tasks/1", content=b"x" * 17)
+
+    assert response.status_code == 503
+    assert upstream.bodies == [b"x" * 17]
+
+
+async def test_body_of_unknown_length_is_streamed_in_one_attempt(upstream, gateway):
+    async def chunks():
+        yield b"x" * 4
+        yield b"y" * 4
+
+    response = await gateway.request("DELETE", "/tasks/tasks", content=chunks())
+
+    assert response.status_code == 503
+    assert upstream.bodies == [b"xxxxyyyy"]
+
+
+async def test_idle_long_poll_is_not_hedged_timed_out_or_counted_against_the_breaker(upstream, gateway):
+    policy = main.resilience.policy("task-service")
+    policy.deadline = 0.1
+    policy.hedge_delay = 0.01
+    upstream.statuses = [200]
+    upstream.delay = 0.2
+
+    response = await gateway.get("/tasks/changes", params={"wait": 0.2})
+
+    assert response.status_code == 200
+    assert len(upstream.bodies) == 1
+    assert upstream.timeouts[0]["read"] == main.LONG_POLL_TIMEOUT
+    stats = main.resilience.snapshot()["task-service"]
+    assert stats["hedges"] == 0
+    assert stats["timeouts"] == 0
+    assert stats["breaker"]["consecutive_failures"] == 0
+    assert "task-service" not in main.admission.stats()
+
+
+async def test_failed_long_poll_is_not_retried(upstream, gateway):
+    response = await gateway.get("/tasks/changes", params={"wait": 0})
+
+    assert response.status_code == 503
+    assert len(upstream.bodies) == 1
+    assert main.resilience.snapshot()["task-service"]["breaker"]["consecutive_failures"] == 0
+
+
+async def test_long_poll_past_the_gateway_timeout_is_cut_off(upstream, gateway, monkeypatch):
+    monkeypatch.setattr(main, "LONG_POLL_TIMEOUT", 0.05)
+    upstream.delay = 1
+
+    response = await gateway.get("/tasks/changes", params={"wait": 30})
+
+    assert response.status_code == 504
+
+
+async def test_other_gets_keep_the_service_policy(upstream, gateway):
+    policy = main.resilience.policy("task-service")
+    policy.deadline = 0.1
+    upstream.statuses = [200]
+    upstream.delay = 0.2
+
+    response = await gateway.get("/tasks/tasks")
+
+    assert response.status_code == 504
+
+
+async def test_long_poll_in_a_batch_is_rejected(upstream, gateway):
+    upstream.statuses = [200]
+
+    response = await gateway.post("/batch", json={"requests": [
+        {"id": "feed", "method": "GET", "path": "/tasks/changes?wait=30"},
+        {"id": "list", "method": "GET", "path": "/tasks/tasks"},
+    ]})
+
+    statuses = {r["id"]: r["status"] for r in response.json()["responses"]}
+    assert statuses == {"feed": 400, "list": 200}
+    assert len(upstream.bodies) == 1
@@ -0,0 +1,286 @@
+import asyncio
+
+import httpx
+import pytest
+
+import resilience as resilience_module
+from resilience import CircuitBreaker, CircuitOpenError, Resilience
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(resilience_module.time, "monotonic", clock)
+    return clock
+
+
+@pytest.fixture
+def policy(monkeypatch):
+    """Set UPSTREAM_SVC_<SETTING> overrides for the "svc" upstream, then build its Resilience."""
+
+    def configure(**settings):
+        for name, value in settings.items():
+            monkeypatch.setenv(f"UPSTREAM_SVC_{name.upper()}", str(value))
+        return Resilience(["svc"])
+
+    # No real backoff between retries.
+    monkeypatch.setattr(resilience_module.Policy, "backoff", lambda self, attempt: 0)
+    return configure
+
+
+class Upstream:
+    """Scripted attempts: each entry is a status code, an exception, or (delay, status)."""
+
+    def __init__(self, *script):
+        self.script = list(script)
+        self.calls = 0
+        self.cancelled = 0
+        self.discarded = []
+
+    async def attempt(self):
+        self.calls += 1
+        number = self.calls
+        step = self.script.pop(0) if len(self.script) > 1 else self.script[0]
+        delay, outcome = step if isinstance(step, tuple) else (0, step)
+        try:
+            await asyncio.sleep(delay)
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+        if isinstance(outcome, BaseException):
+            raise outcome
+        return httpx.Response(outcome, headers={"x-call": str(number)})
+
+    async def discard(self, response):
+        self.discarded.append(response.status_code)
+
+
+def breaker(failures=3, open_seconds=10.0, half_open_calls=1):
+    return CircuitBreaker("svc", failures, open_seconds, half_open_calls)
+
+
+def test_breaker_opens_after_consecutive_failures(clock):
+    b = breaker(failures=3)
+
+    for _ in range(2):
+        assert b.allow()
+        b.record(False)
+    assert b.state == CircuitBreaker.CLOSED
+
+    b.record(False)
+    assert b.state == CircuitBreaker.OPEN
+    assert not b.allow()
+    assert b.snapshot()["rejected"] == 1
+
+
+def test_a_success_resets_the_consecutive_failures(clock):
+    b = breaker(failures=3)
+
+    b.record(False)
+    b.record(False)
+    b.record(True)
+    b.record(False)
+
+    assert b.state == CircuitBreaker.CLOSED
+
+
+def test_open_breaker_goes_half_open_after_the_open_period(clock):
+    b = breaker(failures=1, open_seconds=10)
+    b.record(False)
+
+    clock.now += 9.9
+    assert not b.allow()
+    assert b.retry_after() == pytest.approx(0.1)
+
+    clock.now += 0.2
+    assert b.allow()
+    assert b.state == CircuitBreaker.HALF_OPEN
+
+
+def test_half_open_admits_only_the_trial_calls(clock):
+    b = breaker(failures=1, open_seconds=10, half_open_calls=2)
+    b.record(False)
+    clock.now += 10
+
+    assert b.allow()
+    assert b.allow()
+    assert not b.allow()
+
+
+def test_half_open_success_closes_the_breaker(clock):
+    b = breaker(failures=1, open_seconds=10)
+    b.record(False)
+    clock.now += 10
+    assert b.allow()
+
+    b.record(True)
+
+    assert b.state == CircuitBreaker.CLOSED
+    assert b.allow() and b.allow()
+
+
+def test_half_open_failure_reopens_the_breaker(clock):
+    b = breaker(failures=5, open_seconds=10)
+    for _ in range(5):
+        b.record(False)
+    clock.now += 10
+    assert b.allow()
+
+    b.record(False)
+
+    assert b.state == CircuitBreaker.OPEN
+    assert not b.allow()
+    assert b.snapshot()["opened"] == 2
+
+
+def test_abandoned_trial_frees_its_half_open_slot(clock):
+    b = breaker(failures=1, open_seconds=10)
+    b.record(False)
+    clock.now += 10
+    assert b.allow()
+    assert not b.allow()
+
+    b.abandon()
+
+    assert b.state == CircuitBreaker.HALF_OPEN
+    assert b.allow()
+
+
+@pytest.mark.anyio
+async def test_idempotent_call_is_retried_on_retryable_status(policy):
+    r = policy(retries=2)
+    upstream = Upstream(503, 502, 200)
+
+    response = await r.call("svc", "GET", upstream.attempt, upstream.discard)
+
+    assert response.status_code == 200
+    assert upstream.calls == 3
+    assert upstream.discarded == [503, 502]
+    assert r.snapshot()["svc"]["retries"] == 2
+
+
+@pytest.mark.anyio
+async def test_last_retryable_status_is_returned(policy):
+    r = policy(retries=1)
+    upstream = Upstream(503)
+
+    response = await r.call("svc", "PUT", upstream.attempt, upstream.discard)
+
+    assert response.status_code == 503
+    assert upstream.calls == 2
+
+
+@pytest.mark.anyio
+async def test_transport_errors_are_retried_and_the_last_one_raised(policy):
+    r = policy(retries=2)
+    upstream = Upstream(httpx.ConnectError("refused"))
+
+    with pytest.raises(httpx.ConnectError):
+        await r.call("svc", "DELETE", upstream.attempt)
+
+    assert upstream.calls == 3
+
+
+@pytest.mark.anyio
+async def test_non_idempotent_call_gets_one_attempt(policy):
+    r = policy(retries=2)
+    upstream = Upstream(503, 200)
+
+    response = await r.call("svc", "POST", upstream.attempt, upstream.discard)
+
+    assert response.status_code == 503
+    assert upstream.calls == 1
+
+
+@pytest.mark.anyio
+async def test_call_with_a_one_shot_body_is_neither_retried_nor_hedged(policy):
+    r = policy(retries=2, hedge=True, hedge_delay=0.01)
+    upstream = Upstream((0.05, 503), 200)
+
+    response = await r.call("svc", "GET", upstream.attempt, upstream.discard, replayable=False)
+
+    assert response.status_code == 503
+    assert upstream.calls == 1
+    assert r.snapshot()["svc"]["hedges"] == 0
+
+
+@pytest.mark.anyio
+async def test_failed_attempts_open_the_breaker_and_later_calls_fail_fast(policy):
+    r = policy(retries=0, breaker_failures=2)
+    upstream = Upstream(503)
+
+    await r.call("svc", "GET", upstream.attempt)
+    await r.call("svc", "GET", upstream.attempt)
+
+    with pytest.raises(CircuitOpenError):
+        await r.call("svc", "GET", upstream.attempt)
+    assert upstream.calls == 2
+
+
+@pytest.mark.anyio
+async def test_deadline_cancels_the_attempt_and_counts_as_a_failure(policy):
+    r = policy(retries=0, deadline=0.05)
+    upstream = Upstream((1.0, 200))
+
+    with pytest.raises(TimeoutError):
+        await r.call("svc", "GET", upstream.attempt)
+
+    assert upstream.cancelled == 1
+    snapshot = r.snapshot()["svc"]
+    assert snapshot["timeouts"] == 1
+    assert snapshot["breaker"]["consecutive_failures"] == 1
+
+
+@pytest.mark.anyio
+async def test_slow_get_is_hedged_and_the_faster_attempt_wins(policy):
+    r = policy(retries=0, hedge=True, hedge_delay=0.02)
+    upstream = Upstream((1.0, 200), (0, 200))
+
+    response = await r.call("svc", "GET", upstream.attempt, upstream.discard)
+
+    assert response.headers["x-call"] == "2"
+    assert upstream.cancelled == 1
+    snapshot = r.snapshot()["svc"]
+    assert snapshot["hedges"] == 1
+    assert snapshot["hedge_wins"] == 1
+
+
+@pytest.mark.anyio
+async def test_fast_get_is_not_hedged(policy):
+    r = policy(retries=0, hedge=True, hedge_delay=0.5)
+    upstream = Upstream(200)
+
+    await r.call("svc", "GET", upstream.attempt)
+
+    assert upstream.calls == 1
+    assert r.snapshot()["svc"]["hedges"] == 0
+
+
+@pytest.mark.anyio
+async def test_hedge_that_fails_does_not_beat_a_slower_success(policy):
+    r = policy(retries=0, hedge=True, hedge_delay=0.02)
+    upstream = Upstream((0.1, 200), (0, 503))
+
+    response = await r.call("svc", "GET", upstream.attempt, upstream.discard)
+
+    assert response.headers["x-call"] == "1"
+    assert upstream.discarded == [503]
+    assert r.snapshot()["svc"]["hedge_wins"] == 0
+
+
+@pytest.mark.anyio
+async def test_only_gets_are_hedged(policy):
+    r = policy(retries=0, hedge=True, hedge_delay=0.01)
+    upstream = Upstream((0.05, 200))
+
+    await r.call("svc", "PUT", upstream.attempt)
+
+    assert upstream.calls == 1
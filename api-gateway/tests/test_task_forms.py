@@ -0,0 +1,46 @@
+import pytest
+
+import main
+
+
+def render_tasks(tasks, projects, project_names=None):
+    return main.templates.get_template("_tasks.html").render(
+        tasks=tasks, projects=projects, project_names=project_names or {},
+    )
+
+
+def task(project_id):
+    return {"id": 7, "title": "t", "description": "", "is_done": False, "project_id": project_id}
+
+
+def test_project_past_the_listed_ones_stays_selected():
+    html = render_tasks([task(500)], [{"id": 1, "name": "first"}], {500: "late"})
+
+    assert '<option value="500" selected>' in html
+    assert "late" in html
+    assert '<option value="" >' in html
+
+
+def test_project_without_a_known_name_gets_a_placeholder():
+    html = render_tasks([task(500)], [{"id": 1, "name": "first"}])
+
+    assert '<option value="500" selected>' in html
+    assert "Project 500" in html
+
+
+def test_listed_project_is_not_repeated():
+    html = render_tasks([task(1)], [{"id": 1, "name": "first"}])
+
+    assert html.count('value="1"') == 1
+    assert '<option value="" >' in html
+
+
+def test_unassigned_task_selects_the_empty_option():
+    html = render_tasks([task(None)], [{"id": 1, "name": "first"}])
+
+    assert '<option value="" selected>' in html
+
+
+@pytest.mark.parametrize("value, expected", [(None, None), ("", None), (" ", None), ("12", 12), (12, 12)])
+def test_blank_form_project_id_means_unassigned(value, expected):
+    assert main.form_project_id(value) == expected
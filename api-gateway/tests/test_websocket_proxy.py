@@ -0,0 +1,100 @@
+import asyncio
+import threading
+
+import pytest
+import websockets
+from fastapi.testclient import TestClient
+from starlette.websockets import WebSocketDisconnect
+
+import main
+from balancer import LoadBalancer
+from discovery import ServiceInstance
+
+
+class StaticRegistry:
+    def __init__(self, port):
+        self.list = (ServiceInstance(id="comms", address="127.0.0.1", port=port),)
+
+    def instances(self, service_name):
+        return self.list
+
+
+class EchoServer:
+    """Upstream WebSocket that echoes every frame back, typed as it arrived, and closes on "bye"."""
+
+    def __init__(self):
+        self.received = []
+        self._loop = asyncio.new_event_loop()
+        self._ready = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    async def _echo(self, connection):
+        async for message in connection:
+            if message == "bye":
+                await connection.close()
+                return
+            self.received.append(message)
+            await connection.send(message)
+
+    def _run(self):
+        asyncio.set_event_loop(self._loop)
+
+        async def serve():
+            self._server = await websockets.serve(self._echo, "127.0.0.1", 0)
+            self.port = self._server.sockets[0].getsockname()[1]
+            self._ready.set()
+            await self._server.wait_closed()
+
+        self._loop.run_until_complete(serve())
+
+    def start(self):
+        self._thread.start()
+        self._ready.wait(5)
+        return self
+
+    def stop(self):
+        self._loop.call_soon_threadsafe(self._server.close)
+        self._thread.join(5)
+
+
+def hang_up(socket):
+    # Let the upstream end the session, so the proxy closes both sides before the test client tears it down.
+    socket.send_text("bye")
+    with pytest.raises(WebSocketDisconnect):
+        socket.receive_text()
+
+
+@pytest.fixture
+def upstream(monkeypatch):
+    server = EchoServer().start()
+    monkeypatch.setattr(main, "balancer", LoadBalancer(StaticRegistry(server.port)))
+    yield server
+    server.stop()
+
+
+def test_frames_are_relayed_with_their_type(upstream):
+    with TestClient(main.app).websocket_connect("/communication/chat/ws") as socket:
+        socket.send_text("hello")
+        assert socket.receive_text() == "hello"
+        socket.send_bytes(b"\x00\x01")
+        assert socket.receive_bytes() == b"\x00\x01"
+        hang_up(socket)
+
+
+def test_empty_text_frame_is_relayed_as_text(upstream):
+    with TestClient(main.app).websocket_connect("/communication/chat/ws") as socket:
+        socket.send_text("")
+        assert socket.receive_text() == ""
+        hang_up(socket)
+
+    assert upstream.received == [""]
+
+
+def test_upstream_close_ends_the_session_and_releases_the_instance(upstream):
+    with TestClient(main.app).websocket_connect("/communication/chat/ws") as socket:
+        socket.send_text("ping")
+        socket.receive_text()
+        hang_up(socket)
+
+    instance = main.balancer._registry.list[0]
+    assert main.balancer._state(instance).outstanding == 0
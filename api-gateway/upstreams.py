@@ -0,0 +1,163 @@
+import logging
+import os
+
+import httpx
+
+
+def _http2_available() -> bool:
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def upstream_setting(service_name: str, name: str, default):
+    """Read UPSTREAM_<SERVICE>_<NAME>, falling back to UPSTREAM_<NAME> and then `default`."""
+    prefix = service_name.upper().replace("-", "_")
+    value = os.getenv(f"UPSTREAM_{prefix}_{name}", os.getenv(f"UPSTREAM_{name}"))
+    if value is None:
+        return default
+    if isinstance(default, bool):
+        return value.lower() in ("1", "true", "yes")
+    return type(default)(value)
+
+
+def release_on_close(response: httpx.Response, callback):
+    """Call `callback` once the response body has been closed."""
+    response.stream = _MeteredStream(response.stream, callback)
+
+
+class PoolStats:
+    def __init__(self, max_connections: int):
+        self.max_connections = max_connections
+        self.in_use = 0
+        self.requests = 0
+        self.waits = 0
+
+
+class _MeteredStream(httpx.AsyncByteStream):
+    def __init__(self, stream, on_close):
+        self._stream = stream
+        self._on_close = on_close
+
+    async def __aiter__(self):
+        async for chunk in self._stream:
+            yield chunk
+
+    async def aclose(self):
+        try:
+            await self._stream.aclose()
+        finally:
+            if self._on_close is not None:
+                self._on_close()
+                self._on_close = None
+
+
+class MeteredTransport(httpx.AsyncBaseTransport):
+    """Connection-pooling transport that counts in-use connections and pool waits.
+
+    A request counts as in use from send until its response body is closed; a
+    request that starts while every connection is busy is counted as a wait.
+    """
+
+    def __init__(self, limits: httpx.Limits, http2: bool):
+        self._transport = httpx.AsyncHTTPTransport(limits=limits, http2=http2)
+        self.stats = PoolStats(limits.max_connections)
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        stats = self.stats
+        stats.requests += 1
+        if stats.in_use >= stats.max_connections:
+            stats.waits += 1
+        stats.in_use += 1
+        try:
+            response = await self._transport.handle_async_request(request)
+        except BaseException:
+            stats.in_use -= 1
+            raise
+
+        def release():
+            stats.in_use -= 1
+
+        return httpx.Response(
+            status_code=response.status_code,
+            headers=response.headers,
+            stream=_MeteredStream(response.stream, release),
+            extensions=response.extensions,
+        )
+
+    def idle_connections(self) -> int:
+        pool = getattr(self._transport, "_pool", None)
+        connections = getattr(pool, "connections", [])
+        return len([c for c in connections if c.is_idle()])
+
+    def open_connections(self) -> int:
+        pool = getattr(self._transport, "_pool", None)
+        return len(getattr(pool, "connections", []))
+
+    async def aclose(self):
+        await self._transport.aclose()
+
+
+class UpstreamClients:
+    """One long-lived AsyncClient per upstream service, configured from the environment.
+
+    Settings are read as UPSTREAM_<SETTING>, with a per-service override as
+    UPSTREAM_<SERVICE>_<SETTING> (e.g. UPSTREAM_TASK_SERVICE_MAX_CONNECTIONS).
+    Timeouts come from the service's resilience policy.
+    """
+
+    def __init__(self, service_names, policies):
+        self._service_names = list(service_names)
+        self._policies = policies
+        self._clients: dict[str, httpx.AsyncClient] = {}
+        self._transports: dict[str, MeteredTransport] = {}
+
+    def _create(self, service_name: str) -> httpx.AsyncClient:
+        limits = httpx.Limits(
+            max_connections=upstream_setting(service_name, "MAX_CONNECTIONS", 100),
+            max_keepalive_connections=upstream_setting(service_name, "MAX_KEEPALIVE", 20),
+            keepalive_expiry=upstream_setting(service_name, "KEEPALIVE_EXPIRY", 30.0),
+        )
+        timeout = self._policies.policy(service_name).timeout
+        http2 = upstream_setting(service_name, "HTTP2", True)
+        if http2 and not _http2_available():
+            logging.warning("h2 is not installed, upstream clients fall back to HTTP/1.1")
+            http2 = False
+
+        transport = MeteredTransport(limits, http2)
+        self._transports[service_name] = transport
+        return httpx.AsyncClient(transport=transport, timeout=timeout)
+
+    def start(self):
+        for name in self._service_names:
+            if name not in self._clients:
+                self._clients[name] = self._create(name)
+
+    async def close(self):
+        clients = list(self._clients.values())
+        self._clients.clear()
+        self._transports.clear()
+        for client in clients:
+            await client.aclose()
+
+    def get(self, service_name: str) -> httpx.AsyncClient:
+        client = self._clients.get(service_name)
+        if client is None:
+            client = self._clients[service_name] = self._create(service_name)
+        return client
+
+    def stats(self) -> dict:
+        result = {}
+        for name, transport in self._transports.items():
+            stats = transport.stats
+            result[name] = {
+                "max_connections": stats.max_connections,
+                "in_use": stats.in_use,
+                "open_connections": transport.open_connections(),
+                "idle_connections": transport.idle_connections(),
+                "requests": stats.requests,
+                "waits": stats.waits,
+            }
+        return result
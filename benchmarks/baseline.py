@@ -0,0 +1,73 @@
+"""Saving benchmark results and comparing a run against a saved baseline."""
+import json
+import os
+import platform
+import sys
+import time
+
+from db_modes import percentile
+
+
+def summarize(latencies: list[float], duration: float, errors: int = 0) -> dict:
+    return {
+        "requests": len(latencies),
+        "throughput": round(len(latencies) / duration, 2) if duration else 0.0,
+        "p50_ms": round(percentile(latencies, 50) * 1000, 3),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 3),
+        "errors": errors,
+    }
+
+
+def save(path: str, results: dict, settings: dict):
+    document = {
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": sys.version.split()[0],
+        "machine": platform.platform(),
+        "settings": settings,
+        "results": results,
+    }
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    with open(path, "w") as f:
+        json.dump(document, f, indent=2, sort_keys=True)
+
+
+def load(path: str) -> dict:
+    with open(path) as f:
+        return json.load(f)
+
+
+# Metric -> +1 if larger is better, -1 if smaller is better.
+DIRECTIONS = {
+    "throughput": 1,
+    "ops_per_second": 1,
+    "p50_ms": -1,
+    "p95_ms": -1,
+    "p99_ms": -1,
+    "p50_us": -1,
+    "p99_us": -1,
+    "peak_mb": -1,
+}
+
+
+def compare(baseline: dict, results: dict, settings: dict, tolerance: float) -> list[str]:
+    """Print each tracked metric next to the baseline; return the regressions."""
+    if baseline.get("settings") != settings:
+        print(f"note: baseline was recorded with different settings: {baseline.get('settings')}")
+    regressions = []
+    print(f"\n{'benchmark':<32} {'metric':<15} {'baseline':>11} {'current':>11} {'change':>8}")
+    for name, current in results.items():
+        previous = baseline["results"].get(name)
+        if previous is None:
+            continue
+        for metric, direction in DIRECTIONS.items():
+            if metric not in current or not previous.get(metric):
+                continue
+            change = (current[metric] - previous[metric]) / previous[metric]
+            flag = ""
+            if change * direction < -tolerance:
+                flag = "  REGRESSION"
+                regressions.append(f"{name} {metric}: {previous[metric]} -> {current[metric]}")
+            print(f"{name:<32} {metric:<15} {previous[metric]:>11.2f} {current[metric]:>11.2f} {change:>+8.1%}{flag}")
+    return regressions
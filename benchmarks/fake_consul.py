@@ -0,0 +1,158 @@
+"""Minimal in-process stand-in for the Consul agent HTTP API.
+
+Covers what the services use: service registration and deregistration,
+/v1/agent/services and blocking /v1/health/service/<name> queries. Every
+registered instance is reported as passing; health checks are not run.
+
+    python benchmarks/fake_consul.py --port 8500
+"""
+import argparse
+import json
+import re
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+DURATION = re.compile(r"^(\d+(?:\.\d+)?)(ms|s|m)?$")
+UNITS = {"ms": 0.001, "s": 1, "m": 60, None: 1}
+
+
+def parse_wait(value: str | None, default: float = 300.0) -> float:
+    match = DURATION.match(value or "")
+    if not match:
+        return default
+    return float(match.group(1)) * UNITS[match.group(2)]
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # Watchers disconnecting mid blocking query are routine, not worth a traceback.
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+
+class FakeConsul:
+    def __init__(self, port: int = 8500, host: str = "127.0.0.1"):
+        self._services: dict[str, dict] = {}
+        self._index = 1
+        self._cond = threading.Condition()
+        self._server = _Server((host, port), self._handler())
+        # Port 0 picks a free port.
+        self.port = self._server.server_address[1]
+        self.address = f"{host}:{self.port}"
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, name="fake-consul", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        with self._cond:
+            self._index += 1
+            self._cond.notify_all()
+        self._server.shutdown()
+        self._server.server_close()
+
+    def register(self, name: str, service_id: str, address: str, port: int):
+        with self._cond:
+            self._services[service_id] = {"ID": service_id, "Service": name, "Address": address, "Port": port}
+            self._index += 1
+            self._cond.notify_all()
+
+    def deregister(self, service_id: str):
+        with self._cond:
+            self._services.pop(service_id, None)
+            self._index += 1
+            self._cond.notify_all()
+
+    def services(self) -> dict[str, dict]:
+        with self._cond:
+            return dict(self._services)
+
+    def _health(self, name: str, index: int, wait: float):
+        deadline = time.monotonic() + wait
+        with self._cond:
+            while index and self._index <= index:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+            entries = [
+                {"Node": {"Node": "bench", "Address": "127.0.0.1"}, "Service": service, "Checks": []}
+                for service in self._services.values()
+                if service["Service"] == name
+            ]
+            return self._index, entries
+
+    def _handler(self):
+        consul = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def _reply(self, body, index=None, status=200):
+                data = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                if index is not None:
+                    self.send_header("X-Consul-Index", str(index))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_GET(self):
+                url = urlparse(self.path)
+                query = parse_qs(url.query)
+                if url.path.startswith("/v1/health/service/"):
+                    index = int(query.get("index", ["0"])[0])
+                    wait = parse_wait(query.get("wait", [None])[0])
+                    index, entries = consul._health(url.path.rsplit("/", 1)[1], index, wait)
+                    self._reply(entries, index)
+                elif url.path == "/v1/agent/services":
+                    self._reply(consul.services())
+                elif url.path == "/v1/status/leader":
+                    self._reply(consul.address)
+                else:
+                    self._reply({"error": "not found"}, status=404)
+
+            def do_PUT(self):
+                url = urlparse(self.path)
+                length = int(self.headers.get("Content-Length") or 0)
+                body = json.loads(self.rfile.read(length) or b"{}")
+                if url.path == "/v1/agent/service/register":
+                    fields = {key.lower(): value for key, value in body.items()}
+                    consul.register(
+                        fields["name"], fields.get("id") or fields["name"], fields.get("address") or "127.0.0.1",
+                        fields.get("port"),
+                    )
+                elif url.path.startswith("/v1/agent/service/deregister/"):
+                    consul.deregister(url.path.rsplit("/", 1)[1])
+                else:
+                    self._reply({"error": "not found"}, status=404)
+                    return
+                self._reply(True)
+
+        return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8500)
+    args = parser.parse_args()
+    consul = FakeConsul(args.port, args.host).start()
+    print(f"fake Consul listening on {consul.address}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        consul.stop()
+
+
+if __name__ == "__main__":
+    main()
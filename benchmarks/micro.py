@@ -0,0 +1,262 @@
+"""Micro-benchmarks for the hot paths of individual services.
+
+Each benchmark runs in its own interpreter with the service directory on
+the import path (the services share module names such as main and
+telemetry) and calls the code in-process:
+
+  discover_service      gateway instance lookup: registry table + load balancer pick/release
+  gateway               the gateway proxy route over ASGI, to a stub upstream on localhost
+  get_comments          communication-service comment page, called directly and over ASGI
+  delete_schedule_item  schedule-service delete with its SQLite write-through
+
+    python benchmarks/micro.py --iterations 5000 --save-baseline benchmarks/micro-baseline.json
+    python benchmarks/micro.py --baseline benchmarks/micro-baseline.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import baseline
+from db_modes import ROOT, percentile
+from fake_consul import FakeConsul
+
+TASKS_BODY = json.dumps([
+    {"id": i, "title": f"task {i}", "description": "", "project_id": i % 7, "is_done": False} for i in range(50)
+]).encode()
+
+
+def summarize(samples: list[float]) -> dict:
+    total = sum(samples)
+    return {
+        "iterations": len(samples),
+        "ops_per_second": round(len(samples) / total, 1) if total else 0.0,
+        "mean_us": round(total / len(samples) * 1e6, 2),
+        "p50_us": round(percentile(samples, 50) * 1e6, 2),
+        "p99_us": round(percentile(samples, 99) * 1e6, 2),
+    }
+
+
+def measure(fn, iterations: int, warmup: int) -> dict:
+    for _ in range(warmup):
+        fn()
+    samples = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - started)
+    return summarize(samples)
+
+
+async def measure_async(fn, iterations: int, warmup: int) -> dict:
+    for _ in range(warmup):
+        await fn()
+    samples = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        await fn()
+        samples.append(time.perf_counter() - started)
+    return summarize(samples)
+
+
+async def stub_upstream(scope, receive, send):
+    if scope["type"] != "http":
+        return
+    await send({"type": "http.response.start", "status": 200, "headers": [(b"content-type", b"application/json")]})
+    await send({"type": "http.response.body", "body": TASKS_BODY})
+
+
+def serve_stub(port: int):
+    import uvicorn
+
+    server = uvicorn.Server(uvicorn.Config(stub_upstream, port=port, log_level="warning", lifespan="off"))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+    return server
+
+
+def bench_discover_service(args) -> dict:
+    from consul import Consul
+    from balancer import LoadBalancer
+    from discovery import ServiceRegistry
+
+    consul = FakeConsul(args.consul_port).start()
+    for port in range(9001, 9004):
+        consul.register("task-service", f"task-service-{port}", "127.0.0.1", port)
+    registry = ServiceRegistry(Consul())
+    registry.start(["task-service"])
+    balancer = LoadBalancer(registry)
+
+    def lookup():
+        instance = balancer.acquire("task-service")
+        balancer.release("task-service", instance)
+
+    # The fake Consul is left running: watchers still blocked on it would log errors, and it dies with this process.
+    try:
+        return {"discover_service": measure(lookup, args.iterations, args.warmup)}
+    finally:
+        registry.stop()
+
+
+def bench_gateway(args) -> dict:
+    import httpx
+
+    consul = FakeConsul(args.consul_port).start()
+    server = serve_stub(args.upstream_port)
+    consul.register("task-service", "task-service-stub", "127.0.0.1", args.upstream_port)
+    import main
+
+    main.startup_event()
+
+    async def run():
+        gateway = httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url="http://gateway")
+        direct = httpx.AsyncClient(base_url=f"http://127.0.0.1:{args.upstream_port}")
+        async with gateway, direct:
+            results = {
+                "gateway": await measure_async(
+                    lambda: gateway.get("/tasks/tasks", params={"limit": 50}), args.iterations, args.warmup,
+                ),
+                # The same request without the gateway, to read the proxy's own cost off the difference.
+                "gateway:upstream_direct": await measure_async(
+                    lambda: direct.get("/tasks", params={"limit": 50}), args.iterations, args.warmup,
+                ),
+            }
+        await main.shutdown_event()
+        return results
+
+    try:
+        return asyncio.run(run())
+    finally:
+        server.should_exit = True
+
+
+def bench_get_comments(args) -> dict:
+    import httpx
+    from fastapi import Request, Response
+
+    import main
+
+    posts = 100
+    for i in range(1, 20001):
+        main.comments.append(i, {"id": i, "post_id": i % posts, "author": "bench", "content": f"comment {i}"})
+    rng = random.Random(1)
+    request = Request({"type": "http", "method": "GET", "headers": [], "query_string": b""})
+
+    def direct():
+        main.get_comments(rng.randrange(posts), request, Response(), limit=50, before=None, after=None, since=None)
+
+    async def over_asgi():
+        client = httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url="http://comms")
+        async with client:
+            return await measure_async(
+                lambda: client.get(f"/comments/{rng.randrange(posts)}", params={"limit": 50}),
+                args.iterations, args.warmup,
+            )
+
+    return {
+        "get_comments": measure(direct, args.iterations, args.warmup),
+        "get_comments:http": asyncio.run(over_asgi()),
+    }
+
+
+def bench_delete_schedule_item(args) -> dict:
+    from datetime import datetime, timedelta
+
+    import main
+
+    count = args.iterations + args.warmup
+    start = datetime.utcnow() + timedelta(days=1)
+    for i in range(1, count + 1):
+        main.add_schedule_item(main.ScheduleItem(
+            id=i, title=f"meeting {i}", datetime=start + timedelta(minutes=i), description="", related_task_id=i,
+        ))
+    ids = iter(range(1, count + 1))
+    return {"delete_schedule_item": measure(lambda: main.delete_schedule_item(next(ids)), args.iterations, args.warmup)}
+
+
+BENCHMARKS = {
+    "discover_service": ("api-gateway", bench_discover_service),
+    "gateway": ("api-gateway", bench_gateway),
+    "get_comments": ("communication-service", bench_get_comments),
+    "delete_schedule_item": ("schedule-service", bench_delete_schedule_item),
+}
+
+
+def run_child(name, args) -> dict:
+    service, _ = BENCHMARKS[name]
+    with tempfile.TemporaryDirectory(prefix="bench-micro-") as workdir:
+        env = dict(os.environ)
+        env.update({
+            "CONSUL_HTTP_ADDR": f"127.0.0.1:{args.consul_port}",
+            "GATEWAY_RATE_LIMIT": "1000000",
+            "SCHEDULE_DB_PATH": os.path.join(workdir, "schedule.db"),
+            "COMM_STORAGE": "memory",
+            "PYTHONDONTWRITEBYTECODE": "1",
+        })
+        command = [
+            sys.executable, os.path.abspath(__file__), "--child", name,
+            "--iterations", str(args.iterations), "--warmup", str(args.warmup),
+            "--consul-port", str(args.consul_port), "--upstream-port", str(args.upstream_port),
+        ]
+        completed = subprocess.run(
+            command, cwd=os.path.join(ROOT, service), env=env, stdout=subprocess.PIPE, check=True,
+        )
+    return json.loads(completed.stdout.decode().strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--benchmarks", default=",".join(BENCHMARKS), help="comma-separated subset of: " + ", ".join(BENCHMARKS))
+    parser.add_argument("--iterations", type=int, default=2000)
+    parser.add_argument("--warmup", type=int, default=200)
+    parser.add_argument("--consul-port", type=int, default=18600)
+    parser.add_argument("--upstream-port", type=int, default=18601)
+    parser.add_argument("--save-baseline", metavar="PATH")
+    parser.add_argument("--baseline", metavar="PATH", help="compare against a saved baseline")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed relative regression")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        sys.path.insert(0, os.getcwd())
+        print(json.dumps(BENCHMARKS[args.child][1](args)))
+        return
+
+    names = [name.strip() for name in args.benchmarks.split(",") if name.strip()]
+    unknown = [name for name in names if name not in BENCHMARKS]
+    if unknown:
+        parser.error(f"unknown benchmarks: {', '.join(unknown)}")
+
+    results = {}
+    for name in names:
+        results.update(run_child(name, args))
+
+    print(f"{'benchmark':<26} {'iterations':>10} {'ops/s':>10} {'mean us':>10} {'p50 us':>10} {'p99 us':>10}")
+    for name, row in results.items():
+        print(
+            f"{name:<26} {row['iterations']:>10} {row['ops_per_second']:>10.1f} {row['mean_us']:>10.1f} "
+            f"{row['p50_us']:>10.1f} {row['p99_us']:>10.1f}"
+        )
+
+    settings = {"benchmarks": names, "iterations": args.iterations, "warmup": args.warmup}
+    if args.save_baseline:
+        baseline.save(args.save_baseline, results, settings)
+        print(f"\nsaved baseline to {args.save_baseline}")
+    if args.baseline:
+        regressions = baseline.compare(baseline.load(args.baseline), results, settings, args.tolerance)
+        if regressions:
+            print(f"\n{len(regressions)} regression(s) beyond {args.tolerance:.0%}:")
+            for regression in regressions:
+                print(f"  {regression}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+import asyncio
+import json
+import os
+
+from starlette.concurrency import run_in_threadpool
+
+
+class Frame:
+    """A chat message serialized once and shared by every subscriber."""
+
+    __slots__ = ("id", "json", "sse")
+
+    def __init__(self, record: dict):
+        self.id = record["id"]
+        self.json = json.dumps(record, separators=(",", ":"))
+        self.sse = f"id: {self.id}\nevent: message\ndata: {self.json}\n\n".encode()
+
+
+# Queued to a subscriber that is being disconnected for falling behind.
+CLOSE = object()
+
+
+class Subscriber:
+    __slots__ = ("room", "queue", "dropped")
+
+    def __init__(self, room: str, size: int):
+        self.room = room
+        self.queue = asyncio.Queue(maxsize=size)
+        self.dropped = 0
+
+
+class ChatHub:
+    """Fans chat messages out to WebSocket and SSE subscribers by room.
+
+    Each subscriber has a bounded queue. When it is full, the
+    CHAT_SLOW_CONSUMER_POLICY decides what happens: "drop_oldest" discards
+    the oldest queued message, and "disconnect" closes the subscriber, which
+    can reconnect and resume from its last-seen id.
+    """
+
+    def __init__(self, buffer_size: int | None = None, policy: str | None = None,
+                 keepalive: float | None = None, replay_batch: int = 200):
+        self._buffer_size = buffer_size or int(os.getenv("CHAT_SUBSCRIBER_BUFFER", 256))
+        self._policy = policy or os.getenv("CHAT_SLOW_CONSUMER_POLICY", "drop_oldest")
+        self.keepalive = keepalive or float(os.getenv("CHAT_KEEPALIVE_SECONDS", 15))
+        self._replay_batch = replay_batch
+        self._rooms: dict[str, set[Subscriber]] = {}
+        self._loop = None
+        self.published = 0
+        self.dropped = 0
+        self.disconnected = 0
+
+    def bind(self, loop: asyncio.AbstractEventLoop):
+        self._loop = loop
+
+    def subscribe(self, room: str) -> Subscriber:
+        subscriber = Subscriber(room, self._buffer_size)
+        self._rooms.setdefault(room, set()).add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber: Subscriber):
+        subscribers = self._rooms.get(subscriber.room)
+        if subscribers is not None:
+            subscribers.discard(subscriber)
+            if not subscribers:
+                del self._rooms[subscriber.room]
+
+    def publish_threadsafe(self, room: str, record: dict):
+        """Publish from a worker thread; serialization happens in the caller."""
+        if self._loop is not None and room in self._rooms:
+            self._loop.call_soon_threadsafe(self.publish, room, Frame(record))
+
+    def publish(self, room: str, frame: Frame):
+        self.published += 1
+        for subscriber in list(self._rooms.get(room, ())):
+            try:
+                subscriber.queue.put_nowait(frame)
+            except asyncio.QueueFull:
+                if self._policy == "disconnect":
+                    self._disconnect(subscriber)
+                else:
+                    subscriber.queue.get_nowait()
+                    subscriber.queue.put_nowait(frame)
+                    subscriber.dropped += 1
+                    self.dropped += 1
+
+    def _disconnect(self, subscriber: Subscriber):
+        self.unsubscribe(subscriber)
+        while not subscriber.queue.empty():
+            subscriber.queue.get_nowait()
+        subscriber.queue.put_nowait(CLOSE)
+        self.disconnected += 1
+
+    async def stream(self, room: str, last_id: int | None, replay):
+        """Yield frames for `room`, first replaying stored messages after `last_id`.
+
+        `replay(after, limit)` loads stored messages oldest first. The
+        subscription starts before the replay so nothing published meanwhile
+        is missed; queued frames already covered by the replay are skipped.
+        Yields None when nothing arrived for `keepalive` seconds.
+        """
+        subscriber = self.subscribe(room)
+        try:
+            replayed = None
+            if last_id is not None:
+                replayed = last_id
+                while True:
+                    backlog = await run_in_threadpool(replay, replayed, self._replay_batch)
+                    for record in backlog:
+                        yield Frame(record)
+                        replayed = record["id"]
+                    if len(backlog) < self._replay_batch:
+                        break
+            while True:
+                try:
+                    frame = await asyncio.wait_for(subscriber.queue.get(), self.keepalive)
+                except asyncio.TimeoutError:
+                    yield None
+                    continue
+                if frame is CLOSE:
+                    return
+                if replayed is not None and frame.id <= replayed:
+                    continue
+                yield frame
+        finally:
+            self.unsubscribe(subscriber)
+
+    def stats(self) -> dict:
+        return {
+            "rooms": len(self._rooms),
+            "subscribers": sum(len(s) for s in self._rooms.values()),
+            "published": self.published,
+            "dropped": self.dropped,
+            "disconnected": self.disconnected,
+            "policy": self._policy,
+        }
@@ -1,14 +1,40 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Query, Request, Response, WebSocket
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 from typing import List, Optional
+from contextlib import aclosing
+from consul import Consul
+from storage import open_backend
+from fanout import ChatHub
+from telemetry import Telemetry, TelemetryMiddleware
+import asyncio
+import logging
+import os
+import socket
+import uuid
+
+CONSUL_HOST = os.getenv("CONSUL_HOST", "localhost")
+SERVICE_NAME = os.getenv("SERVICE_NAME", "communication-service")
+SERVICE_PORT = int(os.getenv("SERVICE_PORT", 8005))
+
+consul_client = Consul(host=CONSUL_HOST)
+telemetry = Telemetry(SERVICE_NAME)
 
 app = FastAPI()
+app.add_middleware(TelemetryMiddleware, telemetry=telemetry)
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+MAX_SEARCH_RESULTS = 100
+# Collection versions restart with the process, so ETags also carry a per-process epoch.
+ETAG_EPOCH = uuid.uuid4().hex[:8]
 
 
 class Message(BaseModel):
     id: int
     author: str
     content: str
+    room: str = "general"
 
 class ForumPost(BaseModel):
     id: int
@@ -23,35 +49,218 @@ class Comment(BaseModel):
     content: str
 
 
-messages: List[Message] = []
-forum_posts: List[ForumPost] = []
-comments: List[Comment] = []
+storage = open_backend()
+messages = storage.collection("chat")
+messages.index_by("room", default="general")
+forum_posts = storage.collection("forum")
+forum_posts.index_text("text", {"title": 2.0, "content": 1.0})
+comments = storage.collection("comments")
+comments.index_by("post_id")
+comments.index_text("text", {"content": 1.0})
+SEARCH_SOURCES = {"forum_post": forum_posts, "comment": comments}
+hub = ChatHub()
+
+
+def get_service_ip():
+    try:
+        return socket.gethostbyname(SERVICE_NAME)
+    except:
+        return "127.0.0.1"
+
+
+@app.on_event("startup")
+async def startup_event():
+    storage.start()
+    hub.bind(asyncio.get_running_loop())
+    telemetry.start()
+
+    service_ip = get_service_ip()
+    service_id = f"{SERVICE_NAME}-{service_ip}-{SERVICE_PORT}"
+
+    try:
+        consul_client.agent.service.register(
+            name=SERVICE_NAME,
+            service_id=service_id,
+            address=service_ip,
+            port=SERVICE_PORT,
+            check={
+                "name": "HTTP API Check",
+                "http": f"http://{service_ip}:{SERVICE_PORT}/health",
+                "interval": "10s",
+                "timeout": "5s"
+            }
+        )
+        logging.info(f"Successfully registered with Consul as {SERVICE_NAME}")
+    except Exception as e:
+        logging.error(f"Failed to register with Consul: {str(e)}")
+
+@app.on_event("shutdown")
+def shutdown_event():
+    storage.close()
+    telemetry.stop()
+    service_ip = get_service_ip()
+    service_id = f"{SERVICE_NAME}-{service_ip}-{SERVICE_PORT}"
+
+    try:
+        consul_client.agent.service.deregister(service_id)
+        logging.info("Successfully unregistered from Consul")
+    except Exception as e:
+        logging.error(f"Failed to unregister from Consul: {str(e)}")
+
+
+def etag_matches(if_none_match: str | None, etag: str) -> bool:
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    return etag in (tag.strip().removeprefix("W/") for tag in if_none_match.split(","))
+
+def collection_etag(name: str, collection, request: Request, response: Response):
+    """Set the ETag for the collection's version, or return a 304 if the client has it."""
+    etag = f'"{name}.{ETAG_EPOCH}.{collection.version}"'
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers={"ETag": etag})
+    response.headers.update({"ETag": etag, "Cache-Control": "no-cache"})
+    return None
+
+
+def read_page(collection, limit, before, after, since, field=None, value=None):
+    if since is not None:
+        return collection.since(since, limit, field, value)
+    return collection.page(limit, before, after, field, value)
+
 
 @app.get("/chat", response_model=List[Message])
-def get_messages():
-    return messages
+def get_messages(
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    before: Optional[int] = None,
+    after: Optional[int] = None,
+    since: Optional[int] = None,
+    room: Optional[str] = None,
+):
+    if room is None:
+        return read_page(messages, limit, before, after, since)
+    return read_page(messages, limit, before, after, since, "room", room)
 
 @app.post("/chat", response_model=Message)
 def send_message(msg: Message):
-    messages.append(msg)
+    record = msg.dict()
+    messages.append(msg.id, record)
+    hub.publish_threadsafe(msg.room, record)
     return msg
 
 
+def room_history(room: str):
+    return lambda after, limit: messages.since(after, limit, "room", room)
+
+@app.get("/chat/stream")
+async def stream_messages(request: Request, room: str = "general", last_id: Optional[int] = None):
+    last_event_id = request.headers.get("last-event-id")
+    if last_id is None and last_event_id and last_event_id.isdigit():
+        last_id = int(last_event_id)
+
+    async def events():
+        async with aclosing(hub.stream(room, last_id, room_history(room))) as frames:
+            async for frame in frames:
+                yield b": keepalive\n\n" if frame is None else frame.sse
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@app.websocket("/chat/ws")
+async def chat_socket(websocket: WebSocket, room: str = "general", last_id: Optional[int] = None):
+    await websocket.accept()
+
+    async def send_frames():
+        async with aclosing(hub.stream(room, last_id, room_history(room))) as frames:
+            async for frame in frames:
+                if frame is not None:
+                    await websocket.send_text(frame.json)
+        # The hub ended the stream because this subscriber fell behind.
+        await websocket.close(code=1013)
+
+    sender = asyncio.create_task(send_frames())
+    try:
+        while (await websocket.receive())["type"] != "websocket.disconnect":
+            pass
+    finally:
+        sender.cancel()
+
+@app.get("/chat/subscribers")
+def chat_subscribers():
+    return hub.stats()
+
+
 @app.get("/forum", response_model=List[ForumPost])
-def get_forum_posts():
-    return forum_posts
+def get_forum_posts(
+    request: Request,
+    response: Response,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    before: Optional[int] = None,
+    after: Optional[int] = None,
+    since: Optional[int] = None,
+):
+    not_modified = collection_etag("forum", forum_posts, request, response)
+    if not_modified:
+        return not_modified
+    return read_page(forum_posts, limit, before, after, since)
 
 @app.post("/forum", response_model=ForumPost)
 def add_forum_post(post: ForumPost):
-    forum_posts.append(post)
+    forum_posts.append(post.id, post.dict())
     return post
 
 
 @app.get("/comments/{post_id}", response_model=List[Comment])
-def get_comments(post_id: int):
-    return [c for c in comments if c.post_id == post_id]
+def get_comments(
+    post_id: int,
+    request: Request,
+    response: Response,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    before: Optional[int] = None,
+    after: Optional[int] = None,
+    since: Optional[int] = None,
+):
+    not_modified = collection_etag("comments", comments, request, response)
+    if not_modified:
+        return not_modified
+    return read_page(comments, limit, before, after, since, "post_id", post_id)
 
 @app.post("/comments", response_model=Comment)
 def add_comment(comment: Comment):
-    comments.append(comment)
+    comments.append(comment.id, comment.dict())
     return comment
+
+
+@app.get("/search")
+def search(
+    q: str = Query(..., min_length=1, max_length=200),
+    limit: int = Query(20, ge=1, le=MAX_SEARCH_RESULTS),
+    offset: int = Query(0, ge=0, le=MAX_SEARCH_RESULTS),
+):
+    hits = [
+        {"type": kind, "id": record["id"], "score": round(score, 6), "data": record}
+        for kind, collection in SEARCH_SOURCES.items()
+        for score, record in collection.search("text", q, offset + limit + 1)
+    ]
+    hits.sort(key=lambda hit: -hit["score"])
+    hits = hits[offset:offset + limit + 1]
+    return {"results": hits[:limit], "has_more": len(hits) > limit}
+
+
+@app.get("/storage/stats")
+def storage_stats():
+    return storage.stats()
+
+
+@app.get("/metrics", include_in_schema=False)
+def prometheus_metrics():
+    return Response(telemetry.render(), media_type="text/plain; version=0.0.4")
+
+
+@app.get("/health")
+def health_check():
+    return {"status": "UP"}
@@ -0,0 +1,683 @@
+import heapq
+import json
+import logging
+import math
+import mmap
+import os
+import re
+import struct
+import threading
+import time
+import zlib
+from collections import Counter
+
+from sortedcontainers import SortedList
+
+
+# payload length, crc32, key, timestamp, flags
+HEADER = struct.Struct("<IIqdB")
+# the part of the header covered by the checksum
+CHECKED = struct.Struct("<qdB")
+TOMBSTONE = 1
+TOKEN = re.compile(r"\w+")
+
+
+def tokenize(text) -> list[str]:
+    return [token.lower() for token in TOKEN.findall(text or "")]
+
+
+class SortedKeys:
+    """Record keys in ascending order; adding or removing any key is O(log n)."""
+
+    def __init__(self):
+        self._keys = SortedList()
+
+    def add(self, key: int):
+        if key not in self._keys:
+            self._keys.add(key)
+
+    def remove(self, key: int):
+        self._keys.discard(key)
+
+    def page(self, limit: int, before: int | None = None, after: int | None = None) -> list[int]:
+        """Up to `limit` keys, newest first, below `before` or just above `after`."""
+        keys = self._keys
+        if before is not None:
+            hi = keys.bisect_left(before)
+            return keys[max(0, hi - limit):hi][::-1]
+        if after is not None:
+            lo = keys.bisect_right(after)
+            return keys[lo:lo + limit][::-1]
+        return keys[-limit:][::-1]
+
+    def since(self, after: int, limit: int) -> list[int]:
+        """Up to `limit` keys above `after`, oldest first."""
+        lo = self._keys.bisect_right(after)
+        return self._keys[lo:lo + limit]
+
+    def __iter__(self):
+        return iter(self._keys)
+
+    def __len__(self):
+        return len(self._keys)
+
+
+class FieldIndex:
+    """Keys grouped by the value of one record field."""
+
+    def __init__(self, field: str, default=None):
+        self.field = field
+        self.default = default
+        self._keys: dict[object, SortedKeys] = {}
+
+    def add(self, key: int, record: dict):
+        self._keys.setdefault(record.get(self.field, self.default), SortedKeys()).add(key)
+
+    def discard(self, key: int, record: dict):
+        value = record.get(self.field, self.default)
+        keys = self._keys.get(value)
+        if keys is not None:
+            keys.remove(key)
+            if not keys:
+                del self._keys[value]
+
+    def keys(self, value) -> SortedKeys:
+        return self._keys.get(value) or SortedKeys()
+
+
+class TextIndex:
+    """Inverted index over weighted text fields, ranked with BM25.
+
+    Postings map each term to the keys containing it, with the term's
+    weighted frequency. Terms are also kept sorted, so a query word matches
+    every term it is a prefix of. Every query word must match; scores are
+    squashed into 0..1 as score / (score + 1).
+    """
+
+    K1 = 1.2
+    B = 0.75
+    MAX_EXPANSIONS = 50
+
+    def __init__(self, fields: dict[str, float]):
+        self.fields = fields
+        self._postings: dict[str, dict[int, float]] = {}
+        self._terms = SortedList()
+        self._lengths: dict[int, float] = {}
+        self._total_length = 0.0
+
+    def _counts(self, record: dict) -> Counter:
+        counts = Counter()
+        for field, weight in self.fields.items():
+            for token in tokenize(record.get(field)):
+                counts[token] += weight
+        return counts
+
+    def add(self, key: int, record: dict):
+        counts = self._counts(record)
+        for term, frequency in counts.items():
+            postings = self._postings.get(term)
+            if postings is None:
+                postings = self._postings[term] = {}
+                self._terms.add(term)
+            postings[key] = frequency
+        length = sum(counts.values())
+        self._lengths[key] = length
+        self._total_length += length
+
+    def discard(self, key: int, record: dict):
+        for term in self._counts(record):
+            postings = self._postings.get(term)
+            if postings is None:
+                continue
+            postings.pop(key, None)
+            if not postings:
+                del self._postings[term]
+                self._terms.remove(term)
+        self._total_length -= self._lengths.pop(key, 0.0)
+
+    def _expand(self, prefix: str) -> list[str]:
+        """Terms starting with `prefix`: the word itself, then the ones in the most documents.
+
+        Past MAX_EXPANSIONS, keeping the commonest completions rather than
+        the alphabetically first means a short prefix still finds the words
+        most records contain.
+        """
+        terms = []
+        for term in self._terms.irange(minimum=prefix):
+            if not term.startswith(prefix):
+                break
+            terms.append(term)
+        if len(terms) <= self.MAX_EXPANSIONS:
+            return terms
+        return heapq.nsmallest(
+            self.MAX_EXPANSIONS,
+            terms,
+            key=lambda term: (term != prefix, -len(self._postings[term]), term),
+        )
+
+    def search(self, query: str, limit: int) -> list[tuple[int, float]]:
+        """The best `limit` (key, score) pairs, highest score first."""
+        words = tokenize(query)
+        if not words or not self._lengths:
+            return []
+        documents = len(self._lengths)
+        average_length = self._total_length / documents or 1.0
+        scores = None
+        for word in words:
+            word_scores = {}
+            for term in self._expand(word):
+                postings = self._postings[term]
+                idf = math.log(1 + (documents - len(postings) + 0.5) / (len(postings) + 0.5))
+                for key, frequency in postings.items():
+                    norm = self.K1 * (1 - self.B + self.B * self._lengths[key] / average_length)
+                    score = idf * frequency * (self.K1 + 1) / (frequency + norm)
+                    # A word scores by its best completion, not by how many it has.
+                    if score > word_scores.get(key, 0.0):
+                        word_scores[key] = score
+            if scores is None:
+                scores = word_scores
+            else:
+                scores = {key: score + word_scores[key] for key, score in scores.items() if key in word_scores}
+            if not scores:
+                return []
+        best = heapq.nsmallest(limit, scores.items(), key=lambda item: (-item[1], item[0]))
+        return [(key, score / (score + 1)) for key, score in best]
+
+
+class Collection:
+    """Key ordering and secondary indexes shared by the storage backends.
+
+    Subclasses call `_indexed` whenever a key's record changes, and provide
+    `_records(keys)` to load records for a list of keys. `version` counts
+    changes since the process started.
+    """
+
+    def __init__(self):
+        self._order = SortedKeys()
+        self._fields: dict[str, FieldIndex] = {}
+        self.version = 0
+
+    def _indexed(self, key: int, old: dict | None, new: dict | None):
+        self.version += 1
+        for index in self._fields.values():
+            if old is not None:
+                index.discard(key, old)
+            if new is not None:
+                index.add(key, new)
+
+    def index_by(self, field: str, default=None):
+        """Maintain an index on `field`, built once from the stored records.
+
+        Records without the field are indexed under `default`.
+        """
+        with self._lock:
+            if field not in self._fields:
+                index = FieldIndex(field, default)
+                keys = list(self._order)
+                for key, record in zip(keys, self._records(keys)):
+                    index.add(key, record)
+                self._fields[field] = index
+
+    def index_text(self, name: str, fields: dict[str, float]):
+        """Maintain a full-text index named `name` over `fields` (field -> weight)."""
+        with self._lock:
+            if name not in self._fields:
+                index = TextIndex(fields)
+                keys = list(self._order)
+                for key, record in zip(keys, self._records(keys)):
+                    index.add(key, record)
+                self._fields[name] = index
+
+    def search(self, name: str, query: str, limit: int) -> list[tuple[float, dict]]:
+        with self._lock:
+            hits = self._fields[name].search(query, limit)
+            return list(zip((score for _, score in hits), self._records([key for key, _ in hits])))
+
+    def _keys_for(self, field: str | None, value) -> SortedKeys:
+        return self._order if field is None else self._fields[field].keys(value)
+
+    def page(self, limit: int, before: int | None = None, after: int | None = None,
+             field: str | None = None, value=None) -> list[dict]:
+        with self._lock:
+            return self._records(self._keys_for(field, value).page(limit, before, after))
+
+    def since(self, after: int, limit: int, field: str | None = None, value=None) -> list[dict]:
+        with self._lock:
+            return self._records(self._keys_for(field, value).since(after, limit))
+
+
+class MemoryCollection(Collection):
+    """Records kept in a dict; lost on restart."""
+
+    def __init__(self):
+        super().__init__()
+        self._records_by_key = {}
+        self._lock = threading.RLock()
+
+    def append(self, key: int, record: dict):
+        with self._lock:
+            old = self._records_by_key.get(key)
+            self._records_by_key[key] = record
+            if old is None:
+                self._order.add(key)
+            self._indexed(key, old, record)
+
+    def delete(self, key: int):
+        with self._lock:
+            old = self._records_by_key.pop(key, None)
+            if old is not None:
+                self._order.remove(key)
+                self._indexed(key, old, None)
+
+    def get(self, key: int):
+        return self._records_by_key.get(key)
+
+    def _records(self, keys) -> list[dict]:
+        return [self._records_by_key[key] for key in keys]
+
+    def scan(self) -> list[dict]:
+        with self._lock:
+            return list(self._records_by_key.values())
+
+    def __len__(self):
+        return len(self._records_by_key)
+
+    def stats(self) -> dict:
+        return {"records": len(self._records_by_key)}
+
+
+class MemoryBackend:
+    def __init__(self):
+        self._collections = {}
+
+    def collection(self, name: str) -> MemoryCollection:
+        return self._collections.setdefault(name, MemoryCollection())
+
+    def start(self):
+        pass
+
+    def close(self):
+        pass
+
+    def stats(self) -> dict:
+        return {"backend": "memory", "collections": {n: c.stats() for n, c in self._collections.items()}}
+
+
+class _Segment:
+    __slots__ = ("number", "path", "size", "records", "live", "tombstones", "max_ts", "_map")
+
+    def __init__(self, directory: str, number: int):
+        self.number = number
+        self.path = os.path.join(directory, f"{number:020d}.log")
+        self.size = 0
+        self.records = 0
+        self.live = 0
+        self.tombstones = 0
+        self.max_ts = 0.0
+        self._map = None
+
+    def view(self):
+        if self._map is None:
+            with open(self.path, "rb") as f:
+                self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return self._map
+
+    def close(self):
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+
+    def headers(self):
+        """Yield (offset, length, key, ts, flags) for each record without decoding payloads."""
+        if not self.size:
+            return
+        view = self.view()
+        offset = 0
+        while offset < self.size:
+            length, _, key, ts, flags = HEADER.unpack_from(view, offset)
+            yield offset, HEADER.size + length, key, ts, flags
+            offset += HEADER.size + length
+
+
+class SegmentLog(Collection):
+    """Append-only log of JSON records split into fixed-size segment files.
+
+    Records are framed as a header (length, crc32, key, timestamp, flags)
+    followed by the JSON payload. Only the newest segment is written to;
+    older segments are sealed and read through mmap. An in-memory index maps
+    each live key to the segment, offset and length of its latest record, so
+    RAM grows with the number of keys rather than with payload size.
+
+    On startup the index is rebuilt from record headers alone; only the
+    active segment's checksums are verified, and a torn tail left by a crash
+    is truncated.
+    """
+
+    def __init__(self, directory: str, segment_bytes: int, fsync_always: bool = False):
+        super().__init__()
+        self._directory = directory
+        self._segment_bytes = segment_bytes
+        self._fsync_always = fsync_always
+        self._segments: dict[int, _Segment] = {}
+        self._index: dict[int, tuple[int, int, int]] = {}
+        self._lock = threading.RLock()
+        self._active = None
+        self._fd = None
+        self._read_fd = None
+        self._read_segment = None
+        self._dirty = False
+        self.compactions = 0
+        self.dropped_segments = 0
+        os.makedirs(directory, exist_ok=True)
+        self._recover()
+
+    def _recover(self):
+        for name in os.listdir(self._directory):
+            if name.endswith(".compact"):
+                os.remove(os.path.join(self._directory, name))
+        numbers = sorted(int(name[:-4]) for name in os.listdir(self._directory) if name.endswith(".log"))
+        for number in numbers:
+            segment = _Segment(self._directory, number)
+            self._segments[number] = segment
+            self._load(segment, verify=number == numbers[-1])
+        if numbers:
+            self._active = self._segments[numbers[-1]]
+            self._active.close()
+            self._fd = os.open(self._active.path, os.O_WRONLY | os.O_APPEND)
+        else:
+            self._open_segment(1)
+
+    def _load(self, segment: _Segment, verify: bool):
+        file_size = os.path.getsize(segment.path)
+        offset = 0
+        if file_size:
+            view = segment.view()
+            while offset + HEADER.size <= file_size:
+                length, crc, key, ts, flags = HEADER.unpack_from(view, offset)
+                end = offset + HEADER.size + length
+                if end > file_size:
+                    break
+                if verify and zlib.crc32(view[offset + 8:end]) != crc:
+                    break
+                self._index_record(segment, key, offset, end - offset, ts, flags)
+                offset = end
+        if offset < file_size:
+            logging.warning(f"Truncating {file_size - offset} bytes of torn records from {segment.path}")
+            segment.close()
+            os.truncate(segment.path, offset)
+        segment.size = offset
+
+    def _open_segment(self, number: int):
+        segment = _Segment(self._directory, number)
+        self._fd = os.open(segment.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        self._segments[number] = segment
+        self._active = segment
+
+    def _roll(self):
+        os.fsync(self._fd)
+        os.close(self._fd)
+        self._dirty = False
+        self._open_segment(self._active.number + 1)
+
+    def _index_record(self, segment: _Segment, key: int, offset: int, length: int, ts: float, flags: int):
+        old = self._index.get(key)
+        if old is not None:
+            self._segments[old[0]].live -= 1
+        if flags & TOMBSTONE:
+            if old is not None:
+                del self._index[key]
+                self._order.remove(key)
+            segment.tombstones += 1
+        else:
+            self._index[key] = (segment.number, offset, length)
+            if old is None:
+                self._order.add(key)
+            segment.live += 1
+        segment.records += 1
+        segment.max_ts = max(segment.max_ts, ts)
+
+    def _write(self, key: int, payload: bytes, flags: int):
+        ts = time.time()
+        crc = zlib.crc32(CHECKED.pack(key, ts, flags) + payload)
+        data = HEADER.pack(len(payload), crc, key, ts, flags) + payload
+        with self._lock:
+            if self._active.size and self._active.size + len(data) > self._segment_bytes:
+                self._roll()
+            os.write(self._fd, data)
+            offset = self._active.size
+            self._active.size += len(data)
+            self._index_record(self._active, key, offset, len(data), ts, flags)
+            if self._fsync_always:
+                os.fsync(self._fd)
+            else:
+                self._dirty = True
+
+    def append(self, key: int, record: dict):
+        payload = json.dumps(record, separators=(",", ":")).encode()
+        with self._lock:
+            old = self.get(key) if self._fields else None
+            self._write(key, payload, 0)
+            self._indexed(key, old, record)
+
+    def delete(self, key: int):
+        with self._lock:
+            if key in self._index:
+                old = self.get(key) if self._fields else None
+                self._write(key, b"", TOMBSTONE)
+                self._indexed(key, old, None)
+
+    def _read(self, location) -> dict:
+        number, offset, length = location
+        segment = self._segments[number]
+        if segment is self._active:
+            data = os.pread(self._active_read_fd(), length, offset)
+        else:
+            data = segment.view()[offset:offset + length]
+        return json.loads(data[HEADER.size:])
+
+    def _active_read_fd(self):
+        # The active segment grows, so it is read with pread instead of a fixed-size mmap.
+        if self._read_segment is not self._active:
+            if self._read_fd is not None:
+                os.close(self._read_fd)
+            self._read_fd = os.open(self._active.path, os.O_RDONLY)
+            self._read_segment = self._active
+        return self._read_fd
+
+    def get(self, key: int):
+        with self._lock:
+            location = self._index.get(key)
+            return None if location is None else self._read(location)
+
+    def scan(self) -> list[dict]:
+        with self._lock:
+            return [self._read(location) for location in self._index.values()]
+
+    def _records(self, keys) -> list[dict]:
+        return [self._read(self._index[key]) for key in keys]
+
+    def __len__(self):
+        return len(self._index)
+
+    def flush(self):
+        with self._lock:
+            if self._dirty:
+                os.fsync(self._fd)
+                self._dirty = False
+
+    def _drop(self, segment: _Segment):
+        for offset, length, key, _, flags in segment.headers():
+            if not flags & TOMBSTONE and self._index.get(key) == (segment.number, offset, length):
+                old = self._read((segment.number, offset, length)) if self._fields else None
+                self._indexed(key, old, None)
+                del self._index[key]
+                self._order.remove(key)
+        segment.close()
+        os.remove(segment.path)
+        del self._segments[segment.number]
+        self.dropped_segments += 1
+
+    def enforce_retention(self, max_age: float, max_bytes: int):
+        """Drop the oldest sealed segments that are past max_age or over max_bytes."""
+        with self._lock:
+            total = sum(s.size for s in self._segments.values())
+            for segment in [s for s in self._segments.values() if s is not self._active]:
+                expired = max_age and segment.max_ts < time.time() - max_age
+                oversize = max_bytes and total > max_bytes
+                if not (expired or oversize):
+                    break
+                total -= segment.size
+                self._drop(segment)
+
+    def compact(self, garbage_ratio: float):
+        """Rewrite sealed segments whose superseded records exceed garbage_ratio."""
+        with self._lock:
+            oldest = min(self._segments)
+            for segment in [s for s in self._segments.values() if s is not self._active]:
+                kept_tombstones = segment.tombstones if segment.number != oldest else 0
+                garbage = segment.records - segment.live - kept_tombstones
+                if not segment.records or garbage / segment.records < garbage_ratio:
+                    continue
+                self._rewrite(segment, keep_tombstones=segment.number != oldest)
+
+    def _rewrite(self, segment: _Segment, keep_tombstones: bool):
+        view = segment.view()
+        kept = []
+        for offset, length, key, ts, flags in segment.headers():
+            if flags & TOMBSTONE:
+                if keep_tombstones:
+                    kept.append((key, offset, length, ts, flags))
+            elif self._index.get(key) == (segment.number, offset, length):
+                kept.append((key, offset, length, ts, flags))
+
+        if not kept:
+            segment.close()
+            os.remove(segment.path)
+            del self._segments[segment.number]
+            self.compactions += 1
+            return
+
+        tmp_path = segment.path + ".compact"
+        locations = []
+        with open(tmp_path, "wb") as out:
+            position = 0
+            for key, offset, length, ts, flags in kept:
+                out.write(view[offset:offset + length])
+                locations.append((key, position, length, ts, flags))
+                position += length
+            out.flush()
+            os.fsync(out.fileno())
+        segment.close()
+        os.replace(tmp_path, segment.path)
+
+        segment.size = position
+        segment.records = segment.live = segment.tombstones = 0
+        segment.max_ts = 0.0
+        for key, offset, length, ts, flags in locations:
+            if not flags & TOMBSTONE:
+                self._index[key] = (segment.number, offset, length)
+                segment.live += 1
+            else:
+                segment.tombstones += 1
+            segment.records += 1
+            segment.max_ts = max(segment.max_ts, ts)
+        self.compactions += 1
+
+    def close(self):
+        with self._lock:
+            if self._fd is not None:
+                os.fsync(self._fd)
+                os.close(self._fd)
+                self._fd = None
+            if self._read_fd is not None:
+                os.close(self._read_fd)
+                self._read_fd = None
+            for segment in self._segments.values():
+                segment.close()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "records": len(self._index),
+                "segments": len(self._segments),
+                "bytes": sum(s.size for s in self._segments.values()),
+                "compactions": self.compactions,
+                "dropped_segments": self.dropped_segments,
+            }
+
+
+class LogBackend:
+    """One SegmentLog per collection under `directory`, plus a maintenance thread.
+
+    The thread fsyncs dirty logs every `fsync_interval` seconds, so many
+    appends share one fsync, and every `maintenance_interval` seconds it
+    applies retention and compacts segments.
+    """
+
+    def __init__(self, directory: str, segment_bytes: int | None = None, fsync_interval: float | None = None,
+                 retention_seconds: float | None = None, retention_bytes: int | None = None,
+                 compact_ratio: float | None = None, maintenance_interval: float | None = None):
+        self._directory = directory
+        self._segment_bytes = segment_bytes or int(os.getenv("COMM_SEGMENT_BYTES", 16 * 1024 * 1024))
+        self._fsync_interval = fsync_interval if fsync_interval is not None else float(os.getenv("COMM_FSYNC_INTERVAL_MS", 50)) / 1000
+        self._retention_seconds = retention_seconds if retention_seconds is not None else float(os.getenv("COMM_RETENTION_SECONDS", 0))
+        self._retention_bytes = retention_bytes if retention_bytes is not None else int(os.getenv("COMM_RETENTION_BYTES", 0))
+        self._compact_ratio = compact_ratio or float(os.getenv("COMM_COMPACT_RATIO", 0.5))
+        self._maintenance_interval = maintenance_interval or float(os.getenv("COMM_MAINTENANCE_INTERVAL", 60))
+        self._collections: dict[str, SegmentLog] = {}
+        self._stop = threading.Event()
+        self._thread = None
+
+    def collection(self, name: str) -> SegmentLog:
+        if name not in self._collections:
+            self._collections[name] = SegmentLog(
+                os.path.join(self._directory, name),
+                self._segment_bytes,
+                fsync_always=self._fsync_interval == 0,
+            )
+        return self._collections[name]
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="log-maintenance", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        last_maintenance = time.monotonic()
+        while not self._stop.wait(self._fsync_interval or 1.0):
+            for log in list(self._collections.values()):
+                try:
+                    log.flush()
+                except OSError as e:
+                    logging.error(f"Failed to fsync log: {str(e)}")
+            if time.monotonic() - last_maintenance >= self._maintenance_interval:
+                last_maintenance = time.monotonic()
+                self.maintain()
+
+    def maintain(self):
+        for name, log in list(self._collections.items()):
+            try:
+                log.enforce_retention(self._retention_seconds, self._retention_bytes)
+                log.compact(self._compact_ratio)
+            except OSError as e:
+                logging.error(f"Maintenance of '{name}' log failed: {str(e)}")
+
+    def close(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+        for log in self._collections.values():
+            log.close()
+
+    def stats(self) -> dict:
+        return {"backend": "log", "collections": {n: c.stats() for n, c in self._collections.items()}}
+
+
+def open_backend():
+    """Storage backend selected by COMM_STORAGE ("memory" or "log")."""
+    kind = os.getenv("COMM_STORAGE", "memory")
+    if kind == "memory":
+        return MemoryBackend()
+    if kind == "log":
+        return LogBackend(os.getenv("COMM_DATA_DIR", "data"))
+    raise ValueError(f"Unknown COMM_STORAGE '{kind}'")
@@ -0,0 +1,30 @@
+from storage import SortedKeys
+
+
+def keys(*values):
+    sorted_keys = SortedKeys()
+    for value in values:
+        sorted_keys.add(value)
+    return sorted_keys
+
+
+def test_keys_added_out_of_order_are_kept_sorted_once():
+    assert list(keys(5, 1, 9, 1, 3)) == [1, 3, 5, 9]
+
+
+def test_remove_ignores_missing_keys():
+    sorted_keys = keys(1, 2, 3)
+
+    sorted_keys.remove(2)
+    sorted_keys.remove(7)
+
+    assert list(sorted_keys) == [1, 3]
+
+
+def test_pages_are_newest_first():
+    sorted_keys = keys(*range(1, 11))
+
+    assert sorted_keys.page(3) == [10, 9, 8]
+    assert sorted_keys.page(3, before=5) == [4, 3, 2]
+    assert sorted_keys.page(3, after=5) == [8, 7, 6]
+    assert sorted_keys.since(5, 3) == [6, 7, 8]
@@ -0,0 +1,56 @@
+from storage import TextIndex
+
+
+def build(monkeypatch, *texts, max_expansions=3):
+    monkeypatch.setattr(TextIndex, "MAX_EXPANSIONS", max_expansions)
+    index = TextIndex({"text": 1.0})
+    for key, text in enumerate(texts, 1):
+        index.add(key, {"text": text})
+    return index
+
+
+def keys(results):
+    return {key for key, _ in results}
+
+
+def test_prefix_matches_every_completion_under_the_cap(monkeypatch):
+    index = build(monkeypatch, "deploy", "deployment", "depth")
+
+    assert keys(index.search("dep", 10)) == {1, 2, 3}
+
+
+def test_expansion_past_the_cap_keeps_the_most_common_terms(monkeypatch):
+    # Alphabetically first come the rare "proa".."proc"; "project" is in most records.
+    index = build(
+        monkeypatch,
+        "proa", "prob", "proc",
+        "project alpha", "project beta", "project gamma",
+        "progress one", "progress two",
+        "protocol",
+    )
+
+    assert index._expand("pro")[:2] == ["project", "progress"]
+    assert keys(index.search("pro", 10)) >= {4, 5, 6, 7, 8}
+
+
+def test_exact_word_is_always_expanded(monkeypatch):
+    index = build(monkeypatch, "pro", "prox a", "prox b", "proy a", "proy b", "proz a", "proz b")
+
+    assert index._expand("pro")[0] == "pro"
+    assert 1 in keys(index.search("pro", 10))
+
+
+def test_expansion_ties_are_broken_alphabetically(monkeypatch):
+    index = build(monkeypatch, "cd", "cb", "ca", "cc", max_expansions=2)
+
+    assert index._expand("c") == ["ca", "cb"]
+
+
+def test_discarded_records_no_longer_count_towards_frequency(monkeypatch):
+    index = build(monkeypatch, "alpha", "alpine one", "alpine two", "altitude", max_expansions=1)
+    assert index._expand("al") == ["alpine"]
+
+    index.discard(2, {"text": "alpine one"})
+    index.discard(3, {"text": "alpine two"})
+
+    assert index._expand("al") == ["alpha"]
@@ -0,0 +1,119 @@
+import asyncio
+import base64
+import heapq
+import json
+
+from sqlalchemy import Column, Index, Integer, String, delete, insert, select, tuple_, update
+
+from db import Base
+
+
+class TombstoneORM(Base):
+    __tablename__ = "change_tombstones"
+
+    collection = Column(String, primary_key=True)
+    id = Column(Integer, primary_key=True)
+    change_seq = Column(Integer, nullable=False)
+
+    __table_args__ = (
+        Index("ix_change_tombstones_seq", "collection", "change_seq", "id"),
+    )
+
+
+def encode_change_cursor(seq: int, row_id: int) -> str:
+    return base64.urlsafe_b64encode(json.dumps([seq, row_id]).encode()).decode()
+
+def decode_change_cursor(cursor: str) -> tuple[int, int]:
+    values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    if not isinstance(values, list) or len(values) != 2:
+        raise ValueError(cursor)
+    return int(values[0]), int(values[1])
+
+
+class ChangeFeed:
+    """Ordered feed of row changes and deletions for one collection.
+
+    Every write stamps the rows it touched with the collection's next
+    version (bumped in the same transaction) in their `change_seq` column,
+    and deletes leave a tombstone with that sequence. Because the version
+    row is locked until commit, changes become visible in sequence order,
+    so a consumer that pages by (change_seq, id) never skips a change that
+    committed after it read. A row changed several times shows up once,
+    with its latest state.
+    """
+
+    def __init__(self, versions, collection: str, model, columns):
+        self._versions = versions
+        self._collection = collection
+        self._model = model
+        self._columns = columns
+
+    async def record_upserts(self, db, ids):
+        seq = await self._versions.bump(db, self._collection)
+        await db.execute(
+            update(self._model)
+            .where(self._model.id.in_(list(ids)))
+            .values(change_seq=seq)
+            .execution_options(synchronize_session=False)
+        )
+
+    async def record_deletes(self, db, ids):
+        ids = list(ids)
+        seq = await self._versions.bump(db, self._collection)
+        # An id can come back on SQLite, which reuses the highest rowid after a delete.
+        await db.execute(
+            delete(TombstoneORM)
+            .where(TombstoneORM.collection == self._collection, TombstoneORM.id.in_(ids))
+            .execution_options(synchronize_session=False)
+        )
+        await db.execute(
+            insert(TombstoneORM),
+            [{"collection": self._collection, "id": i, "change_seq": seq} for i in ids],
+        )
+
+    async def read(self, db, cursor: str | None, limit: int) -> dict:
+        """Changes after `cursor`, oldest first, with the cursor to continue from."""
+        after = decode_change_cursor(cursor) if cursor else None
+        model = self._model
+
+        rows_query = select(*self._columns, model.change_seq).order_by(model.change_seq, model.id).limit(limit + 1)
+        tombstones_query = (
+            select(TombstoneORM.id, TombstoneORM.change_seq)
+            .where(TombstoneORM.collection == self._collection)
+            .order_by(TombstoneORM.change_seq, TombstoneORM.id)
+            .limit(limit + 1)
+        )
+        if after is not None:
+            rows_query = rows_query.where(tuple_(model.change_seq, model.id) > after)
+            tombstones_query = tombstones_query.where(tuple_(TombstoneORM.change_seq, TombstoneORM.id) > after)
+
+        rows = (await db.execute(rows_query)).all()
+        tombstones = (await db.execute(tombstones_query)).all()
+        upserts = (
+            {"seq": row.change_seq, "op": "upsert", "id": row.id, "data": {c.key: row._mapping[c.key] for c in self._columns}}
+            for row in rows
+        )
+        deletes = ({"seq": row.change_seq, "op": "delete", "id": row.id} for row in tombstones)
+        changes = list(heapq.merge(upserts, deletes, key=lambda c: (c["seq"], c["id"])))
+
+        has_more = len(changes) > limit
+        changes = changes[:limit]
+        if changes:
+            cursor = encode_change_cursor(changes[-1]["seq"], changes[-1]["id"])
+        elif cursor is None:
+            cursor = encode_change_cursor(0, 0)
+        return {"changes": changes, "cursor": cursor, "has_more": has_more}
+
+    async def poll(self, db, cursor: str | None, limit: int, wait: float) -> dict:
+        """Like `read`, but blocks for up to `wait` seconds while there is nothing new."""
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + wait
+        while True:
+            # Read the version before the rows, so a change committed in between still wakes us.
+            version = await self._versions.get(db, self._collection)
+            page = await self.read(db, cursor, limit)
+            remaining = deadline - loop.time()
+            if page["changes"] or remaining <= 0:
+                return page
+            if not await self._versions.wait_for_change(db, self._collection, version, remaining):
+                return page
@@ -0,0 +1,177 @@
+import os
+from contextlib import asynccontextmanager
+
+from sqlalchemy import create_engine, inspect, text
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.orm import declarative_base, sessionmaker
+from sqlalchemy.pool import StaticPool
+from starlette.concurrency import run_in_threadpool
+
+
+# Serializes schema migrations between replicas starting against the same Postgres.
+MIGRATION_LOCK_ID = 0x6D696772
+
+SYNC_DRIVERS = {"postgresql": "postgresql+psycopg2", "sqlite": "sqlite"}
+ASYNC_DRIVERS = {"postgresql": "postgresql+asyncpg", "sqlite": "sqlite+aiosqlite"}
+
+Base = declarative_base()
+
+
+def _env_bool(name: str, default: bool) -> bool:
+    value = os.getenv(name)
+    if value is None:
+        return default
+    return value.lower() in ("1", "true", "yes")
+
+
+class ThreadedSession:
+    """AsyncSession-compatible wrapper around a sync Session.
+
+    Every database call runs in the threadpool, so handlers are written once
+    against the AsyncSession API and work in both engine modes.
+    """
+
+    def __init__(self, session):
+        self.sync_session = session
+
+    @property
+    def info(self):
+        return self.sync_session.info
+
+    def add(self, instance):
+        self.sync_session.add(instance)
+
+    def add_all(self, instances):
+        self.sync_session.add_all(instances)
+
+    async def execute(self, statement, *args, **kwargs):
+        return await run_in_threadpool(self.sync_session.execute, statement, *args, **kwargs)
+
+    async def scalar(self, statement, *args, **kwargs):
+        return await run_in_threadpool(self.sync_session.scalar, statement, *args, **kwargs)
+
+    async def get(self, entity, ident):
+        return await run_in_threadpool(self.sync_session.get, entity, ident)
+
+    async def delete(self, instance):
+        await run_in_threadpool(self.sync_session.delete, instance)
+
+    async def flush(self):
+        await run_in_threadpool(self.sync_session.flush)
+
+    async def refresh(self, instance):
+        await run_in_threadpool(self.sync_session.refresh, instance)
+
+    async def commit(self):
+        await run_in_threadpool(self.sync_session.commit)
+
+    async def rollback(self):
+        await run_in_threadpool(self.sync_session.rollback)
+
+    async def close(self):
+        await run_in_threadpool(self.sync_session.close)
+
+
+class Database:
+    """Engine and session factory configured from the environment.
+
+    DATABASE_URL picks the database (Postgres or a SQLite stand-in) and DB_ASYNC
+    switches between the async driver (asyncpg/aiosqlite) and the sync driver
+    run in the threadpool. Pool size, overflow, pre-ping and statement timeout
+    come from DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_PRE_PING and
+    DB_STATEMENT_TIMEOUT_MS.
+    """
+
+    def __init__(self, default_url: str):
+        self.async_mode = _env_bool("DB_ASYNC", False)
+        url = make_url(os.getenv("DATABASE_URL", default_url))
+        backend = url.get_backend_name()
+        if "+" not in url.drivername:
+            drivers = ASYNC_DRIVERS if self.async_mode else SYNC_DRIVERS
+            url = url.set(drivername=drivers.get(backend, url.drivername))
+        self.url = url
+        self.backend = backend
+
+        options = {"pool_pre_ping": _env_bool("DB_POOL_PRE_PING", True)}
+        connect_args = {}
+        statement_timeout = int(os.getenv("DB_STATEMENT_TIMEOUT_MS", 0))
+        if backend == "sqlite":
+            if not self.async_mode:
+                connect_args["check_same_thread"] = False
+            if url.database in (None, "", ":memory:"):
+                options["poolclass"] = StaticPool
+        else:
+            options["pool_size"] = int(os.getenv("DB_POOL_SIZE", 5))
+            options["max_overflow"] = int(os.getenv("DB_MAX_OVERFLOW", 10))
+            options["pool_timeout"] = float(os.getenv("DB_POOL_TIMEOUT", 30))
+            if statement_timeout and self.async_mode:
+                connect_args["server_settings"] = {"statement_timeout": str(statement_timeout)}
+            elif statement_timeout:
+                connect_args["options"] = f"-c statement_timeout={statement_timeout}"
+
+        if self.async_mode:
+            self.engine = create_async_engine(url, connect_args=connect_args, **options)
+            self._sessions = async_sessionmaker(self.engine, autoflush=False, expire_on_commit=False)
+        else:
+            self.engine = create_engine(url, connect_args=connect_args, **options)
+            self._sessions = sessionmaker(bind=self.engine, autoflush=False, expire_on_commit=False)
+
+    async def create_all(self, metadata):
+        if self.async_mode:
+            async with self.engine.begin() as conn:
+                await conn.run_sync(metadata.create_all)
+        else:
+            await run_in_threadpool(metadata.create_all, bind=self.engine)
+
+    async def migrate(self, metadata, added_columns=()):
+        """Create missing tables and bring existing ones up to the current schema.
+
+        create_all never alters a table that already exists, so columns added
+        since (given as (table, column, column DDL)) are added here, and every
+        index in `metadata` is created if missing, including indexes on
+        tables that predate it.
+        """
+        if self.async_mode:
+            async with self.engine.begin() as conn:
+                await conn.run_sync(_migrate, metadata, added_columns)
+        else:
+            def run():
+                with self.engine.begin() as conn:
+                    _migrate(conn, metadata, added_columns)
+            await run_in_threadpool(run)
+
+    @asynccontextmanager
+    async def session(self):
+        if self.async_mode:
+            async with self._sessions() as session:
+                yield session
+        else:
+            session = ThreadedSession(self._sessions())
+            try:
+                yield session
+            finally:
+                await session.close()
+
+    async def dispose(self):
+        if self.async_mode:
+            await self.engine.dispose()
+        else:
+            self.engine.dispose()
+
+
+def _migrate(conn, metadata, added_columns):
+    postgres = conn.dialect.name == "postgresql"
+    if postgres:
+        conn.execute(text("SELECT pg_advisory_xact_lock(:id)"), {"id": MIGRATION_LOCK_ID})
+    metadata.create_all(conn)
+    for table, column, ddl in added_columns:
+        if postgres:
+            conn.execute(text(f"ALTER TABLE {table} ADD COLUMN IF NOT EXISTS {column} {ddl}"))
+        elif column not in {c["name"] for c in inspect(conn).get_columns(table)}:
+            # SQLite has no ADD COLUMN IF NOT EXISTS.
+            conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {column} {ddl}"))
+    for table in metadata.sorted_tables:
+        for index in table.indexes:
+            # Honors ddl_if, so Postgres-only indexes are skipped elsewhere.
+            index.create(conn, checkfirst=True)
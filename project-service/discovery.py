@@ -0,0 +1,116 @@
+import logging
+import os
+import threading
+from dataclasses import dataclass
+
+
+@dataclass(frozen=True)
+class ServiceInstance:
+    id: str
+    address: str
+    port: int
+
+    @property
+    def url(self) -> str:
+        return f"http://{self.address}:{self.port}"
+
+
+class ServiceRegistry:
+    """Local name -> healthy instances table kept fresh by background Consul watches.
+
+    Lookups never do I/O. Each watched service has a daemon thread running Consul
+    blocking queries (or plain TTL polling when the agent does not return an index);
+    instances with failing health checks drop out of the table, and when Consul is
+    unreachable the last known good entry is kept.
+    """
+
+    def __init__(self, consul_client, wait: str | None = None, ttl: float | None = None,
+                 retry_delay: float | None = None):
+        self._consul = consul_client
+        self._wait = wait or os.getenv("CONSUL_WATCH_WAIT", "30s")
+        self._ttl = ttl if ttl is not None else float(os.getenv("CONSUL_WATCH_TTL", 10))
+        self._retry_delay = retry_delay if retry_delay is not None else float(os.getenv("CONSUL_RETRY_DELAY", 2))
+        self._instances: dict[str, tuple[ServiceInstance, ...]] = {}
+        self._watchers: dict[str, threading.Thread] = {}
+        self._ready: dict[str, threading.Event] = {}
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+
+    def start(self, service_names, timeout: float = 5.0):
+        self._stopped.clear()
+        for name in service_names:
+            self.watch(name)
+        for name in service_names:
+            self._ready[name].wait(timeout)
+
+    def stop(self):
+        self._stopped.set()
+        with self._lock:
+            self._watchers.clear()
+
+    def watch(self, service_name: str):
+        with self._lock:
+            if service_name in self._watchers:
+                return
+            self._ready.setdefault(service_name, threading.Event())
+            thread = threading.Thread(
+                target=self._watch_loop,
+                args=(service_name,),
+                name=f"consul-watch-{service_name}",
+                daemon=True,
+            )
+            self._watchers[service_name] = thread
+        thread.start()
+
+    def instances(self, service_name: str) -> tuple[ServiceInstance, ...]:
+        instances = self._instances.get(service_name)
+        if instances is None:
+            self.watch(service_name)
+            return ()
+        return instances
+
+    def url(self, service_name: str) -> str | None:
+        instances = self.instances(service_name)
+        return instances[0].url if instances else None
+
+    def snapshot(self) -> dict[str, list[str]]:
+        return {name: [i.url for i in instances] for name, instances in self._instances.items()}
+
+    def _watch_loop(self, service_name: str):
+        index = None
+        blocking = True
+        while not self._stopped.is_set():
+            try:
+                new_index, entries = self._consul.health.service(
+                    service_name,
+                    index=index if blocking else None,
+                    wait=self._wait if blocking else None,
+                    passing=True,
+                )
+            except Exception as e:
+                logging.error(f"Error watching service '{service_name}': {e}")
+                self._ready[service_name].set()
+                index = None
+                self._stopped.wait(self._retry_delay)
+                continue
+            if self._stopped.is_set():
+                # The answer to a query that was in flight when stop() was called.
+                break
+
+            self._instances[service_name] = tuple(self._parse(entry) for entry in entries)
+            self._ready[service_name].set()
+
+            if new_index is None:
+                blocking = False
+            elif index is not None and int(new_index) < int(index):
+                new_index = None
+            index = new_index
+
+            if not blocking:
+                self._stopped.wait(self._ttl)
+
+    @staticmethod
+    def _parse(entry) -> ServiceInstance:
+        service = entry["Service"]
+        address = service.get("Address") or entry["Node"]["Address"]
+        return ServiceInstance(id=service["ID"], address=address, port=service["Port"])
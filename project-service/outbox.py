@@ -0,0 +1,231 @@
+import asyncio
+import json
+import logging
+import os
+import random
+import uuid
+from datetime import datetime, timedelta
+
+import httpx
+from sqlalchemy import Column, DateTime, Index, Integer, String, Text, delete, select, update
+
+from db import Base
+from telemetry import current_traceparent
+
+
+class OutboxEventORM(Base):
+    __tablename__ = "outbox_events"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    event_id = Column(String, unique=True, nullable=False)
+    event_type = Column(String, nullable=False)
+    destination = Column(String, nullable=False)
+    payload = Column(Text, nullable=False)
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    attempts = Column(Integer, nullable=False, default=0)
+    next_attempt_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    delivered_at = Column(DateTime, nullable=True)
+    # Trace context of the request that staged the event, so consumers can continue its trace.
+    traceparent = Column(String, nullable=True)
+
+    __table_args__ = (
+        Index("ix_outbox_events_pending", "delivered_at", "id"),
+    )
+
+
+def add_event(db, destination: str, event_type: str, payload: dict) -> OutboxEventORM:
+    """Stage an event in the caller's transaction; it is sent only if that transaction commits."""
+    event = OutboxEventORM(
+        event_id=str(uuid.uuid4()),
+        event_type=event_type,
+        destination=destination,
+        payload=json.dumps(payload),
+        traceparent=current_traceparent(),
+    )
+    db.add(event)
+    return event
+
+
+class OutboxRelay:
+    """Background task that delivers committed outbox events in batches.
+
+    Events are POSTed to `<destination>/events` in id order. Each round claims
+    a batch per destination in a short transaction (pushing `next_attempt_at`
+    out by `claim_timeout`), delivers outside of it, and then records the
+    outcome, so no transaction or pooled connection is held across an HTTP
+    call. Claimed events are offered again if the relay dies before recording
+    the outcome. A failed batch is retried with jittered exponential backoff,
+    and later events for the same destination wait behind it so consumers see
+    them in order.
+    """
+
+    def __init__(self, database, balancer, telemetry, batch_size: int | None = None,
+                 poll_interval: float | None = None, max_backoff: float | None = None,
+                 retention: float | None = None, claim_timeout: float | None = None):
+        self._database = database
+        self._balancer = balancer
+        self._telemetry = telemetry
+        self._batch_size = batch_size or int(os.getenv("OUTBOX_BATCH_SIZE", 100))
+        self._poll_interval = poll_interval or float(os.getenv("OUTBOX_POLL_INTERVAL", 1.0))
+        self._max_backoff = max_backoff or float(os.getenv("OUTBOX_MAX_BACKOFF", 60))
+        self._retention = retention or float(os.getenv("OUTBOX_RETENTION_SECONDS", 86400))
+        # Has to outlast a delivery attempt (the client times out after 2s connect + 5s read).
+        self._claim_timeout = claim_timeout or float(os.getenv("OUTBOX_CLAIM_SECONDS", 30))
+        self._wakeup = asyncio.Event()
+        self._task = None
+        self._client = None
+        self.delivered = 0
+        self.failed_batches = 0
+
+    def notify(self):
+        self._wakeup.set()
+
+    def start(self):
+        self._client = httpx.AsyncClient(timeout=httpx.Timeout(5.0, connect=2.0))
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    async def _run(self):
+        last_cleanup = datetime.utcnow()
+        while True:
+            try:
+                sent = await self.relay_once()
+                if datetime.utcnow() - last_cleanup > timedelta(minutes=5):
+                    await self._cleanup()
+                    last_cleanup = datetime.utcnow()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logging.error(f"Outbox relay error: {e}")
+                sent = 0
+            if sent < self._batch_size:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), self._poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                self._wakeup.clear()
+
+    async def relay_once(self) -> int:
+        sent = 0
+        for destination, events in (await self._claim()).items():
+            delivered = await self._deliver(destination, events)
+            await self._settle(events, delivered)
+            if delivered:
+                sent += len(events)
+            else:
+                self.failed_batches += 1
+        self.delivered += sent
+        return sent
+
+    async def _claim(self) -> dict[str, list[dict]]:
+        now = datetime.utcnow()
+        async with self._database.session() as db:
+            # Not SKIP LOCKED: a relay that skipped another's claim could send that destination's
+            # later events first. Claims commit right away, so waiting on one is short.
+            result = await db.execute(
+                select(OutboxEventORM)
+                .where(OutboxEventORM.delivered_at.is_(None))
+                .order_by(OutboxEventORM.id)
+                .limit(self._batch_size)
+                .with_for_update()
+            )
+            pending = result.scalars().all()
+
+            batches: dict[str, list[dict]] = {}
+            blocked = set()
+            for event in pending:
+                if event.destination in blocked:
+                    continue
+                if event.next_attempt_at > now and event.destination not in batches:
+                    blocked.add(event.destination)
+                    continue
+                batches.setdefault(event.destination, []).append({
+                    "id": event.id,
+                    "event_id": event.event_id,
+                    "type": event.event_type,
+                    "payload": event.payload,
+                    "created_at": event.created_at,
+                    "traceparent": event.traceparent,
+                    "attempts": event.attempts,
+                })
+
+            if batches:
+                await db.execute(
+                    update(OutboxEventORM)
+                    .where(OutboxEventORM.id.in_([e["id"] for events in batches.values() for e in events]))
+                    .values(next_attempt_at=now + timedelta(seconds=self._claim_timeout))
+                    .execution_options(synchronize_session=False)
+                )
+            await db.commit()
+        return batches
+
+    async def _settle(self, events: list[dict], delivered: bool):
+        now = datetime.utcnow()
+        if delivered:
+            values = {"delivered_at": now}
+        else:
+            attempts = events[0]["attempts"] + 1
+            delay = min(self._max_backoff, 0.5 * 2 ** attempts) * random.uniform(0.5, 1.0)
+            values = {"attempts": attempts, "next_attempt_at": now + timedelta(seconds=delay)}
+        async with self._database.session() as db:
+            await db.execute(
+                update(OutboxEventORM)
+                .where(OutboxEventORM.id.in_([e["id"] for e in events]))
+                .values(**values)
+                .execution_options(synchronize_session=False)
+            )
+            await db.commit()
+
+    async def _deliver(self, destination: str, events: list[dict]) -> bool:
+        body = {
+            "events": [
+                {
+                    "event_id": e["event_id"],
+                    "type": e["type"],
+                    "payload": json.loads(e["payload"]),
+                    "created_at": e["created_at"].isoformat(),
+                    "traceparent": e["traceparent"],
+                }
+                for e in events
+            ]
+        }
+        with self._balancer.lease(destination) as lease:
+            if lease is None:
+                return False
+            with self._telemetry.outbound(destination, "POST") as call:
+                try:
+                    response = await self._client.post(f"{lease.url}/events", json=body, headers=call.headers)
+                except httpx.TransportError as e:
+                    lease.failed = True
+                    logging.warning(f"Delivering {len(events)} events to '{destination}' failed: {e}")
+                    return False
+                call.status = response.status_code
+            lease.record(response.status_code)
+        if response.status_code >= 300:
+            logging.warning(f"'{destination}' rejected {len(events)} events with {response.status_code}")
+            return False
+        return True
+
+    async def _cleanup(self):
+        cutoff = datetime.utcnow() - timedelta(seconds=self._retention)
+        async with self._database.session() as db:
+            await db.execute(
+                delete(OutboxEventORM)
+                .where(OutboxEventORM.delivered_at < cutoff)
+                .execution_options(synchronize_session=False)
+            )
+            await db.commit()
+
+    def stats(self) -> dict:
+        return {"delivered": self.delivered, "failed_batches": self.failed_batches}
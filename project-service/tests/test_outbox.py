@@ -0,0 +1,178 @@
+import json
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+import httpx
+import pytest
+from sqlalchemy import select, update
+
+from db import Base, Database
+from outbox import OutboxEventORM, OutboxRelay, add_event
+from telemetry import Telemetry
+
+pytestmark = pytest.mark.anyio
+
+
+class FakeLease:
+    def __init__(self, destination):
+        self.url = f"http://{destination}"
+        self.failed = False
+
+    def record(self, status_code):
+        self.failed = status_code >= 500
+
+
+class FakeBalancer:
+    @contextmanager
+    def lease(self, destination):
+        yield FakeLease(destination)
+
+
+class Consumers:
+    """In-process stand-in for the services behind /events: records what each one received."""
+
+    def __init__(self):
+        self.received: dict[str, list[str]] = {}
+        self.failing: set[str] = set()
+        self.during_delivery = None
+
+    async def handle(self, request: httpx.Request) -> httpx.Response:
+        destination = request.url.host
+        if self.during_delivery is not None:
+            await self.during_delivery(json.loads(request.content)["events"])
+        if destination in self.failing:
+            return httpx.Response(503)
+        events = json.loads(request.content)["events"]
+        self.received.setdefault(destination, []).extend(e["payload"]["n"] for e in events)
+        return httpx.Response(200, json={"processed": len(events)})
+
+
+@pytest.fixture
+async def database(database_url):
+    database = Database(database_url)
+    await database.create_all(Base.metadata)
+    yield database
+    await database.dispose()
+
+
+@pytest.fixture
+async def consumers():
+    return Consumers()
+
+
+@pytest.fixture
+async def relay(database, consumers):
+    relay = OutboxRelay(database, FakeBalancer(), Telemetry("test"), batch_size=100)
+    relay._client = httpx.AsyncClient(transport=httpx.MockTransport(consumers.handle))
+    yield relay
+    await relay._client.aclose()
+
+
+async def stage(database, *events):
+    async with database.session() as db:
+        for destination, n in events:
+            add_event(db, destination, "Test", {"n": n})
+        await db.commit()
+
+
+async def outbox_rows(database):
+    async with database.session() as db:
+        return (await db.execute(select(OutboxEventORM).order_by(OutboxEventORM.id))).scalars().all()
+
+
+async def make_due(database):
+    async with database.session() as db:
+        await db.execute(update(OutboxEventORM).values(next_attempt_at=datetime.utcnow() - timedelta(seconds=1)))
+        await db.commit()
+
+
+async def test_relay_delivers_each_destination_in_order_once(database, relay, consumers):
+    await stage(database, ("task-service", 1), ("report-service", 2), ("task-service", 3), ("report-service", 4))
+
+    assert await relay.relay_once() == 4
+    assert await relay.relay_once() == 0
+
+    assert consumers.received == {"task-service": [1, 3], "report-service": [2, 4]}
+    assert all(row.delivered_at is not None for row in await outbox_rows(database))
+
+
+async def test_failed_batch_backs_off_and_holds_back_later_events(database, relay, consumers):
+    consumers.failing.add("task-service")
+    await stage(database, ("task-service", 1), ("report-service", 2))
+
+    assert await relay.relay_once() == 1
+    failed = (await outbox_rows(database))[0]
+    assert failed.attempts == 1
+    delay = (failed.next_attempt_at - datetime.utcnow()).total_seconds()
+    # 0.5 * 2**attempts, jittered down to half.
+    assert 0.4 < delay <= 1.0
+
+    consumers.failing.clear()
+    await stage(database, ("task-service", 3), ("report-service", 4))
+    assert await relay.relay_once() == 1
+    assert consumers.received == {"report-service": [2, 4]}
+
+    await make_due(database)
+    assert await relay.relay_once() == 2
+    assert consumers.received["task-service"] == [1, 3]
+
+
+async def test_backoff_grows_with_each_failed_attempt(database, relay, consumers):
+    consumers.failing.add("task-service")
+    await stage(database, ("task-service", 1))
+
+    await relay.relay_once()
+    await make_due(database)
+    await relay.relay_once()
+
+    row = (await outbox_rows(database))[0]
+    assert row.attempts == 2
+    assert 0.9 < (row.next_attempt_at - datetime.utcnow()).total_seconds() <= 2.0
+    assert relay.failed_batches == 2
+
+
+async def test_backoff_is_capped(database, consumers):
+    relay = OutboxRelay(database, FakeBalancer(), Telemetry("test"), max_backoff=3)
+    relay._client = httpx.AsyncClient(transport=httpx.MockTransport(consumers.handle))
+    consumers.failing.add("task-service")
+    await stage(database, ("task-service", 1))
+    async with database.session() as db:
+        await db.execute(update(OutboxEventORM).values(attempts=20))
+        await db.commit()
+
+    await relay.relay_once()
+
+    row = (await outbox_rows(database))[0]
+    assert (row.next_attempt_at - datetime.utcnow()).total_seconds() <= 3.0
+    await relay._client.aclose()
+
+
+async def test_events_are_claimed_and_committed_before_delivery(database, relay, consumers):
+    await stage(database, ("task-service", 1))
+    seen = []
+
+    async def check(events):
+        # Another connection can write to the table, so the relay holds no transaction open.
+        async with database.session() as db:
+            await db.execute(update(OutboxEventORM).values(attempts=OutboxEventORM.attempts))
+            await db.commit()
+        row = (await outbox_rows(database))[0]
+        seen.append(row.next_attempt_at > datetime.utcnow() and row.delivered_at is None)
+
+    consumers.during_delivery = check
+    assert await relay.relay_once() == 1
+    assert seen == [True]
+
+
+async def test_claimed_events_wait_for_the_claim_to_expire(database, relay, consumers):
+    await stage(database, ("task-service", 1))
+    # A relay that claimed the events and died before recording the outcome.
+    assert await relay._claim()
+
+    assert await relay.relay_once() == 0
+    await stage(database, ("task-service", 2))
+    assert await relay.relay_once() == 0
+
+    await make_due(database)
+    assert await relay.relay_once() == 2
+    assert consumers.received == {"task-service": [1, 2]}
@@ -0,0 +1,135 @@
+import asyncio
+import itertools
+import os
+import time
+
+from sqlalchemy import Column, Integer, String, event, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from db import Base
+
+
+class CollectionVersionORM(Base):
+    __tablename__ = "collection_versions"
+
+    name = Column(String, primary_key=True)
+    version = Column(Integer, nullable=False, default=0)
+
+
+class CollectionVersions:
+    """Per-collection version counters used as strong ETags.
+
+    Writers bump the counter in the same transaction as their change.
+    Readers get the version from a small in-process cache, so a conditional
+    GET can be answered with 304 without querying the database. Local
+    commits clear the cached value right away. Writes made by other
+    replicas show up once the VERSION_CACHE_TTL expires.
+
+    Each cached value carries the name's generation from before it was
+    read, and `forget` moves the generation on. A value read while a commit
+    was being forgotten is therefore never served from the cache.
+    """
+
+    def __init__(self, ttl: float | None = None):
+        self._ttl = ttl if ttl is not None else float(os.getenv("VERSION_CACHE_TTL", 1.0))
+        self._cache: dict[str, tuple[int, float, int]] = {}
+        self._generations: dict[str, int] = {}
+        self._next_generation = itertools.count(1)
+        self._waiters: dict[str, asyncio.Event] = {}
+        self._loop = None
+
+    async def ensure(self, db, names):
+        self._loop = asyncio.get_running_loop()
+        existing = set((await db.execute(select(CollectionVersionORM.name))).scalars().all())
+        missing = [n for n in names if n not in existing]
+        if not missing:
+            return
+        db.add_all([CollectionVersionORM(name=n, version=0) for n in missing])
+        try:
+            await db.commit()
+        except IntegrityError:
+            # Another replica created the rows first.
+            await db.rollback()
+
+    async def get(self, db, name: str) -> int:
+        generation = self._generations.get(name, 0)
+        cached = self._cache.get(name)
+        if cached is not None and cached[1] > time.monotonic() and cached[2] == generation:
+            return cached[0]
+        version = await db.scalar(select(CollectionVersionORM.version).where(CollectionVersionORM.name == name))
+        version = version or 0
+        self._cache[name] = (version, time.monotonic() + self._ttl, generation)
+        return version
+
+    async def bump(self, db, name: str) -> int:
+        # The updated row stays locked until commit, so bumps commit in version order.
+        result = await db.execute(
+            update(CollectionVersionORM)
+            .where(CollectionVersionORM.name == name)
+            .values(version=CollectionVersionORM.version + 1)
+            .returning(CollectionVersionORM.version)
+            .execution_options(synchronize_session=False)
+        )
+        db.info.setdefault("bumped_collections", set()).add(name)
+        db.info["collection_versions"] = self
+        return result.scalar_one()
+
+    async def wait_for_change(self, db, name: str, version: int, timeout: float) -> bool:
+        """Wait until the collection is newer than `version`; False if `timeout` runs out.
+
+        Local commits wake waiters right away; other replicas' writes are
+        noticed when the cached version expires. The session's transaction is
+        ended before each wait so an idle waiter does not hold a connection.
+        """
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        while True:
+            if await self.get(db, name) > version:
+                return True
+            await db.rollback()
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                return False
+            waiter = self._waiters.setdefault(name, asyncio.Event())
+            try:
+                await asyncio.wait_for(waiter.wait(), min(remaining, self._ttl))
+            except TimeoutError:
+                pass
+
+    def forget(self, name: str):
+        # next() on a count is atomic, so this is safe from the sync session's worker threads too.
+        self._generations[name] = next(self._next_generation)
+        self._cache.pop(name, None)
+        if self._loop is not None and name in self._waiters:
+            # Commits made through the sync session run in a worker thread.
+            self._loop.call_soon_threadsafe(self._wake, name)
+
+    def _wake(self, name: str):
+        waiter = self._waiters.pop(name, None)
+        if waiter is not None:
+            waiter.set()
+
+    def etag(self, name: str, version: int) -> str:
+        return f'"{name}.{version}"'
+
+
+@event.listens_for(Session, "after_commit")
+def _forget_committed_versions(session):
+    versions = session.info.pop("collection_versions", None)
+    for name in session.info.pop("bumped_collections", ()):
+        versions.forget(name)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_bumped_versions(session):
+    session.info.pop("collection_versions", None)
+    session.info.pop("bumped_collections", None)
+
+
+def etag_matches(if_none_match: str | None, etag: str) -> bool:
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    return etag in (tag.strip().removeprefix("W/") for tag in if_none_match.split(","))
@@ -0,0 +1,125 @@
+import math
+import threading
+import time
+
+
+class RollingCounter:
+    """Event counts in fixed-width time buckets over a sliding horizon.
+
+    Buckets live in a ring indexed by bucket number, so adding and summing a
+    window cost depends only on the window length, not on how many events
+    were recorded.
+    """
+
+    def __init__(self, bucket_seconds: int = 60, horizon_seconds: int = 86400):
+        self._bucket_seconds = bucket_seconds
+        self._size = max(1, horizon_seconds // bucket_seconds)
+        self._counts = [0] * self._size
+        self._buckets = [-1] * self._size
+
+    def add(self, when: float, count: int = 1):
+        bucket = int(when // self._bucket_seconds)
+        if bucket <= int(time.time() // self._bucket_seconds) - self._size:
+            return
+        slot = bucket % self._size
+        if self._buckets[slot] != bucket:
+            self._buckets[slot] = bucket
+            self._counts[slot] = 0
+        self._counts[slot] += count
+
+    def total(self, window_seconds: float) -> int:
+        current = int(time.time() // self._bucket_seconds)
+        span = min(self._size, max(1, math.ceil(window_seconds / self._bucket_seconds)))
+        total = 0
+        for bucket in range(current - span + 1, current + 1):
+            slot = bucket % self._size
+            if self._buckets[slot] == bucket:
+                total += self._counts[slot]
+        return total
+
+
+class Counts:
+    __slots__ = ("total", "done")
+
+    def __init__(self):
+        self.total = 0
+        self.done = 0
+
+    def summary(self) -> dict:
+        pending = self.total - self.done
+        rate = self.done / self.total * 100 if self.total else 0.0
+        return {
+            "total_tasks": self.total,
+            "completed_tasks": self.done,
+            "pending_tasks": pending,
+            "completion_rate": f"{rate:.2f}%",
+        }
+
+
+class TaskAggregates:
+    """Global and per-project task counters maintained from the task change feed.
+
+    Each task's last known (project_id, is_done) is kept so an upsert can
+    subtract the old contribution and add the new one. Upserts carry the
+    full task state, which makes applying a change twice a no-op.
+    """
+
+    def __init__(self):
+        self._tasks: dict[int, tuple[int | None, bool]] = {}
+        self._overall = Counts()
+        self._projects: dict[int | None, Counts] = {}
+        self._lock = threading.Lock()
+        self.created = RollingCounter()
+        self.completed = RollingCounter()
+
+    def _apply(self, state, sign: int):
+        project_id, is_done = state
+        counts = self._projects.get(project_id)
+        if counts is None:
+            counts = self._projects[project_id] = Counts()
+        for c in (self._overall, counts):
+            c.total += sign
+            if is_done:
+                c.done += sign
+        if not counts.total:
+            del self._projects[project_id]
+
+    def upsert(self, task: dict, when: float | None = None):
+        new = (task.get("project_id"), bool(task.get("is_done")))
+        with self._lock:
+            old = self._tasks.get(task["id"])
+            if old == new:
+                return
+            if old is not None:
+                self._apply(old, -1)
+            self._apply(new, 1)
+            self._tasks[task["id"]] = new
+            if when is not None:
+                if old is None:
+                    self.created.add(when)
+                if new[1] and (old is None or not old[1]):
+                    self.completed.add(when)
+
+    def delete(self, task_id: int):
+        with self._lock:
+            old = self._tasks.pop(task_id, None)
+            if old is not None:
+                self._apply(old, -1)
+
+    def summary(self) -> dict:
+        with self._lock:
+            return self._overall.summary()
+
+    def project_summary(self, project_id: int | None) -> dict:
+        with self._lock:
+            return self._projects.get(project_id, Counts()).summary()
+
+    def projects(self) -> dict:
+        with self._lock:
+            return {
+                "unassigned" if pid is None else str(pid): counts.summary()
+                for pid, counts in self._projects.items()
+            }
+
+    def __len__(self):
+        return len(self._tasks)
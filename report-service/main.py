@@ -1,29 +1,229 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, HTTPException, Query, Request, Response
+from typing import Optional
+from consul import Consul
+from discovery import ServiceRegistry
+from balancer import LoadBalancer
+from aggregates import TaskAggregates
+from read_model import DashboardView, decode_cursor
+from telemetry import Telemetry, TelemetryMiddleware
+import asyncio
+import httpx
+import logging
+import os
+import socket
+import time
+import uuid
+
+CONSUL_HOST = os.getenv("CONSUL_HOST", "localhost")
+SERVICE_NAME = os.getenv("SERVICE_NAME", "report-service")
+SERVICE_PORT = int(os.getenv("SERVICE_PORT", 8003))
+FEED_PAGE_SIZE = 500
+FEED_WAIT = float(os.getenv("REPORT_FEED_WAIT_SECONDS", 20))
+FEED_RETRY_DELAY = float(os.getenv("REPORT_FEED_RETRY_DELAY", 5))
+MAX_DASHBOARD_PAGE_SIZE = 500
+# The dashboard version restarts with the process, so ETags also carry a per-process epoch.
+ETAG_EPOCH = uuid.uuid4().hex[:8]
+
+consul_client = Consul(host=CONSUL_HOST)
+telemetry = Telemetry(SERVICE_NAME)
+registry = ServiceRegistry(consul_client)
+balancer = LoadBalancer(registry, failure_exceptions=(httpx.TransportError,))
+aggregates = TaskAggregates()
+dashboard = DashboardView()
+
+# Every replica follows the task and project change feeds itself, so each one
+# sees every change; the view is served once both feeds have been read to the end.
+feeds = {"project-service": None, "task-service": None}
+caught_up = set()
+feed_tasks = []
+feed_client = None
+
+
 app = FastAPI()
+app.add_middleware(TelemetryMiddleware, telemetry=telemetry)
+
+def get_service_ip():
+    try:
+        return socket.gethostbyname(SERVICE_NAME)
+    except:
+        return "127.0.0.1"
+
+
+def apply_task_change(change: dict, when: Optional[float]):
+    if change["op"] == "delete":
+        aggregates.delete(change["id"])
+        dashboard.delete_task(change["id"])
+    else:
+        aggregates.upsert(change["data"], when)
+        dashboard.upsert_task(change["data"])
+
+def apply_project_change(change: dict, when: Optional[float]):
+    if change["op"] == "delete":
+        dashboard.delete_project(change["id"])
+    else:
+        dashboard.upsert_project(change["data"])
+
+FEED_HANDLERS = {"task-service": apply_task_change, "project-service": apply_project_change}
+
+
+async def fetch_changes(client: httpx.AsyncClient, service_name: str, cursor: Optional[str], wait: float) -> dict:
+    params = {"limit": FEED_PAGE_SIZE, "wait": wait}
+    if cursor:
+        params["after"] = cursor
+    with balancer.lease(service_name) as lease:
+        if lease is None:
+            raise RuntimeError(f"Service '{service_name}' unavailable")
+        with telemetry.outbound(service_name, "GET") as call:
+            try:
+                response = await client.get(f"{lease.url}/changes", params=params, headers=call.headers)
+            except httpx.TransportError:
+                lease.failed = True
+                raise
+            call.status = response.status_code
+        lease.record(response.status_code)
+    response.raise_for_status()
+    return response.json()
+
+async def follow(client: httpx.AsyncClient, service_name: str):
+    """Apply a service's change feed from the start, then long-poll it for new changes."""
+    apply = FEED_HANDLERS[service_name]
+    while True:
+        live = service_name in caught_up
+        try:
+            page = await fetch_changes(client, service_name, feeds[service_name], FEED_WAIT if live else 0)
+        except Exception as e:
+            logging.error(f"Failed to read the {service_name} change feed: {str(e)}")
+            await asyncio.sleep(FEED_RETRY_DELAY)
+            continue
+        # Changes read while catching up are existing state, not new activity for the throughput counters.
+        when = time.time() if live else None
+        for change in page["changes"]:
+            apply(change, when)
+        feeds[service_name] = page["cursor"]
+        if not live and not page["has_more"]:
+            caught_up.add(service_name)
+            logging.info(f"Caught up with the {service_name} change feed")
+
+def is_ready() -> bool:
+    return len(caught_up) == len(feeds)
+
+
+@app.on_event("startup")
+async def startup_event():
+    global feed_client
+    registry.start(["task-service", "project-service"])
+    telemetry.start()
+    feed_client = httpx.AsyncClient(timeout=httpx.Timeout(FEED_WAIT + 10.0, connect=2.0))
+    feed_tasks.extend(asyncio.create_task(follow(feed_client, name)) for name in feeds)
+
+    service_ip = get_service_ip()
+    service_id = f"{SERVICE_NAME}-{service_ip}-{SERVICE_PORT}"
+
+    try:
+        consul_client.agent.service.register(
+            name=SERVICE_NAME,
+            service_id=service_id,
+            address=service_ip,
+            port=SERVICE_PORT,
+            check={
+                "name": "HTTP API Check",
+                "http": f"http://{service_ip}:{SERVICE_PORT}/health",
+                "interval": "10s",
+                "timeout": "5s"
+            }
+        )
+        logging.info(f"Successfully registered with Consul as {SERVICE_NAME}")
+    except Exception as e:
+        logging.error(f"Failed to register with Consul: {str(e)}")
 
-dummy_tasks = [
-    {"id": 1, "title": "Zadanie A", "is_done": True},
-    {"id": 2, "title": "Zadanie B", "is_done": False},
-    {"id": 3, "title": "Zadanie C", "is_done": True},
-    {"id": 4, "title": "Zadanie D", "is_done": False},
-]
 
 @app.get("/report/tasks_summary")
 def task_summary():
-    total = len(dummy_tasks)
-    done = len([t for t in dummy_tasks if t["is_done"]])
-    pending = total - done
-    return {
-        "total_tasks": total,
-        "completed_tasks": done,
-        "pending_tasks": pending,
-        "completion_rate": f"{(done / total * 100):.2f}%"
-    }
+    return aggregates.summary()
 
 @app.get("/report/progress_chart_data")
 def progress_chart_data():
+    summary = aggregates.summary()
     return {
         "labels": ["Zakończone", "Do zrobienia"],
-        "values": [len([t for t in dummy_tasks if t["is_done"]]),
-                   len([t for t in dummy_tasks if not t["is_done"]])]
+        "values": [summary["completed_tasks"], summary["pending_tasks"]]
+    }
+
+@app.get("/report/projects")
+def projects_summary():
+    return aggregates.projects()
+
+@app.get("/report/projects/{project_id}/summary")
+def project_summary(project_id: int):
+    return aggregates.project_summary(project_id)
+
+@app.get("/report/throughput")
+def throughput(window: int = Query(3600, ge=60, le=86400)):
+    return {
+        "window_seconds": window,
+        "created_tasks": aggregates.created.total(window),
+        "completed_tasks": aggregates.completed.total(window),
+    }
+
+@app.get("/report/dashboard")
+def dashboard_view(
+    request: Request,
+    response: Response,
+    limit: int = Query(50, ge=1, le=MAX_DASHBOARD_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    project_limit: int = Query(100, ge=0, le=MAX_DASHBOARD_PAGE_SIZE),
+):
+    if not is_ready():
+        raise HTTPException(status_code=503, detail="Dashboard view is still loading")
+    after = None
+    if cursor:
+        try:
+            after = decode_cursor(cursor)
+        except (TypeError, ValueError):
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+
+    etag = f'"dashboard.{ETAG_EPOCH}.{dashboard.version}"'
+    if etag in (tag.strip().removeprefix("W/") for tag in request.headers.get("if-none-match", "").split(",")):
+        return Response(status_code=304, headers={"ETag": etag})
+    # The view may move on while the page is built; the ETag then only ever understates it.
+    view = dashboard.page(limit, after, project_limit)
+    response.headers.update({"ETag": etag, "Cache-Control": "no-cache"})
+    return view
+
+@app.get("/report/status")
+def report_status():
+    return {
+        "bootstrapped": is_ready(),
+        "tracked_tasks": len(aggregates),
+        "dashboard_version": dashboard.version,
+        "feeds": {name: {"caught_up": name in caught_up, "cursor": cursor} for name, cursor in feeds.items()},
     }
+
+
+@app.get("/metrics", include_in_schema=False)
+def prometheus_metrics():
+    return Response(telemetry.render(), media_type="text/plain; version=0.0.4")
+
+
+@app.get("/health")
+def health_check():
+    return {"status": "UP"}
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    registry.stop()
+    for task in feed_tasks:
+        task.cancel()
+    await asyncio.gather(*feed_tasks, return_exceptions=True)
+    if feed_client is not None:
+        await feed_client.aclose()
+    telemetry.stop()
+    service_ip = get_service_ip()
+    service_id = f"{SERVICE_NAME}-{service_ip}-{SERVICE_PORT}"
+
+    try:
+        consul_client.agent.service.deregister(service_id)
+        logging.info("Successfully unregistered from Consul")
+    except Exception as e:
+        logging.error(f"Failed to unregister from Consul: {str(e)}")
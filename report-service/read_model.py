@@ -0,0 +1,129 @@
+import base64
+import json
+import threading
+
+from sortedcontainers import SortedList
+
+from aggregates import Counts
+
+
+def encode_cursor(task_id: int) -> str:
+    # Same shape as task-service cursors ([sort, sort value, id] with sort=id), so either can page.
+    return base64.urlsafe_b64encode(json.dumps(["id", task_id, task_id]).encode()).decode()
+
+def decode_cursor(cursor: str) -> int:
+    values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    if not isinstance(values, list) or len(values) != 3 or values[0] != "id":
+        raise ValueError(cursor)
+    if not isinstance(values[2], int) or isinstance(values[2], bool):
+        raise ValueError(cursor)
+    return values[2]
+
+
+class DashboardView:
+    """Denormalized dashboard: projects with task rollups, tasks with project names.
+
+    Maintained from the task and project change feeds. Task and project ids
+    are kept in sorted lists, so adding or dropping one is O(log n) and a
+    page of tasks or the first projects is a bisect plus a slice. `version`
+    changes with every applied change and backs the endpoint's ETag.
+    """
+
+    def __init__(self):
+        self._tasks: dict[int, dict] = {}
+        self._task_ids = SortedList()
+        self._projects: dict[int, dict] = {}
+        self._project_ids = SortedList()
+        self._rollups: dict[int | None, Counts] = {}
+        self._lock = threading.Lock()
+        self.version = 0
+
+    def _count(self, task: dict, sign: int):
+        counts = self._rollups.get(task["project_id"])
+        if counts is None:
+            counts = self._rollups[task["project_id"]] = Counts()
+        counts.total += sign
+        if task["is_done"]:
+            counts.done += sign
+        if not counts.total:
+            del self._rollups[task["project_id"]]
+
+    def upsert_task(self, task: dict):
+        new = {
+            "id": task["id"],
+            "title": task.get("title", ""),
+            "description": task.get("description") or "",
+            "project_id": task.get("project_id"),
+            "is_done": bool(task.get("is_done")),
+        }
+        with self._lock:
+            old = self._tasks.get(new["id"])
+            if old == new:
+                return
+            if old is None:
+                self._task_ids.add(new["id"])
+            else:
+                self._count(old, -1)
+            self._count(new, 1)
+            self._tasks[new["id"]] = new
+            self.version += 1
+
+    def delete_task(self, task_id: int):
+        with self._lock:
+            old = self._tasks.pop(task_id, None)
+            if old is None:
+                return
+            self._task_ids.remove(task_id)
+            self._count(old, -1)
+            self.version += 1
+
+    def upsert_project(self, project: dict):
+        new = {"id": project["id"], "name": project.get("name", ""), "description": project.get("description") or ""}
+        with self._lock:
+            old = self._projects.get(new["id"])
+            if old == new:
+                return
+            if old is None:
+                self._project_ids.add(new["id"])
+            self._projects[new["id"]] = new
+            self.version += 1
+
+    def delete_project(self, project_id: int):
+        with self._lock:
+            if self._projects.pop(project_id, None) is None:
+                return
+            self._project_ids.remove(project_id)
+            self.version += 1
+
+    def _project_row(self, project: dict) -> dict:
+        counts = self._rollups.get(project["id"], Counts())
+        return {
+            **project,
+            "task_count": counts.total,
+            "done_count": counts.done,
+            "pending_count": counts.total - counts.done,
+        }
+
+    def _task_row(self, task: dict) -> dict:
+        project = self._projects.get(task["project_id"])
+        return {**task, "project_name": project["name"] if project else None}
+
+    def page(self, limit: int, after: int | None, project_limit: int) -> dict:
+        with self._lock:
+            start = self._task_ids.bisect_right(after) if after is not None else 0
+            ids = list(self._task_ids.islice(start, start + limit + 1))
+            next_cursor = None
+            if len(ids) > limit:
+                ids = ids[:limit]
+                next_cursor = encode_cursor(ids[-1])
+            unassigned = self._rollups.get(None, Counts())
+            return {
+                "projects": [self._project_row(self._projects[pid]) for pid in self._project_ids.islice(0, project_limit)],
+                "tasks": [self._task_row(self._tasks[tid]) for tid in ids],
+                "next_cursor": next_cursor,
+                "unassigned": {"task_count": unassigned.total, "done_count": unassigned.done},
+                "totals": {"projects": len(self._projects), "tasks": len(self._tasks)},
+            }
+
+    def __len__(self):
+        return len(self._tasks)
@@ -0,0 +1,455 @@
+import json
+import logging
+import os
+import random
+import threading
+import time
+import urllib.request
+from bisect import bisect_left
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_current_span: ContextVar["Span | None"] = ContextVar("current_span", default=None)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _labels(names, values, extra: str = "") -> str:
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Histogram:
+    """Prometheus histogram with one series per label combination."""
+
+    def __init__(self, name: str, help: str, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        self._series: dict[tuple, list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *labels):
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                # Per-bucket counts (the last one is +Inf), then the sum.
+                series = self._series[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[bisect_left(self.buckets, value)] += 1
+            series[-1] += value
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = [(labels, list(values)) for labels, values in self._series.items()]
+        for labels, values in series:
+            total = 0
+            for bound, count in zip(self.buckets + ("+Inf",), values):
+                total += count
+                le = f'le="{bound}"'
+                lines.append(f"{self.name}_bucket{_labels(self.labels, labels, le)} {total}")
+            lines.append(f"{self.name}_sum{_labels(self.labels, labels)} {values[-1]}")
+            lines.append(f"{self.name}_count{_labels(self.labels, labels)} {total}")
+        return lines
+
+
+class Gauge:
+    """Prometheus gauge; `collect` can compute the values at scrape time instead."""
+
+    def __init__(self, name: str, help: str, labels=(), collect=None):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._collect = collect
+        self._values: dict[tuple, float] = {}
+
+    def inc(self, *labels, amount: float = 1):
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    def dec(self, *labels, amount: float = 1):
+        self._values[labels] = self._values.get(labels, 0) - amount
+
+    def render(self) -> list[str]:
+        values = self._collect() if self._collect is not None else dict(self._values)
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} gauge"]
+        lines.extend(f"{self.name}{_labels(self.labels, labels)} {value}" for labels, value in values.items())
+        return lines
+
+
+class Span:
+    __slots__ = ("trace_id", "span_id", "parent_id", "sampled", "name", "kind", "start", "end", "attributes", "error")
+
+    def __init__(self, name: str, kind: int, trace_id: str, parent_id: str | None, sampled: bool):
+        self.trace_id = trace_id
+        self.span_id = f"{random.getrandbits(64):016x}"
+        self.parent_id = parent_id
+        self.sampled = sampled
+        self.name = name
+        self.kind = kind
+        self.start = time.time_ns()
+        self.end = None
+        self.attributes = {}
+        self.error = False
+
+    @property
+    def traceparent(self) -> str:
+        return f"00-{self.trace_id}-{self.span_id}-{'01' if self.sampled else '00'}"
+
+
+def parse_traceparent(header: str | None):
+    """(trace_id, parent span_id, sampled) from a W3C traceparent header, or None."""
+    if not header:
+        return None
+    parts = header.strip().split("-")
+    if len(parts) < 4 or len(parts[1]) != 32 or len(parts[2]) != 16 or parts[0] == "ff":
+        return None
+    try:
+        trace_id, span_id, flags = int(parts[1], 16), int(parts[2], 16), int(parts[3][:2], 16)
+    except ValueError:
+        return None
+    if not trace_id or not span_id:
+        return None
+    return parts[1], parts[2], bool(flags & 1)
+
+def current_traceparent() -> str | None:
+    span = _current_span.get()
+    return span.traceparent if span is not None else None
+
+
+SPAN_KINDS = {"internal": 1, "server": 2, "client": 3}
+
+
+class SpanExporter:
+    """Batches finished spans in a background thread and writes them as OTLP/JSON.
+
+    OTEL_TRACES_EXPORTER=file appends one OTLP export request per line to
+    OTEL_TRACES_FILE; OTEL_TRACES_EXPORTER=otlp POSTs them to the collector
+    at OTEL_EXPORTER_OTLP_ENDPOINT (/v1/traces). Spans that arrive while the
+    queue is full are dropped and counted rather than slowing requests down.
+    """
+
+    def __init__(self, service_name: str, target: str, destination: str, interval: float = 2.0,
+                 batch_size: int = 512, max_queue: int = 10000):
+        self._service_name = service_name
+        self._target = target
+        self._destination = destination
+        self._interval = interval
+        self._batch_size = batch_size
+        self._max_queue = max_queue
+        self._queue: deque[Span] = deque()
+        self._wake = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = None
+        self.exported = 0
+        self.dropped = 0
+        self.failed = 0
+
+    @classmethod
+    def from_env(cls, service_name: str) -> "SpanExporter | None":
+        target = os.getenv("OTEL_TRACES_EXPORTER", "none").lower()
+        if target == "file":
+            return cls(service_name, target, os.getenv("OTEL_TRACES_FILE", "traces.jsonl"))
+        if target == "otlp":
+            endpoint = os.getenv("OTEL_EXPORTER_OTLP_ENDPOINT", "http://localhost:4318").rstrip("/")
+            return cls(service_name, target, f"{endpoint}/v1/traces")
+        if target != "none":
+            logging.warning(f"Unknown OTEL_TRACES_EXPORTER '{target}', tracing export disabled")
+        return None
+
+    def start(self):
+        if self._thread is None:
+            self._stopped.clear()
+            self._thread = threading.Thread(target=self._run, name="span-exporter", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def export(self, span: Span):
+        if len(self._queue) >= self._max_queue:
+            self.dropped += 1
+            return
+        self._queue.append(span)
+        if len(self._queue) >= self._batch_size:
+            self._wake.set()
+
+    def _run(self):
+        while not self._stopped.is_set():
+            self._wake.wait(self._interval)
+            self._wake.clear()
+            self._flush()
+        self._flush()
+
+    def _flush(self):
+        while self._queue:
+            batch = []
+            while self._queue and len(batch) < self._batch_size:
+                batch.append(self._queue.popleft())
+            try:
+                self._write(json.dumps(self._encode(batch), separators=(",", ":")).encode())
+                self.exported += len(batch)
+            except Exception as e:
+                self.failed += len(batch)
+                logging.warning(f"Failed to export {len(batch)} spans: {e}")
+                return
+
+    def _write(self, body: bytes):
+        if self._target == "file":
+            with open(self._destination, "ab") as f:
+                f.write(body + b"\n")
+            return
+        request = urllib.request.Request(
+            self._destination, data=body, headers={"Content-Type": "application/json"}, method="POST"
+        )
+        with urllib.request.urlopen(request, timeout=5) as response:
+            response.read()
+
+    def _encode(self, spans) -> dict:
+        def attribute(key, value):
+            if isinstance(value, bool):
+                return {"key": key, "value": {"boolValue": value}}
+            if isinstance(value, int):
+                return {"key": key, "value": {"intValue": str(value)}}
+            return {"key": key, "value": {"stringValue": str(value)}}
+
+        encoded = []
+        for span in spans:
+            item = {
+                "traceId": span.trace_id,
+                "spanId": span.span_id,
+                "name": span.name,
+                "kind": span.kind,
+                "startTimeUnixNano": str(span.start),
+                "endTimeUnixNano": str(span.end),
+                "attributes": [attribute(k, v) for k, v in span.attributes.items()],
+                "status": {"code": 2 if span.error else 0},
+            }
+            if span.parent_id:
+                item["parentSpanId"] = span.parent_id
+            encoded.append(item)
+        return {
+            "resourceSpans": [{
+                "resource": {"attributes": [attribute("service.name", self._service_name)]},
+                "scopeSpans": [{"scope": {"name": "telemetry"}, "spans": encoded}],
+            }]
+        }
+
+    def stats(self) -> dict:
+        return {"queued": len(self._queue), "exported": self.exported, "dropped": self.dropped, "failed": self.failed}
+
+
+class OutboundCall:
+    __slots__ = ("headers", "status")
+
+    def __init__(self, headers: dict):
+        self.headers = headers
+        self.status = None
+
+
+class Telemetry:
+    """Metrics and trace context for one service.
+
+    Request latency per route, requests in flight, database query time per
+    statement type and outbound call time per upstream are kept as
+    Prometheus histograms and gauges and served by `render()`. Every
+    request gets a W3C trace context, continued from an incoming
+    `traceparent` header and passed on through `outbound()`. Spans are only
+    exported when an exporter is configured and the trace is sampled
+    (OTEL_TRACES_SAMPLER_ARG, default 1.0); with export off a request costs
+    a pair of ids and a few counter updates.
+    """
+
+    def __init__(self, service_name: str):
+        self.service_name = service_name
+        self.exporter = SpanExporter.from_env(service_name)
+        self._sample_ratio = float(os.getenv("OTEL_TRACES_SAMPLER_ARG", 1.0))
+        self.requests = Histogram(
+            "http_server_request_duration_seconds", "Time to serve a request.", ("method", "route", "status")
+        )
+        self.in_flight = Gauge("http_server_requests_in_flight", "Requests being served.")
+        self.queries = Histogram("db_query_duration_seconds", "Time spent executing a statement.", ("operation",))
+        self.outbound_calls = Histogram(
+            "http_client_request_duration_seconds", "Time until an upstream answered.", ("upstream", "method", "status")
+        )
+        self.renders = Histogram("template_render_duration_seconds", "Time to render a template.", ("template",))
+        self._metrics = [self.requests, self.in_flight, self.queries, self.outbound_calls, self.renders]
+
+    def add_metric(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def start(self):
+        if self.exporter is not None:
+            self.exporter.start()
+
+    def stop(self):
+        if self.exporter is not None:
+            self.exporter.stop()
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        if self.exporter is not None:
+            lines.extend(Gauge(
+                "trace_spans", "Span export counters.", ("state",),
+                collect=lambda: {(k,): v for k, v in self.exporter.stats().items()},
+            ).render())
+        return "\n".join(lines) + "\n"
+
+    def _new_span(self, name: str, kind: str, traceparent: str | None = None) -> Span:
+        parent = _current_span.get()
+        if traceparent is not None or parent is None:
+            context = parse_traceparent(traceparent)
+            if context is not None:
+                trace_id, parent_id, sampled = context
+            else:
+                trace_id, parent_id = f"{random.getrandbits(128):032x}", None
+                sampled = random.random() < self._sample_ratio
+        else:
+            trace_id, parent_id, sampled = parent.trace_id, parent.span_id, parent.sampled
+        return Span(name, SPAN_KINDS[kind], trace_id, parent_id, sampled)
+
+    def _recording(self, span: Span) -> bool:
+        # The sampling decision is passed on even when this service exports nothing.
+        return span.sampled and self.exporter is not None
+
+    def _finish(self, span: Span):
+        if self._recording(span):
+            span.end = time.time_ns()
+            self.exporter.export(span)
+
+    @contextmanager
+    def span(self, name: str, kind: str = "internal", traceparent: str | None = None, **attributes):
+        """Run the block as a span, a child of the current one or of `traceparent`."""
+        span = self._new_span(name, kind, traceparent)
+        span.attributes.update(attributes)
+        token = _current_span.set(span)
+        try:
+            yield span
+        except BaseException:
+            span.error = True
+            raise
+        finally:
+            _current_span.reset(token)
+            self._finish(span)
+
+    @contextmanager
+    def outbound(self, upstream: str, method: str):
+        """Time a call to `upstream`; send `call.headers` with it and set `call.status`."""
+        span = self._new_span(f"{method} {upstream}", "client")
+        call = OutboundCall({"traceparent": span.traceparent})
+        started = time.perf_counter()
+        try:
+            yield call
+        except BaseException:
+            span.error = True
+            raise
+        finally:
+            status = str(call.status) if call.status is not None else "error"
+            self.outbound_calls.observe(time.perf_counter() - started, upstream, method, status)
+            if self._recording(span):
+                span.attributes.update({"peer.service": upstream, "http.response.status_code": status})
+                span.error = span.error or call.status is None or call.status >= 500
+                self._finish(span)
+
+    @contextmanager
+    def timed(self, histogram: Histogram, *labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            histogram.observe(time.perf_counter() - started, *labels)
+
+    def instrument_engine(self, engine):
+        """Time every statement run on `engine` (sync or async)."""
+        from sqlalchemy import event
+
+        engine = getattr(engine, "sync_engine", engine)
+
+        @event.listens_for(engine, "before_cursor_execute")
+        def _before(conn, cursor, statement, parameters, context, executemany):
+            context._telemetry_started = time.perf_counter()
+
+        @event.listens_for(engine, "after_cursor_execute")
+        def _after(conn, cursor, statement, parameters, context, executemany):
+            started = getattr(context, "_telemetry_started", None)
+            if started is None:
+                return
+            duration = time.perf_counter() - started
+            operation = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else "OTHER"
+            self.queries.observe(duration, operation)
+            parent = _current_span.get()
+            if parent is not None and self._recording(parent):
+                span = Span(f"db {operation}", SPAN_KINDS["client"], parent.trace_id, parent.span_id, True)
+                span.start = time.time_ns() - int(duration * 1e9)
+                span.attributes["db.operation"] = operation
+                self._finish(span)
+
+
+class TelemetryMiddleware:
+    """ASGI middleware recording every HTTP request's latency, status and trace.
+
+    Latency is labelled with the matched route's path template, so
+    `/tasks/{task_id}` is one series however many ids are requested.
+    """
+
+    def __init__(self, app, telemetry: Telemetry):
+        self.app = app
+        self.telemetry = telemetry
+        self._routes = None
+
+    def _route(self, scope) -> str:
+        endpoint = scope.get("endpoint")
+        if endpoint is None:
+            return "unmatched"
+        if self._routes is None:
+            self._routes = {
+                getattr(route, "endpoint", None): route.path
+                for route in scope["app"].routes if hasattr(route, "path")
+            }
+        return self._routes.get(endpoint, "unmatched")
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        telemetry = self.telemetry
+        traceparent = None
+        for name, value in scope["headers"]:
+            if name == b"traceparent":
+                traceparent = value.decode("latin-1")
+                break
+        method = scope["method"]
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        telemetry.in_flight.inc()
+        started = time.perf_counter()
+        with telemetry.span(method, "server", traceparent) as span:
+            try:
+                await self.app(scope, receive, send_with_status)
+            finally:
+                telemetry.in_flight.dec()
+                route = self._route(scope)
+                telemetry.requests.observe(time.perf_counter() - started, method, route, str(status))
+                span.name = f"{method} {route}"
+                span.error = status >= 500
+                span.attributes.update({"http.route": route, "http.response.status_code": status})
@@ -0,0 +1,59 @@
+import sqlite3
+import threading
+from datetime import datetime
+
+
+class ScheduleDatabase:
+    """SQLite file that keeps schedule items and their firing state across restarts."""
+
+    def __init__(self, path: str):
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS schedule_items ("
+                " id INTEGER PRIMARY KEY,"
+                " title TEXT NOT NULL,"
+                " datetime TEXT NOT NULL,"
+                " description TEXT NOT NULL,"
+                " related_task_id INTEGER NOT NULL,"
+                " fired_at REAL)"
+            )
+
+    def load(self):
+        """Yield (item fields, fired) for every stored item."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id, title, datetime, description, related_task_id, fired_at FROM schedule_items"
+            ).fetchall()
+        for item_id, title, when, description, related_task_id, fired_at in rows:
+            yield {
+                "id": item_id,
+                "title": title,
+                "datetime": datetime.fromisoformat(when),
+                "description": description,
+                "related_task_id": related_task_id,
+            }, fired_at is not None
+
+    def insert(self, item):
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT INTO schedule_items (id, title, datetime, description, related_task_id) VALUES (?, ?, ?, ?, ?)",
+                (item.id, item.title, item.datetime.isoformat(), item.description, item.related_task_id),
+            )
+
+    def delete(self, item_id: int):
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM schedule_items WHERE id = ?", (item_id,))
+
+    def mark_fired(self, item_ids, fired_at: float):
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "UPDATE schedule_items SET fired_at = ? WHERE id = ?",
+                [(fired_at, item_id) for item_id in item_ids],
+            )
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,204 @@
+import heapq
+import logging
+import os
+import threading
+import time
+from bisect import bisect_left
+from datetime import timezone
+
+from store import sort_key
+
+
+LAG_BUCKETS_MS = (1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000, 60000)
+
+
+def due_timestamp(value) -> float:
+    return sort_key(value).replace(tzinfo=timezone.utc).timestamp()
+
+
+class LagHistogram:
+    """Firing lag (fire time minus due time) in fixed millisecond buckets."""
+
+    def __init__(self):
+        self._counts = [0] * (len(LAG_BUCKETS_MS) + 1)
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.last_ms = 0.0
+
+    def observe(self, lag_ms: float):
+        lag_ms = max(0.0, lag_ms)
+        self._counts[bisect_left(LAG_BUCKETS_MS, lag_ms)] += 1
+        self.count += 1
+        self.total_ms += lag_ms
+        self.max_ms = max(self.max_ms, lag_ms)
+        self.last_ms = lag_ms
+
+    def percentile(self, p: float) -> float:
+        """Upper bound of the bucket holding the p-th percentile."""
+        if not self.count:
+            return 0.0
+        rank = p / 100 * self.count
+        seen = 0
+        for bound, count in zip(LAG_BUCKETS_MS + (self.max_ms,), self._counts):
+            seen += count
+            if seen >= rank:
+                return round(float(min(bound, self.max_ms)), 3)
+        return round(self.max_ms, 3)
+
+    def snapshot(self) -> dict:
+        return {
+            "count": self.count,
+            "last_ms": round(self.last_ms, 3),
+            "avg_ms": round(self.total_ms / self.count, 3) if self.count else 0.0,
+            "max_ms": round(self.max_ms, 3),
+            "p50_ms": self.percentile(50),
+            "p95_ms": self.percentile(95),
+            "p99_ms": self.percentile(99),
+            "buckets_ms": dict(zip([str(b) for b in LAG_BUCKETS_MS] + ["+Inf"], self._counts)),
+        }
+
+
+class Dispatcher:
+    """Fires schedule items when they become due.
+
+    Pending items sit in a min-heap of (due timestamp, id), and a single
+    thread sleeps until the earliest one is due, so the cost is O(log n) per
+    item and nothing scans the full schedule. Items whose due times fall
+    within `coalesce` seconds of each other are delivered as one batch.
+    Cancelled or rescheduled items are dropped lazily when they reach the top
+    of the heap. A failed delivery is retried with exponential backoff.
+
+    `deliver(items)` sends a batch and returns True on success.
+    `on_fired(ids, fired_at)` records the delivery durably.
+    """
+
+    def __init__(self, deliver, on_fired=None, coalesce: float | None = None,
+                 max_batch: int | None = None, max_backoff: float | None = None):
+        self._deliver = deliver
+        self._on_fired = on_fired
+        self._coalesce = coalesce if coalesce is not None else float(os.getenv("SCHEDULE_COALESCE_MS", 50)) / 1000
+        self._max_batch = max_batch or int(os.getenv("SCHEDULE_MAX_BATCH", 500))
+        self._max_backoff = max_backoff or float(os.getenv("SCHEDULE_MAX_BACKOFF", 60))
+        self._heap: list[tuple[float, int]] = []
+        self._pending: dict[int, tuple[float, object]] = {}
+        self._inflight: dict[int, object] = {}
+        self._attempts: dict[int, int] = {}
+        self._cond = threading.Condition()
+        self._thread = None
+        self._running = False
+        self.lag = LagHistogram()
+        self.fired = 0
+        self.batches = 0
+        self.failed_deliveries = 0
+
+    def schedule(self, item, due: float | None = None):
+        due = due_timestamp(item.datetime) if due is None else due
+        with self._cond:
+            self._pending[item.id] = (due, item)
+            heapq.heappush(self._heap, (due, item.id))
+            if self._heap[0][1] == item.id:
+                self._cond.notify()
+
+    def cancel(self, item_id: int):
+        with self._cond:
+            self._pending.pop(item_id, None)
+            self._inflight.pop(item_id, None)
+            self._attempts.pop(item_id, None)
+            if len(self._heap) > 2 * len(self._pending) + 1024:
+                self._heap = [(due, item_id) for item_id, (due, _) in self._pending.items()]
+                heapq.heapify(self._heap)
+
+    def start(self):
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name="schedule-dispatcher", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        with self._cond:
+            self._running = False
+            self._cond.notify()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def _next_batch(self):
+        with self._cond:
+            while self._running:
+                while self._heap and self._pending.get(self._heap[0][1], (None,))[0] != self._heap[0][0]:
+                    heapq.heappop(self._heap)
+                if not self._heap:
+                    self._cond.wait()
+                    continue
+                delay = self._heap[0][0] - time.time()
+                if delay > 0:
+                    self._cond.wait(delay)
+                    continue
+
+                horizon = self._heap[0][0] + self._coalesce
+                batch = []
+                while self._heap and self._heap[0][0] <= horizon and len(batch) < self._max_batch:
+                    due, item_id = heapq.heappop(self._heap)
+                    entry = self._pending.get(item_id)
+                    if entry is None or entry[0] != due:
+                        continue
+                    del self._pending[item_id]
+                    self._inflight[item_id] = entry[1]
+                    batch.append(entry)
+                return batch
+        return None
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                return
+            if not batch:
+                continue
+            items = [item for _, item in batch]
+            try:
+                delivered = self._deliver(items)
+            except Exception as e:
+                logging.error(f"Schedule dispatch failed: {str(e)}")
+                delivered = False
+
+            now = time.time()
+            with self._cond:
+                # Items cancelled while the batch was in flight are not retried.
+                live = [item for item in items if self._inflight.pop(item.id, None) is not None]
+                if not delivered:
+                    for item in live:
+                        attempts = self._attempts.get(item.id, 0) + 1
+                        self._attempts[item.id] = attempts
+                        due = now + min(self._max_backoff, 0.5 * 2 ** attempts)
+                        self._pending[item.id] = (due, item)
+                        heapq.heappush(self._heap, (due, item.id))
+                else:
+                    for item in items:
+                        self._attempts.pop(item.id, None)
+            if not delivered:
+                self.failed_deliveries += 1
+                continue
+
+            for item in items:
+                self.lag.observe((now - due_timestamp(item.datetime)) * 1000)
+            self.fired += len(batch)
+            self.batches += 1
+            if self._on_fired is not None:
+                try:
+                    self._on_fired([item.id for item in items], now)
+                except Exception as e:
+                    logging.error(f"Failed to record fired schedule items: {str(e)}")
+
+    def stats(self) -> dict:
+        with self._cond:
+            pending = len(self._pending)
+            next_due = self._heap[0][0] if self._heap else None
+        return {
+            "pending": pending,
+            "next_due": next_due,
+            "fired": self.fired,
+            "batches": self.batches,
+            "failed_deliveries": self.failed_deliveries,
+            "lag": self.lag.snapshot(),
+        }
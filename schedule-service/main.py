@@ -1,9 +1,35 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Query, Request, Response
+from fastapi.encoders import jsonable_encoder
 from pydantic import BaseModel
-from typing import List
-from datetime import datetime
+from typing import List, Optional
+from datetime import datetime, timezone
+from store import ScheduleStore
+from database import ScheduleDatabase
+from dispatcher import Dispatcher
+from telemetry import Telemetry, TelemetryMiddleware
+from consul import Consul
+import logging
+import os
+import queue
+import requests
+import socket
+import uuid
+
+CONSUL_HOST = os.getenv("CONSUL_HOST", "localhost")
+SERVICE_NAME = os.getenv("SERVICE_NAME", "schedule-service")
+SERVICE_PORT = int(os.getenv("SERVICE_PORT", 8004))
+
+consul_client = Consul(host=CONSUL_HOST)
+telemetry = Telemetry(SERVICE_NAME)
 
 app = FastAPI()
+app.add_middleware(TelemetryMiddleware, telemetry=telemetry)
+
+MAX_PAGE_SIZE = 1000
+WEBHOOK_URL = os.getenv("SCHEDULE_WEBHOOK_URL")
+WEBHOOK_TIMEOUT = float(os.getenv("SCHEDULE_WEBHOOK_TIMEOUT", 5))
+# The version counter restarts with the process, so ETags also carry a per-process epoch.
+ETAG_EPOCH = uuid.uuid4().hex[:8]
 
 class ScheduleItem(BaseModel):
     id: int
@@ -12,19 +38,171 @@ class ScheduleItem(BaseModel):
     description: str
     related_task_id: int
 
-schedule_items: List[ScheduleItem] = []
+schedule_items = ScheduleStore()
+database = ScheduleDatabase(os.getenv("SCHEDULE_DB_PATH", "schedule.db"))
+fired_events = queue.Queue(maxsize=int(os.getenv("SCHEDULE_QUEUE_SIZE", 10000)))
+
+
+def fired_message(items) -> dict:
+    return {
+        "fired_at": datetime.now(timezone.utc).isoformat(),
+        "items": jsonable_encoder(items),
+    }
+
+def deliver(items) -> bool:
+    message = fired_message(items)
+    if WEBHOOK_URL:
+        with telemetry.outbound("webhook", "POST") as call:
+            try:
+                response = requests.post(WEBHOOK_URL, json=message, headers=call.headers, timeout=WEBHOOK_TIMEOUT)
+            except requests.RequestException as e:
+                logging.error(f"Schedule webhook failed: {str(e)}")
+                return False
+            call.status = response.status_code
+        return response.status_code < 300
+    try:
+        fired_events.put_nowait(message)
+    except queue.Full:
+        return False
+    return True
+
+dispatcher = Dispatcher(deliver, on_fired=database.mark_fired)
+
+
+def etag_matches(if_none_match: str | None, etag: str) -> bool:
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    return etag in (tag.strip().removeprefix("W/") for tag in if_none_match.split(","))
+
+def schedule_etag(request: Request, response: Response):
+    """Set the ETag for the current schedule version, or return a 304 if the client has it."""
+    etag = f'"schedule.{ETAG_EPOCH}.{schedule_items.version}"'
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers={"ETag": etag})
+    response.headers.update({"ETag": etag, "Cache-Control": "no-cache"})
+    return None
+
+
+def get_service_ip():
+    try:
+        return socket.gethostbyname(SERVICE_NAME)
+    except:
+        return "127.0.0.1"
+
+
+@app.on_event("startup")
+def startup_event():
+    for fields, fired in database.load():
+        item = ScheduleItem(**fields)
+        schedule_items.add(item)
+        if not fired:
+            dispatcher.schedule(item)
+    dispatcher.start()
+    telemetry.start()
+    logging.info(f"Loaded {len(schedule_items)} schedule items")
+
+    service_ip = get_service_ip()
+    service_id = f"{SERVICE_NAME}-{service_ip}-{SERVICE_PORT}"
+
+    try:
+        consul_client.agent.service.register(
+            name=SERVICE_NAME,
+            service_id=service_id,
+            address=service_ip,
+            port=SERVICE_PORT,
+            check={
+                "name": "HTTP API Check",
+                "http": f"http://{service_ip}:{SERVICE_PORT}/health",
+                "interval": "10s",
+                "timeout": "5s"
+            }
+        )
+        logging.info(f"Successfully registered with Consul as {SERVICE_NAME}")
+    except Exception as e:
+        logging.error(f"Failed to register with Consul: {str(e)}")
+
+@app.on_event("shutdown")
+def shutdown_event():
+    dispatcher.stop()
+    database.close()
+    telemetry.stop()
+    service_ip = get_service_ip()
+    service_id = f"{SERVICE_NAME}-{service_ip}-{SERVICE_PORT}"
+
+    try:
+        consul_client.agent.service.deregister(service_id)
+        logging.info("Successfully unregistered from Consul")
+    except Exception as e:
+        logging.error(f"Failed to unregister from Consul: {str(e)}")
+
 
 @app.get("/schedule", response_model=List[ScheduleItem])
-def get_schedule():
-    return schedule_items
+def get_schedule(
+    request: Request,
+    response: Response,
+    start: Optional[datetime] = Query(None, alias="from"),
+    end: Optional[datetime] = Query(None, alias="to"),
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+):
+    not_modified = schedule_etag(request, response)
+    if not_modified:
+        return not_modified
+    return schedule_items.range(start, end, limit)
+
+@app.get("/schedule/upcoming", response_model=List[ScheduleItem])
+def get_upcoming(limit: int = Query(10, ge=1, le=MAX_PAGE_SIZE), after: Optional[datetime] = None):
+    return schedule_items.upcoming(after or datetime.utcnow(), limit)
+
+@app.get("/schedule/by-task/{task_id}", response_model=List[ScheduleItem])
+def get_schedule_for_task(task_id: int, request: Request, response: Response):
+    not_modified = schedule_etag(request, response)
+    if not_modified:
+        return not_modified
+    return schedule_items.by_task(task_id)
+
+@app.get("/schedule/fired")
+def get_fired(limit: int = Query(100, ge=1, le=MAX_PAGE_SIZE)):
+    messages = []
+    while len(messages) < limit:
+        try:
+            messages.append(fired_events.get_nowait())
+        except queue.Empty:
+            break
+    return messages
+
+@app.get("/schedule/dispatcher/stats")
+def dispatcher_stats():
+    return {**dispatcher.stats(), "queued_messages": fired_events.qsize(), "webhook": bool(WEBHOOK_URL)}
 
 @app.post("/schedule", response_model=ScheduleItem)
 def add_schedule_item(item: ScheduleItem):
-    schedule_items.append(item)
+    try:
+        schedule_items.add(item)
+    except KeyError:
+        raise HTTPException(status_code=409, detail="Schedule item already exists")
+    try:
+        database.insert(item)
+    except Exception:
+        schedule_items.remove(item.id)
+        raise
+    dispatcher.schedule(item)
     return item
 
 @app.delete("/schedule/{item_id}")
 def delete_schedule_item(item_id: int):
-    global schedule_items
-    schedule_items = [item for item in schedule_items if item.id != item_id]
+    schedule_items.remove(item_id)
+    dispatcher.cancel(item_id)
+    database.delete(item_id)
     return {"message": "Schedule item deleted"}
+
+
+@app.get("/metrics", include_in_schema=False)
+def prometheus_metrics():
+    return Response(telemetry.render(), media_type="text/plain; version=0.0.4")
+
+
+@app.get("/health")
+def health_check():
+    return {"status": "UP"}
@@ -0,0 +1,71 @@
+import threading
+from datetime import datetime, timezone
+
+from sortedcontainers import SortedList
+
+
+def sort_key(value: datetime) -> datetime:
+    """Naive UTC datetime used for ordering, so aware and naive inputs compare."""
+    if value.tzinfo is not None:
+        return value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+class ScheduleStore:
+    """Schedule items by id, ordered by datetime and grouped by related task.
+
+    `_index` is a SortedList of (datetime, id) pairs, so inserts and
+    deletes are logarithmic rather than shifting a flat list, and range
+    queries slice between two bisected bounds, costing only as much as the
+    items they return.
+    `version` is bumped on every change and is used as the ETag.
+    """
+
+    def __init__(self):
+        self._items = {}
+        self._index: SortedList = SortedList()
+        self._by_task: dict[int, set[int]] = {}
+        self._lock = threading.Lock()
+        self.version = 0
+
+    def __len__(self):
+        return len(self._items)
+
+    def add(self, item):
+        with self._lock:
+            if item.id in self._items:
+                raise KeyError(item.id)
+            self._items[item.id] = item
+            self._index.add((sort_key(item.datetime), item.id))
+            self._by_task.setdefault(item.related_task_id, set()).add(item.id)
+            self.version += 1
+
+    def remove(self, item_id: int):
+        with self._lock:
+            item = self._items.pop(item_id, None)
+            if item is None:
+                return None
+            self._index.remove((sort_key(item.datetime), item_id))
+            ids = self._by_task[item.related_task_id]
+            ids.discard(item_id)
+            if not ids:
+                del self._by_task[item.related_task_id]
+            self.version += 1
+            return item
+
+    def range(self, start: datetime | None = None, end: datetime | None = None, limit: int | None = None):
+        """Items with start <= datetime < end, in datetime order."""
+        with self._lock:
+            lo = 0 if start is None else self._index.bisect_left((sort_key(start),))
+            hi = len(self._index) if end is None else self._index.bisect_left((sort_key(end),))
+            if limit is not None:
+                hi = min(hi, lo + limit)
+            return [self._items[item_id] for _, item_id in self._index.islice(lo, hi)]
+
+    def upcoming(self, after: datetime, limit: int):
+        return self.range(start=after, limit=limit)
+
+    def by_task(self, task_id: int):
+        with self._lock:
+            items = [self._items[item_id] for item_id in self._by_task.get(task_id, ())]
+        return sorted(items, key=lambda item: (sort_key(item.datetime), item.id))
@@ -0,0 +1,50 @@
+import os
+from datetime import datetime, timedelta
+
+from sqlalchemy import Column, DateTime, Index, String, delete, select
+
+from db import Base
+
+
+class ProcessedEventORM(Base):
+    __tablename__ = "processed_events"
+
+    event_id = Column(String, primary_key=True)
+    processed_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+
+    __table_args__ = (
+        Index("ix_processed_events_processed_at", "processed_at"),
+    )
+
+
+PROCESSED_RETENTION = timedelta(seconds=float(os.getenv("PROCESSED_EVENTS_RETENTION_SECONDS", 86400)))
+
+
+async def claim_events(db, events: list[dict]) -> list[dict]:
+    """Drop events this service has already applied and record the rest as processed.
+
+    The processed markers are added to the caller's transaction, so an event
+    counts as handled only if the changes it caused are committed with it.
+    """
+    ids = [e["event_id"] for e in events]
+    if not ids:
+        return []
+    result = await db.execute(select(ProcessedEventORM.event_id).where(ProcessedEventORM.event_id.in_(ids)))
+    seen = set(result.scalars().all())
+    fresh = []
+    for event in events:
+        if event["event_id"] in seen:
+            continue
+        seen.add(event["event_id"])
+        db.add(ProcessedEventORM(event_id=event["event_id"]))
+        fresh.append(event)
+    return fresh
+
+
+async def forget_processed_events(db, retention: timedelta = PROCESSED_RETENTION):
+    """Drop processed markers older than `retention`; producers stop redelivering well before that."""
+    await db.execute(
+        delete(ProcessedEventORM)
+        .where(ProcessedEventORM.processed_at < datetime.utcnow() - retention)
+        .execution_options(synchronize_session=False)
+    )
@@ -0,0 +1,118 @@
+import asyncio
+import logging
+import os
+import threading
+import time
+
+import httpx
+
+
+class ProjectCache:
+    """Project IDs recently confirmed to exist by project-service.
+
+    Only positive answers are cached. Every replica follows project-service's
+    change feed and drops a project as soon as its deletion shows up there, so
+    a delete handled by one replica reaches all of them. The cache is only
+    consulted while that feed is being followed live; until the follower has
+    caught up, or after it loses the feed, every lookup goes to project-service.
+    Entries also expire after `ttl` seconds as a backstop.
+    """
+
+    def __init__(self, balancer, telemetry, ttl: float | None = None, wait: float | None = None,
+                 retry_delay: float | None = None):
+        self._balancer = balancer
+        self._telemetry = telemetry
+        self._ttl = ttl if ttl is not None else float(os.getenv("PROJECT_CACHE_TTL", 60))
+        self._wait = wait if wait is not None else float(os.getenv("PROJECT_FEED_WAIT_SECONDS", 20))
+        self._retry_delay = retry_delay if retry_delay is not None else float(os.getenv("PROJECT_FEED_RETRY_DELAY", 5))
+        self._known: dict[int, float] = {}
+        self._lock = threading.Lock()
+        # Bumped on every drop, so an answer fetched before a delete is not cached after it.
+        self.generation = 0
+        self._cursor = None
+        self._task = None
+        self._client = None
+        self.live = False
+
+    def missing(self, project_ids) -> set[int]:
+        if not self.live:
+            return set(project_ids)
+        now = time.monotonic()
+        return {pid for pid in project_ids if self._known.get(pid, 0.0) <= now}
+
+    def add(self, project_ids, generation: int):
+        expires = time.monotonic() + self._ttl
+        with self._lock:
+            if generation != self.generation:
+                return
+            for pid in project_ids:
+                self._known[pid] = expires
+
+    def invalidate(self, project_id: int):
+        with self._lock:
+            self.generation += 1
+            self._known.pop(project_id, None)
+
+    def clear(self):
+        with self._lock:
+            self.generation += 1
+            self._known.clear()
+
+    def start(self):
+        self._client = httpx.AsyncClient(timeout=httpx.Timeout(self._wait + 10.0, connect=2.0))
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+        self.live = False
+
+    async def _run(self):
+        while True:
+            try:
+                page = await self._fetch(self._wait if self.live else 0)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                if self.live:
+                    # Deletes may be missed while the feed is down, so stop trusting the cache.
+                    self.live = False
+                    self.clear()
+                logging.error(f"Failed to read the project-service change feed: {e}")
+                await asyncio.sleep(self._retry_delay)
+                continue
+            self.apply(page)
+
+    def apply(self, page: dict):
+        for change in page["changes"]:
+            if change["op"] == "delete":
+                self.invalidate(change["id"])
+        self._cursor = page["cursor"]
+        if not page["has_more"]:
+            self.live = True
+
+    async def _fetch(self, wait: float) -> dict:
+        params = {"limit": 500, "wait": wait}
+        if self._cursor:
+            params["after"] = self._cursor
+        with self._balancer.lease("project-service") as lease:
+            if lease is None:
+                raise RuntimeError("Service 'project-service' unavailable")
+            with self._telemetry.outbound("project-service", "GET") as call:
+                try:
+                    response = await self._client.get(f"{lease.url}/changes", params=params, headers=call.headers)
+                except httpx.TransportError:
+                    lease.failed = True
+                    raise
+                call.status = response.status_code
+            lease.record(response.status_code)
+        response.raise_for_status()
+        return response.json()
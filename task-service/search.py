@@ -0,0 +1,72 @@
+import re
+
+from sqlalchemy import Index, and_, case, func, or_, select, text
+# Registers to_tsvector() and friends, which the dialect refuses to compile otherwise.
+from sqlalchemy.dialects import postgresql  # noqa: F401
+
+TOKEN = re.compile(r"\w+")
+# Postgres' default weights for A-D, reused by the LIKE fallback.
+WEIGHTS = {"A": 1.0, "B": 0.4, "C": 0.2, "D": 0.1}
+# 'simple' keeps words as typed (lowercased), which is what prefix matching wants.
+TEXT_CONFIG = text("'simple'::regconfig")
+
+
+def query_terms(query: str, max_terms: int = 8) -> list[str]:
+    return [term.lower() for term in TOKEN.findall(query)][:max_terms]
+
+
+class TextSearch:
+    """Ranked prefix search over some text columns of one table.
+
+    On Postgres the columns form a weighted tsvector with a GIN expression
+    index, so the index follows every write with no extra code, and hits
+    are ranked with ts_rank_cd. Other databases (SQLite in development)
+    fall back to substring matches ranked by the weights of the columns
+    that matched. Every query term must match, as a word prefix on
+    Postgres. Scores are squashed into 0..1 as rank / (rank + 1), so
+    results from different services can be merged by score.
+    """
+
+    def __init__(self, kind: str, model, weights: dict, columns, postgres: bool):
+        self._kind = kind
+        self._model = model
+        self._weights = weights
+        self._columns = columns
+        self._postgres = postgres
+        self._vector = None
+        # Constants are inlined so queries repeat the index expression exactly, prepared or not.
+        for name, weight in weights.items():
+            value = func.coalesce(model.__table__.c[name], text("''"))
+            part = func.setweight(func.to_tsvector(TEXT_CONFIG, value), text(f"'{weight}'"))
+            self._vector = part if self._vector is None else self._vector.op("||")(part)
+        Index(f"ix_{model.__tablename__}_search", self._vector, postgresql_using="gin").ddl_if(dialect="postgresql")
+
+    def _postgres_query(self, terms):
+        tsquery = func.to_tsquery(TEXT_CONFIG, " & ".join(f"{term}:*" for term in terms))
+        rank = func.ts_rank_cd(self._vector, tsquery, 32)
+        return select(*self._columns, rank.label("score")).where(self._vector.op("@@")(tsquery)), rank
+
+    def _fallback_query(self, terms):
+        columns = {name: getattr(self._model, name) for name in self._weights}
+        rank = sum(
+            case((column.icontains(term, autoescape=True), WEIGHTS[self._weights[name]]), else_=0.0)
+            for term in terms
+            for name, column in columns.items()
+        )
+        matches = and_(*(or_(*(c.icontains(term, autoescape=True) for c in columns.values())) for term in terms))
+        return select(*self._columns, rank.label("score")).where(matches), rank
+
+    async def search(self, db, query: str, limit: int, offset: int = 0) -> list[dict]:
+        terms = query_terms(query)
+        if not terms:
+            return []
+        build = self._postgres_query if self._postgres else self._fallback_query
+        statement, rank = build(terms)
+        statement = statement.order_by(rank.desc(), self._model.id).limit(limit).offset(offset)
+        rows = (await db.execute(statement)).all()
+        hits = []
+        for row in rows:
+            score = float(row.score) if self._postgres else row.score / (row.score + 1)
+            data = {c.key: row._mapping[c.key] for c in self._columns}
+            hits.append({"type": self._kind, "id": row.id, "score": round(score, 6), "data": data})
+        return hits
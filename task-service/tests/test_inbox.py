@@ -0,0 +1,63 @@
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import select, update
+
+from db import Base, Database
+from inbox import ProcessedEventORM, claim_events, forget_processed_events
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+async def database(database_url):
+    database = Database(database_url)
+    await database.create_all(Base.metadata)
+    yield database
+    await database.dispose()
+
+
+def incoming(*ids):
+    return [{"event_id": i, "type": "Test", "payload": {}} for i in ids]
+
+
+async def test_claim_events_drops_events_already_processed(database):
+    async with database.session() as db:
+        assert [e["event_id"] for e in await claim_events(db, incoming("a", "b"))] == ["a", "b"]
+        await db.commit()
+
+    async with database.session() as db:
+        assert [e["event_id"] for e in await claim_events(db, incoming("b", "c"))] == ["c"]
+        await db.commit()
+
+
+async def test_claim_events_drops_duplicates_within_a_batch(database):
+    async with database.session() as db:
+        assert [e["event_id"] for e in await claim_events(db, incoming("a", "a", "b"))] == ["a", "b"]
+        await db.commit()
+
+
+async def test_claim_events_counts_an_event_only_once_its_transaction_commits(database):
+    async with database.session() as db:
+        await claim_events(db, incoming("a"))
+        await db.rollback()
+
+    async with database.session() as db:
+        assert [e["event_id"] for e in await claim_events(db, incoming("a"))] == ["a"]
+
+
+async def test_forget_processed_events_drops_only_old_markers(database):
+    async with database.session() as db:
+        await claim_events(db, incoming("old", "new"))
+        await db.commit()
+        await db.execute(
+            update(ProcessedEventORM)
+            .where(ProcessedEventORM.event_id == "old")
+            .values(processed_at=datetime.utcnow() - timedelta(days=2))
+        )
+        await db.commit()
+
+        await forget_processed_events(db, timedelta(days=1))
+        await db.commit()
+
+        assert (await db.execute(select(ProcessedEventORM.event_id))).scalars().all() == ["new"]
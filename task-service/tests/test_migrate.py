@@ -0,0 +1,83 @@
+import pytest
+from sqlalchemy import Column, Index, Integer, MetaData, String, Table, create_engine, func, inspect, text
+
+from db import Database
+
+pytestmark = pytest.mark.anyio
+
+metadata = MetaData()
+items = Table(
+    "items",
+    metadata,
+    Column("id", Integer, primary_key=True),
+    Column("name", String),
+    Column("change_seq", Integer, nullable=False, default=0),
+    Index("ix_items_name_id", "name", "id"),
+    Index("ix_items_change_seq_id", "change_seq", "id"),
+)
+Index("ix_items_search", func.lower(items.c.name), postgresql_using="gin").ddl_if(dialect="postgresql")
+Table("notes", metadata, Column("id", Integer, primary_key=True), Index("ix_notes_id_desc", "id"))
+
+ADDED_COLUMNS = [("items", "change_seq", "INTEGER NOT NULL DEFAULT 0")]
+
+
+@pytest.fixture(params=["async", "sync"])
+def database(request, database_url, monkeypatch):
+    monkeypatch.setenv("DB_ASYNC", "1" if request.param == "async" else "0")
+    return Database(database_url)
+
+
+def sync_engine(database_url):
+    return create_engine(database_url)
+
+
+def create_old_schema(database_url):
+    engine = sync_engine(database_url)
+    with engine.begin() as conn:
+        conn.execute(text("CREATE TABLE items (id INTEGER PRIMARY KEY, name VARCHAR)"))
+        conn.execute(text("INSERT INTO items (id, name) VALUES (1, 'old')"))
+    engine.dispose()
+
+
+def schema(database_url):
+    engine = sync_engine(database_url)
+    inspector = inspect(engine)
+    result = {
+        "columns": {c["name"] for c in inspector.get_columns("items")},
+        "indexes": {i["name"] for t in ("items", "notes") for i in inspector.get_indexes(t)},
+    }
+    with engine.connect() as conn:
+        result["rows"] = conn.execute(text("SELECT id, change_seq FROM items")).all()
+    engine.dispose()
+    return result
+
+
+async def test_migrate_adds_columns_and_indexes_to_an_existing_table(database, database_url):
+    create_old_schema(database_url)
+
+    await database.migrate(metadata, ADDED_COLUMNS)
+    await database.dispose()
+
+    found = schema(database_url)
+    assert "change_seq" in found["columns"]
+    assert found["rows"] == [(1, 0)]
+    assert found["indexes"] == {"ix_items_name_id", "ix_items_change_seq_id", "ix_notes_id_desc"}
+
+
+async def test_migrate_creates_a_fresh_schema(database, database_url):
+    await database.migrate(metadata, ADDED_COLUMNS)
+    await database.dispose()
+
+    found = schema(database_url)
+    assert "change_seq" in found["columns"]
+    assert found["indexes"] == {"ix_items_name_id", "ix_items_change_seq_id", "ix_notes_id_desc"}
+
+
+async def test_migrate_is_idempotent(database, database_url):
+    create_old_schema(database_url)
+
+    await database.migrate(metadata, ADDED_COLUMNS)
+    await database.migrate(metadata, ADDED_COLUMNS)
+    await database.dispose()
+
+    assert schema(database_url)["rows"] == [(1, 0)]
@@ -0,0 +1,51 @@
+from project_cache import ProjectCache
+
+
+def cache():
+    return ProjectCache(balancer=None, telemetry=None, ttl=60)
+
+
+def page(*changes, has_more=False):
+    return {"changes": list(changes), "cursor": "c", "has_more": has_more}
+
+
+def test_nothing_is_trusted_until_the_feed_has_caught_up():
+    projects = cache()
+    projects.add({1}, projects.generation)
+
+    assert projects.missing({1}) == {1}
+
+    projects.apply(page({"seq": 1, "op": "upsert", "id": 1, "data": {}}, has_more=True))
+    assert projects.missing({1}) == {1}
+
+    projects.apply(page())
+    assert projects.missing({1, 2}) == {2}
+
+
+def test_deletion_on_the_feed_drops_the_project():
+    projects = cache()
+    projects.apply(page())
+    projects.add({1, 2}, projects.generation)
+
+    projects.apply(page({"seq": 5, "op": "delete", "id": 1}))
+
+    assert projects.missing({1, 2}) == {1}
+
+
+def test_answer_fetched_before_a_deletion_is_not_cached():
+    projects = cache()
+    projects.apply(page())
+    generation = projects.generation
+
+    projects.invalidate(1)
+    projects.add({1}, generation)
+
+    assert projects.missing({1}) == {1}
+
+
+def test_entries_expire_after_the_ttl():
+    projects = ProjectCache(balancer=None, telemetry=None, ttl=0)
+    projects.apply(page())
+    projects.add({1}, projects.generation)
+
+    assert projects.missing({1}) == {1}
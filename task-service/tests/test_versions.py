@@ -0,0 +1,80 @@
+import pytest
+
+from db import Base, Database
+from versions import CollectionVersions
+
+pytestmark = pytest.mark.anyio
+
+
+class ScriptedSession:
+    """Answers version reads from a list, running `during_read` while a read is in flight."""
+
+    def __init__(self, *versions):
+        self.versions = list(versions)
+        self.reads = 0
+        self.during_read = None
+
+    async def scalar(self, statement):
+        self.reads += 1
+        if self.during_read is not None:
+            self.during_read()
+            self.during_read = None
+        return self.versions.pop(0)
+
+
+async def test_get_serves_the_cached_version_until_it_expires():
+    versions = CollectionVersions(ttl=60)
+    db = ScriptedSession(1, 2)
+
+    assert await versions.get(db, "tasks") == 1
+    assert await versions.get(db, "tasks") == 1
+    assert db.reads == 1
+
+
+async def test_forget_drops_the_cached_version():
+    versions = CollectionVersions(ttl=60)
+    db = ScriptedSession(1, 2)
+
+    await versions.get(db, "tasks")
+    versions.forget("tasks")
+
+    assert await versions.get(db, "tasks") == 2
+
+
+async def test_version_read_during_forget_is_not_cached():
+    versions = CollectionVersions(ttl=60)
+    # The read sees version 1, then a commit of version 2 is forgotten before the read returns.
+    db = ScriptedSession(1, 2, 2)
+    db.during_read = lambda: versions.forget("tasks")
+
+    assert await versions.get(db, "tasks") == 1
+    assert await versions.get(db, "tasks") == 2
+    assert await versions.get(db, "tasks") == 2
+    assert db.reads == 2
+
+
+async def test_forget_only_affects_its_own_collection():
+    versions = CollectionVersions(ttl=60)
+    db = ScriptedSession(1, 7)
+
+    await versions.get(db, "tasks")
+    await versions.get(db, "projects")
+    versions.forget("projects")
+
+    assert await versions.get(db, "tasks") == 1
+    assert db.reads == 2
+
+
+async def test_commit_of_a_bump_invalidates_the_cache(database_url):
+    database = Database(database_url)
+    await database.create_all(Base.metadata)
+    versions = CollectionVersions(ttl=60)
+    async with database.session() as db:
+        await versions.ensure(db, ["tasks"])
+        assert await versions.get(db, "tasks") == 0
+
+        await versions.bump(db, "tasks")
+        await db.commit()
+
+        assert await versions.get(db, "tasks") == 1
+    await database.dispose()